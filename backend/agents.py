@@ -10,19 +10,29 @@ Defines specialized agents for:
 import os
 import json
 import logging
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 from crewai import Agent, Task, Crew, Process
 from crewai.tools import BaseTool
-from data_tools import get_all_tools, QueryAdsCampaignsTool, CalculateMetricsTool
-from intent_classifier import classify_intent
+from data_tools import (
+    get_all_tools, CampaignQuery, query_ads_campaigns, calculate_metrics,
+    calculate_group_metrics, compare_periods, resolve_comparison_periods, parse_date_range,
+)
+from intent_classifier import classify_intent, classify_local
 import os
 import json
+import asyncio
 import logging
-from typing import Optional
+from typing import Awaitable, Callable, Optional
+import numpy as np
 from crewai import Agent, Task, Crew, Process
 from crewai.tools import BaseTool
-from data_tools import get_all_tools, QueryAdsCampaignsTool, CalculateMetricsTool
-from intent_classifier import classify_intent
+from data_tools import (
+    get_all_tools, CampaignQuery, query_ads_campaigns, calculate_metrics,
+    calculate_group_metrics, compare_periods, resolve_comparison_periods, parse_date_range,
+)
+from intent_classifier import classify_intent, classify_local
+from downsampling import CHART_DOWNSAMPLE, downsample_rows
+from json_stream import JSONArrayStream
 from google import genai
 from dotenv import load_dotenv
 
@@ -112,25 +122,51 @@ def create_narrative_agent() -> Agent:
 
 
 
-async def execute_data_analysis_crew(query: str, entities: dict) -> dict:
-    """Execute the data analysis crew for data visualization requests."""
-    
-    logger.info(f"📊 EXECUTING DATA ANALYSIS for: '{query}'")
-    logger.debug(f"   Entities: {entities}")
+def _metric_from_query(query: str) -> str:
+    """Metric the user asks about, defaulting to cost."""
+    query_lower = query.lower()
+    if "doanh thu" in query_lower or "revenue" in query_lower: return "revenue"
+    elif "click" in query_lower: return "clicks"
+    elif "cpc" in query_lower: return "cpc"
+    elif "roas" in query_lower: return "roas"
+    return "cost"
+
+
+# Progress callback of a streamed answer: awaited with each event (see run_agent_workflow)
+Emit = Callable[[dict], Awaitable[None]]
+
+
+async def _generate_narrative(prompt: str, emit: Optional[Emit] = None, section: Optional[int] = 0) -> str:
+    """Narrative text from Gemini, streamed to `emit` as token events of section `section`.
     
-    # Step 1: Query the data
-    query_tool = QueryAdsCampaignsTool()
-    calc_tool = CalculateMetricsTool()
+    `section` is None for a plain text answer.
+    """
+    if emit is None:
+        response = await client.aio.models.generate_content(
+            model="gemini-3-flash-preview",
+            contents=prompt
+        )
+        return response.text.strip()
     
-    time_range = entities.get("time_range") or "last 30 days"
+    parts = []
+    response = await client.aio.models.generate_content_stream(
+        model="gemini-3-flash-preview",
+        contents=prompt
+    )
+    async for chunk in response:
+        if chunk.text:
+            parts.append(chunk.text)
+            await emit({"event": "token", "section": section, "text": chunk.text})
+    return "".join(parts).strip()
+
+
+def _analysis_query(query: str, entities: dict) -> CampaignQuery:
+    """The data query behind a data_analysis answer."""
     breakdown = entities.get("breakdown")
-    visual_type = entities.get("visual_type") # Explicit user request: line, bar, etc.
-    
-    logger.info(f"📅 Time range: {time_range} | Breakdown: {breakdown} | Visual: {visual_type}")
     
     # Get campaign data
     query_params = {
-        "date_range": time_range,
+        "date_range": entities.get("time_range") or "last 30 days",
         "group_by": entities.get("group_by", "day")
     }
     
@@ -144,46 +180,123 @@ async def execute_data_analysis_crew(query: str, entities: dict) -> dict:
     if entities.get("keywords"):
         query_params["keywords"] = entities["keywords"]
     
-    data_result = query_tool._run(json.dumps(query_params))
-    data_parsed = json.loads(data_result)
+    # Optional top-N ranking ("top 20 chiến dịch theo ROAS")
+    for key in ["sort_by", "sort_order", "limit"]:
+        if entities.get(key):
+            query_params[key] = entities[key]
+    
+    # Exploratory questions over long histories only need the trend shape
+    if entities.get("approximate"):
+        query_params["approximate"] = True
+    
+    return CampaignQuery.from_params(query_params)
+
+
+def _resolved_key(data_query: CampaignQuery) -> tuple:
+    return data_query.cache_key(*parse_date_range(data_query.date_range))
+
+
+def _start_speculative_query(query: str, conversation_history: str) -> Optional[tuple]:
+    """Start the data query a local guess says this turn needs, before the intent is known.
     
-    is_granular = data_parsed.get("is_granular", False)
-    logger.debug(f"   Data points retrieved: {len(data_parsed['data'])} | Granular: {is_granular}")
+    Returns (query, task), or None if the local guess is not data_analysis.
+    """
+    guess = classify_local(query, has_history=bool(conversation_history))
+    if guess["intent"] != "data_analysis":
+        return None
+    data_query = _analysis_query(query, guess["entities"])
+    logger.debug(f"   Speculative data query: {data_query}")
+    return data_query, asyncio.create_task(asyncio.to_thread(query_ads_campaigns, data_query))
+
+
+def _discard(task: asyncio.Task):
+    """Cancel a speculative query nobody will await (its thread finishes into the query cache)."""
+    task.cancel()
+    if task.done() and not task.cancelled():
+        task.exception()  # Retrieved, so a failed speculation is not reported as unhandled
+
+
+async def _query_data(data_query: CampaignQuery, speculative: Optional[tuple] = None):
+    """Run a data query, reusing the speculative one when it resolved to the same query."""
+    if speculative is not None:
+        speculative_query, task = speculative
+        if _resolved_key(speculative_query) == _resolved_key(data_query):
+            logger.info("⚡ Reusing speculative data query")
+            return await task
+        logger.debug("   Speculative data query does not match, discarding it")
+        _discard(task)
+    # Large scans run on worker threads so the event loop keeps serving other chats
+    return await asyncio.to_thread(query_ads_campaigns, data_query)
+
+
+async def execute_data_analysis_crew(query: str, entities: dict, speculative: Optional[tuple] = None,
+                                    emit: Optional[Emit] = None) -> dict:
+    """Execute the data analysis crew for data visualization requests.
+    
+    `speculative` is a (query, task) pair from `_start_speculative_query`,
+    used instead of querying again when the entities resolve to the same query.
+    With `emit`, the chart is sent as soon as the data is ready and the
+    narrative streams in after it.
+    """
     
-    # Calculate metrics
-    metrics_result = calc_tool._run(json.dumps({
-        "data": data_parsed["data"],
-        "metrics": ["cpc", "roas", "ctr"]
-    }))
-    metrics_parsed = json.loads(metrics_result)
+    logger.info(f"📊 EXECUTING DATA ANALYSIS for: '{query}'")
+    logger.debug(f"   Entities: {entities}")
+    
+    # Step 1: Query the data (typed API, no JSON round-trip through the tools)
+    time_range = entities.get("time_range") or "last 30 days"
+    breakdown = entities.get("breakdown")
+    visual_type = entities.get("visual_type") # Explicit user request: line, bar, etc.
+    
+    logger.info(f"📅 Time range: {time_range} | Breakdown: {breakdown} | Visual: {visual_type}")
+    
+    data_query = _analysis_query(query, entities)
+    data_result = await _query_data(data_query, speculative)
+    
+    is_granular = data_result.is_granular
+    logger.debug(f"   Data points retrieved: {len(data_result.data)} | Granular: {is_granular}")
+    
+    # Calculate metrics straight from the columnar group totals
+    metrics_result = calculate_metrics(data_result.groups.totals, ["cpc", "roas", "ctr"])
+    
+    entity_lines = ""
+    if is_granular:
+        # Per-entity KPIs for the narrative in one vectorized pass; the 10 biggest spenders
+        per_entity = calculate_group_metrics(
+            data_result.groups.totals, [r["entity"] for r in data_result.data], ["roas", "ctr"]
+        )
+        costs = per_entity.totals["cost"]
+        entity_lines = f"\nTheo {breakdown} (top chi phí):\n" + "".join(
+            f"- {per_entity.groups[i]}: Cost {costs[i]:,.0f} | ROAS {per_entity.metrics['roas'][i]:.2f} | CTR {per_entity.metrics['ctr'][i]:.2f}%\n"
+            for i in np.argsort(-costs, kind="stable")[:10]
+        )
+    
+    # Step 2: Narrative prompt (generated once the chart is ready)
+    approximation = data_result.approximation
+    approximate_note = ""
+    if approximation and approximation["method"] != "exact":
+        cost_error = approximation["errorBounds"]["cost"]["relative"] or 0
+        approximate_note = f"(Số liệu ước tính từ mẫu {approximation['sampleRate']:.1%} dữ liệu, sai số chi phí khoảng ±{cost_error:.1%} - hãy nói rõ đây là ước tính.)\n"
     
-    # Step 2: Generate narrative
     narrative_prompt = f"""Bạn là một chuyên gia phân tích quảng cáo.
 Người dùng đang hỏi: "{query}"
 
 Dữ liệu tổng hợp ({time_range}):
-- Clicks: {data_parsed['summary']['totalClicks']:,}
-- Cost: {data_parsed['summary']['totalCost']:,.0f}
-- Revenue: {data_parsed['summary']['totalRevenue']:,.0f}
-- CPC: {metrics_parsed['metrics'].get('cpc', 0):,.0f}
-- ROAS: {metrics_parsed['metrics'].get('roas', 0):.2f}
-- CTR: {metrics_parsed['metrics'].get('ctr', 0):.2f}%
-
+- Clicks: {data_result.summary['totalClicks']:,}
+- Cost: {data_result.summary['totalCost']:,.0f}
+- Revenue: {data_result.summary['totalRevenue']:,.0f}
+- CPC: {metrics_result.metrics.get('cpc', 0):,.0f}
+- ROAS: {metrics_result.metrics.get('roas', 0):.2f}
+- CTR: {metrics_result.metrics.get('ctr', 0):.2f}%
+{entity_lines}{approximate_note}
 Yêu cầu logic:
 1. Đọc kỹ câu hỏi người dùng để biết họ quan tâm chỉ số nào.
 2. Viết nhận định tập trung vào câu hỏi đó. 
 3. Nếu là so sánh (breakdown), hãy nhận xét xu hướng của các entities.
 4. Ngắn gọn (2-3 câu). Tiếng Việt.
 """
-
-    narrative_response = await client.aio.models.generate_content(
-        model="gemini-3-flash-preview",
-        contents=narrative_prompt
-    )
-    narrative = narrative_response.text.strip()
     
     # Step 3: Prepare Visualization Data
-    chart_data = data_parsed["data"]
+    chart_data = data_result.data
     series = []
     chart_title = "Hiệu suất quảng cáo"
     chart_type = visual_type if visual_type in ["line", "bar", "area"] else "area" # Use user pref or default
@@ -199,16 +312,12 @@ Yêu cầu logic:
         entities_found = set()
         
         # Determine metric to plot
-        metric_key = "cost" # Default
-        if "doanh thu" in query.lower() or "revenue" in query.lower(): metric_key = "revenue"
-        elif "click" in query.lower(): metric_key = "clicks"
-        elif "cpc" in query.lower(): metric_key = "cpc"
-        elif "roas" in query.lower(): metric_key = "roas"
+        metric_key = _metric_from_query(query)
         
         chart_title = f"{metric_key.upper()} theo {breakdown} ({time_range})"
         if not visual_type: chart_type = "line" # Default to line for comparison over time
         
-        for record in data_parsed["data"]:
+        for record in data_result.data:
             d_key = record["date"]
             ent = record["entity"]
             entities_found.add(ent)
@@ -261,7 +370,53 @@ Yêu cầu logic:
             ]
              if not visual_type: chart_type = "area"
 
-    logger.info(f"📈 CHART: {chart_type} | SERIES: {len(series)} | DATA: {len(chart_data)}")
+    # Cap points per series for time-series charts; drill-down keeps full resolution
+    total_points = len(chart_data)
+    is_time_series = is_granular or data_query.group_by not in ["account", "campaign"]
+    if is_time_series and not entities.get("full_resolution"):
+        chart_data = downsample_rows(chart_data, x_axis_key, [s["dataKey"] for s in series])
+    
+    chart_content = {
+        "chartType": chart_type,
+        "title": f"{chart_title}",
+        "data": chart_data,
+        "config": {
+            "xAxis": x_axis_key,
+            "series": series
+        }
+    }
+    followup_suggestions = [
+        "So sánh với tháng trước",
+        "Phân tích theo chiến dịch", 
+        "Chi tiết hơn về dữ liệu này"
+    ]
+    if len(chart_data) < total_points:
+        chart_content["resolution"] = {
+            "points": len(chart_data),
+            "totalPoints": total_points,
+            "method": CHART_DOWNSAMPLE
+        }
+        followup_suggestions.append("Xem đầy đủ từng điểm dữ liệu")
+    
+    logger.info(f"📈 CHART: {chart_type} | SERIES: {len(series)} | DATA: {len(chart_data)}/{total_points}")
+    
+    # Step 4: Generate narrative (the chart is on screen meanwhile when streaming)
+    if emit:
+        await emit({"event": "section", "index": 1, "section": {"type": "chart", "content": chart_content}})
+    narrative = await _generate_narrative(narrative_prompt, emit, section=0)
+    
+    context = {
+        "filters": {
+            "timeRange": time_range,
+            "dateRange": data_result.date_range, # Pass structured start/end dates
+            "program": entities.get("program"),
+            "keywords": entities.get("keywords")
+        },
+        "followupSuggestions": followup_suggestions
+    }
+    if approximation:
+        # Mark estimated answers (method, sample rate, error bounds, sketches)
+        context["approximate"] = approximation
     
     return {
         "type": "composite",
@@ -273,38 +428,136 @@ Yêu cầu logic:
                 },
                 {
                     "type": "chart",
-                    "content": {
-                        "chartType": chart_type,
-                        "title": f"{chart_title}",
-                        "data": chart_data,
-                        "config": {
-                            "xAxis": x_axis_key,
-                            "series": series
-                        }
-                    }
+                    "content": chart_content
+                }
+            ],
+            "summary": metrics_result.to_dict()
+        },
+        "context": context
+    }
+
+
+
+async def execute_comparison_crew(query: str, entities: dict, emit: Optional[Emit] = None) -> dict:
+    """Execute a period-over-period comparison in one data pass.
+    
+    With `emit`, the chart and insight cards are sent before the narrative streams in.
+    """
+    
+    logger.info(f"⚖️ EXECUTING COMPARISON for: '{query}'")
+    
+    current, previous = resolve_comparison_periods(
+        query, entities.get("time_range"), entities.get("compare_time_range")
+    )
+    group_by = entities.get("group_by")
+    comparison = await asyncio.to_thread(
+        compare_periods,
+        CampaignQuery.from_params({
+            "program": entities.get("program"),
+            "keywords": entities.get("keywords") or [],
+        }),
+        current,
+        previous,
+        time_grain=group_by if group_by in ["day", "week", "month"] else None,
+    )
+    logger.info(f"📅 Current: {current} | Previous: {previous} | Buckets: {len(comparison.data)} per {comparison.time_grain}")
+    
+    metric_key = _metric_from_query(query)
+    summary = comparison.summary
+    
+    def describe(name):
+        change = summary[name]
+        pct = f"{change['deltaPct']:+.2f}%" if change["deltaPct"] is not None else "n/a"
+        return f"{change['current']:,} (kỳ trước {change['previous']:,}, thay đổi {change['delta']:+,}, {pct})"
+    
+    narrative_prompt = f"""Bạn là một chuyên gia phân tích quảng cáo.
+Người dùng đang hỏi: "{query}"
+
+So sánh kỳ hiện tại ({current[0]} → {current[1]}) với kỳ trước ({previous[0]} → {previous[1]}):
+- Clicks: {describe('clicks')}
+- Cost: {describe('cost')}
+- Revenue: {describe('revenue')}
+- CPC: {describe('cpc')}
+- ROAS: {describe('roas')}
+- CTR: {describe('ctr')}
+
+Yêu cầu logic:
+1. Tập trung vào chỉ số người dùng hỏi (mặc định: {metric_key}).
+2. Nêu rõ mức tăng/giảm tuyệt đối và phần trăm, và điểm khác biệt nổi bật.
+3. Ngắn gọn (2-3 câu). Tiếng Việt.
+"""
+    
+    visual_type = entities.get("visual_type")
+    sections = [
+        {
+            "type": "chart",
+            "content": {
+                "chartType": visual_type if visual_type in ["line", "bar", "area"] else "line",
+                "title": f"{metric_key.upper()}: {current[0]} → {current[1]} so với {previous[0]} → {previous[1]}",
+                "data": comparison.data,
+                "config": {
+                    "xAxis": "date",
+                    "series": [
+                        {"dataKey": metric_key, "name": "Kỳ này", "color": "#3b82f6"},
+                        {"dataKey": f"{metric_key}Previous", "name": "Kỳ trước", "color": "#94a3b8"}
+                    ]
+                }
+            }
+        },
+        {
+            "type": "insight",
+            "content": {
+                "metrics": {
+                    "totalCost": summary["cost"]["current"],
+                    "roas": summary["roas"]["current"],
+                    "cpc": summary["cpc"]["current"],
+                    "ctr": summary["ctr"]["current"]
+                },
+                "deltas": {
+                    "totalCost": summary["cost"]["deltaPct"],
+                    "roas": summary["roas"]["deltaPct"],
+                    "cpc": summary["cpc"]["deltaPct"],
+                    "ctr": summary["ctr"]["deltaPct"]
                 }
+            }
+        }
+    ]
+    if emit:
+        for index, section in enumerate(sections, start=1):
+            await emit({"event": "section", "index": index, "section": section})
+    narrative = await _generate_narrative(narrative_prompt, emit, section=0)
+    
+    return {
+        "type": "composite",
+        "content": {
+            "sections": [
+                {
+                    "type": "narrative",
+                    "content": narrative
+                },
+                *sections
             ],
-            "summary": metrics_parsed
+            "summary": comparison.to_dict()["summary"]
         },
         "context": {
             "filters": {
-                "timeRange": time_range,
-                "dateRange": data_parsed.get("dateRange"), # Pass structured start/end dates
+                "timeRange": entities.get("time_range"),
+                "dateRange": {"start": current[0], "end": current[1]},
+                "compareDateRange": {"start": previous[0], "end": previous[1]},
                 "program": entities.get("program"),
                 "keywords": entities.get("keywords")
             },
             "followupSuggestions": [
-                "So sánh với tháng trước",
-                "Phân tích theo chiến dịch", 
+                "Phân tích theo chiến dịch",
+                "Chiến dịch nào thay đổi nhiều nhất?",
                 "Chi tiết hơn về dữ liệu này"
             ]
         }
     }
 
 
-
-async def execute_explanation_crew(query: str, conversation_history: str = "") -> dict:
-    """Execute explanation response for conceptual questions."""
+async def execute_explanation_crew(query: str, conversation_history: str = "", emit: Optional[Emit] = None) -> dict:
+    """Execute explanation response for conceptual questions (streamed to `emit` as text tokens)."""
     
     prompt = f"""Bạn là một chuyên gia affiliate marketing thân thiện.
 
@@ -319,29 +572,22 @@ Yêu cầu:
 - Dùng ví dụ thực tế khi cần
 - Format với markdown khi phù hợp
 - Thân thiện nhưng chuyên nghiệp"""
-
-    response = await client.aio.models.generate_content(
-        model="gemini-3-flash-preview",
-        contents=prompt
-    )
     
     return {
         "type": "text",
-        "content": response.text.strip()
+        "content": await _generate_narrative(prompt, emit, section=None)
     }
 
 
 async def execute_data_query_crew(query: str, entities: dict) -> dict:
     """Execute data query for table/list requests."""
     
-    from data_tools import QueryCampaignListTool, QueryAccountsTool
+    from data_tools import list_campaigns, list_accounts
     
     # Determine what data to query
     query_lower = query.lower()
     
     if "campaign" in query_lower or "chiến dịch" in query_lower:
-        tool = QueryCampaignListTool()
-        
         # Build query with filters
         params = {}
         if entities.get("program"):
@@ -353,9 +599,8 @@ async def execute_data_query_crew(query: str, entities: dict) -> dict:
              elif isinstance(kws, str):
                  params["keyword"] = kws
         
-        result = tool._run(json.dumps(params))
-        data = json.loads(result)
-        table_data = data["campaigns"]
+        page = await asyncio.to_thread(list_campaigns, **params)
+        table_data, total, next_cursor = page.campaigns, page.total_campaigns, page.next_cursor
         
         filter_desc = ""
         if params.get("program"):
@@ -363,17 +608,13 @@ async def execute_data_query_crew(query: str, entities: dict) -> dict:
         if params.get("keyword"):
             filter_desc += f" với từ khóa '{params['keyword']}'"
             
-        narrative = f"Dưới đây là danh sách {len(table_data)} chiến dịch{filter_desc}:"
+        narrative = f"Dưới đây là danh sách {total} chiến dịch{filter_desc}:"
     elif "account" in query_lower or "tài khoản" in query_lower:
-        tool = QueryAccountsTool()
-        result = tool._run("")
-        data = json.loads(result)
-        table_data = data["accounts"]
-        narrative = f"Bạn đang có {data['activeAccounts']} tài khoản đang hoạt động trong tổng số {data['totalAccounts']} tài khoản:"
+        data = await asyncio.to_thread(list_accounts)
+        table_data, total, next_cursor = data.accounts, data.total_accounts, data.next_cursor
+        narrative = f"Bạn đang có {data.active_accounts} tài khoản đang hoạt động trong tổng số {data.total_accounts} tài khoản:"
     else:
         # Default to campaigns with filters if any
-        tool = QueryCampaignListTool()
-        
         params = {}
         if entities.get("program"):
             params["program"] = entities["program"]
@@ -384,9 +625,8 @@ async def execute_data_query_crew(query: str, entities: dict) -> dict:
              elif isinstance(kws, str):
                  params["keyword"] = kws
                  
-        result = tool._run(json.dumps(params))
-        data = json.loads(result)
-        table_data = data["campaigns"]
+        page = await asyncio.to_thread(list_campaigns, **params)
+        table_data, total, next_cursor = page.campaigns, page.total_campaigns, page.next_cursor
         narrative = f"Đây là dữ liệu bạn yêu cầu:"
     
     return {
@@ -399,21 +639,32 @@ async def execute_data_query_crew(query: str, entities: dict) -> dict:
                 },
                 {
                     "type": "table",
-                    "content": table_data
+                    "content": table_data,
+                    # Only the first page is sent; the client fetches the rest via /api/list/next
+                    "pagination": {
+                        "total": total,
+                        "nextCursor": next_cursor
+                    }
                 }
             ]
         }
     }
 
 
-async def execute_research_crew(query: str, entities: dict, conversation_history: str = "") -> dict:
+async def execute_research_crew(query: str, entities: dict, conversation_history: str = "",
+                               emit: Optional[Emit] = None) -> dict:
     """Execute affiliate program research - returns table of program recommendations.
     
     This reuses the old research functionality to find affiliate programs in a niche.
+    With `emit`, the table section is re-sent each time another program's
+    object closes in the model's output.
     """
     
     niche = entities.get("niche", query)  # Use query as niche if not extracted
     
+    # Generate a brief narrative introduction
+    narrative = f"Đây là các chương trình affiliate trong lĩnh vực **{niche}** mà tôi tìm được cho bạn:"
+    
     # Research prompt template (same as old generator.py)
     prompt = f"""Research Niche: {niche}
 Context from previous conversation (if any):
@@ -434,13 +685,28 @@ For each program, provide:
 Return ONLY the JSON array.
 """
     
-    response = await client.aio.models.generate_content(
-        model="gemini-3-flash-preview",
-        contents=prompt
-    )
-    
-    # Parse the response
-    buffer = response.text.strip()
+    streamed_rows = []
+    if emit:
+        await emit({"event": "token", "section": 0, "text": narrative})
+        parser = JSONArrayStream()
+        response = await client.aio.models.generate_content_stream(
+            model="gemini-3-flash-preview",
+            contents=prompt
+        )
+        async for chunk in response:
+            new_rows = parser.feed(chunk.text) if chunk.text else []
+            if new_rows:
+                streamed_rows.extend(new_rows)
+                await emit({"event": "section", "index": 1, "section": {"type": "table", "content": list(streamed_rows)}})
+        buffer = parser.text.strip()
+    else:
+        response = await client.aio.models.generate_content(
+            model="gemini-3-flash-preview",
+            contents=prompt
+        )
+        
+        # Parse the response
+        buffer = response.text.strip()
 
     
     # Post-process: Strip markdown wrappers if present
@@ -461,10 +727,8 @@ Return ONLY the JSON array.
         else:
             table_data = []
     except json.JSONDecodeError:
-        table_data = [{"error": "Không thể parse kết quả từ AI"}]
-    
-    # Generate a brief narrative introduction
-    narrative = f"Đây là các chương trình affiliate trong lĩnh vực **{niche}** mà tôi tìm được cho bạn:"
+        # Keep the programs already shown when the answer was cut off
+        table_data = streamed_rows or [{"error": "Không thể parse kết quả từ AI"}]
     
     return {
         "type": "composite",
@@ -491,14 +755,31 @@ Return ONLY the JSON array.
     }
 
 
-async def run_agent_workflow(messages: list) -> dict:
+# Status shown while each intent's answer is being prepared
+STATUS_MESSAGES = {
+    "data_analysis": "Đang truy vấn dữ liệu...",
+    "comparison": "Đang so sánh hai kỳ...",
+    "data_query": "Đang tải danh sách...",
+    "explanation": "Đang soạn câu trả lời...",
+    "research": "Đang tìm chương trình affiliate...",
+    "followup": "Đang xem lại câu trả lời trước...",
+}
+
+
+async def run_agent_workflow(messages: list, emit: Optional[Emit] = None) -> dict:
     """Main entry point for the agent workflow.
     
     Args:
         messages: List of message dicts with 'role' and 'content'
+        emit: Optional progress callback for streaming. It is awaited with
+            {"event": "status", "intent", "message"} once the intent is known,
+            {"event": "section", "index", "section"} for each chart/table/insight
+            section as soon as its data is ready, and
+            {"event": "token", "section", "text"} for each narrative chunk
+            (`section` is None when the answer is plain text).
     
     Returns:
-        Response dict with type and content
+        Response dict with type and content (the complete answer)
     """
     
     logger.info("=" * 60)
@@ -525,30 +806,41 @@ async def run_agent_workflow(messages: list) -> dict:
             # Summarize previous response
             conversation_history += f"{role}: [Previous data/chart response]\n"
     
-    # Step 1: Classify intent
-    # Note: classify_intent from intent_classifier is async
-    intent_result = await classify_intent(query, conversation_history)
-    intent = intent_result.get("intent", "data_analysis")
-    entities = intent_result.get("entities", {})
-    
-    logger.info(f"🎯 ROUTING TO: {intent.upper()}")
-    
-    # Step 2: Route to appropriate crew
-    if intent == "data_analysis" or intent == "comparison":
-        return await execute_data_analysis_crew(query, entities)
-    elif intent == "data_query":
-        return await execute_data_query_crew(query, entities)
-    elif intent == "explanation":
-        return await execute_explanation_crew(query, conversation_history)
-    elif intent == "research":
-        return await execute_research_crew(query, entities, conversation_history)
-    elif intent == "followup":
-        # For followup, try to understand what type of followup
-        if any(word in query.lower() for word in ["tại sao", "why", "giải thích", "explain"]):
-            return await execute_explanation_crew(query, conversation_history)
-        else:
-            return await execute_data_analysis_crew(query, entities)
-    
-    # Default fallback
-    return await execute_explanation_crew(query, conversation_history)
+    # Most turns are data_analysis: start the likely data query while the intent is classified
+    speculative = _start_speculative_query(query, conversation_history)
+    try:
+        # Step 1: Classify intent
+        # Note: classify_intent from intent_classifier is async
+        intent_result = await classify_intent(query, conversation_history)
+        intent = intent_result.get("intent", "data_analysis")
+        entities = intent_result.get("entities", {})
+        
+        logger.info(f"🎯 ROUTING TO: {intent.upper()}")
+        if emit:
+            await emit({"event": "status", "intent": intent, "message": STATUS_MESSAGES.get(intent, "")})
+        
+        # Step 2: Route to appropriate crew
+        if intent == "data_analysis":
+            return await execute_data_analysis_crew(query, entities, speculative, emit)
+        elif intent == "comparison":
+            return await execute_comparison_crew(query, entities, emit)
+        elif intent == "data_query":
+            return await execute_data_query_crew(query, entities)
+        elif intent == "explanation":
+            return await execute_explanation_crew(query, conversation_history, emit)
+        elif intent == "research":
+            return await execute_research_crew(query, entities, conversation_history, emit)
+        elif intent == "followup":
+            # For followup, try to understand what type of followup
+            if any(word in query.lower() for word in ["tại sao", "why", "giải thích", "explain"]):
+                return await execute_explanation_crew(query, conversation_history, emit)
+            else:
+                return await execute_data_analysis_crew(query, entities, speculative, emit)
+        
+        # Default fallback
+        return await execute_explanation_crew(query, conversation_history, emit)
+    finally:
+        # Other intents never needed it (a no-op once the data crew awaited it)
+        if speculative is not None:
+            _discard(speculative[1])
 
@@ -0,0 +1,179 @@
+"""
+Generic Group-By Engine for Campaign Metrics
+
+Aggregates base metric columns over any combination of group keys
+(e.g. date bucket x account) in a single sort-and-reduce pass, then derives
+ratio metrics (CPC, CTR, ROAS, CPA, ROI) for every group in one vectorized
+step.
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+# Derived metric -> (numerator, denominator, scale, rounding digits used in tool output)
+DERIVED_METRICS = {
+    "cpc": ("cost", "clicks", 1, 0),
+    "ctr": ("clicks", "impressions", 100, 2),
+    "roas": ("revenue", "cost", 1, 2),
+    "cpa": ("cost", "conversions", 1, 0),
+    "roi": ("profit", "cost", 100, 2),
+}
+
+# Derived metrics attached to every aggregated row returned by the query tool
+ROW_METRICS = ("cpc", "ctr", "roas", "cpa")
+
+
+class GroupedMetrics:
+    """Per-group totals produced by `aggregate`.
+
+    Attributes:
+        keys: one array per group dimension, aligned with the totals
+        totals: base metric name -> per-group sums
+        first: smallest order key (or first input position) per group
+    """
+
+    def __init__(self, keys: list, totals: dict, first: np.ndarray):
+        self.keys = keys
+        self.totals = totals
+        self.first = first
+
+    def __len__(self) -> int:
+        return len(self.first)
+
+    def take(self, index) -> "GroupedMetrics":
+        """Reorder or subset the groups."""
+        return GroupedMetrics(
+            [k[index] for k in self.keys],
+            {m: v[index] for m, v in self.totals.items()},
+            self.first[index],
+        )
+
+    def derived(self, metrics: Sequence[str] = ROW_METRICS) -> dict:
+        """Ratio metrics for every group; NaN where the denominator is zero."""
+        return derived_metrics(self.totals, metrics)
+    
+    def metric(self, name: str) -> np.ndarray:
+        """Per-group values of a base or derived metric."""
+        if name in self.totals:
+            return self.totals[name]
+        return self.derived([name])[name]
+    
+    def top(self, metric: str, k: int, descending: bool = True) -> "GroupedMetrics":
+        """The k groups ranking best on `metric`, best first.
+        
+        Undefined ratios rank as 0, matching the tool output. Ties keep the
+        current group order.
+        """
+        values = self.metric(metric)
+        if values.dtype.kind == "f":
+            values = np.nan_to_num(values, nan=0.0)
+        return self.take(top_k(values, k, descending))
+
+
+def derived_metrics(totals: dict, metrics: Sequence[str] = ROW_METRICS) -> dict:
+    """Vectorized ratio metrics over per-group totals.
+
+    Values are unrounded; groups whose denominator is not positive get NaN so
+    callers can apply their own zero-division convention.
+    """
+    result = {}
+    for name in metrics:
+        numerator, denominator, scale, _ = DERIVED_METRICS[name]
+        den = np.asarray(totals[denominator], dtype=np.float64)
+        if numerator == "profit":
+            num = np.asarray(totals["revenue"], dtype=np.float64) - np.asarray(totals["cost"], dtype=np.float64)
+        else:
+            num = np.asarray(totals[numerator], dtype=np.float64)
+        out = np.full(len(den), np.nan)
+        np.divide(num, den, out=out, where=den > 0)
+        result[name] = out * scale
+    return result
+
+
+def aggregate(keys: Sequence[np.ndarray], columns: dict, order_key: Optional[np.ndarray] = None) -> GroupedMetrics:
+    """Sum `columns` per distinct combination of `keys` in one pass.
+
+    Groups come out ordered lexicographically by the keys (first key most
+    significant). `np.add.reduceat` keeps integer columns exact. If
+    `order_key` is given, each group's `first` is its smallest order key,
+    otherwise the input position of its first row.
+    """
+    n = len(columns[next(iter(columns))]) if columns else 0
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return GroupedMetrics([k[:0] for k in keys], {m: col[:0] for m, col in columns.items()}, empty)
+
+    if len(keys) == 1:
+        order = np.argsort(keys[0], kind="stable")
+    else:
+        order = np.lexsort(tuple(reversed(keys)))
+
+    boundary = np.zeros(n, dtype=bool)
+    boundary[0] = True
+    for k in keys:
+        sorted_k = k[order]
+        boundary[1:] |= sorted_k[1:] != sorted_k[:-1]
+    starts = np.flatnonzero(boundary)
+
+    totals = {m: np.add.reduceat(col[order], starts) for m, col in columns.items()}
+    if order_key is None:
+        first = order[starts]
+    else:
+        first = np.minimum.reduceat(order_key[order], starts)
+    return GroupedMetrics([k[order[starts]] for k in keys], totals, first)
+
+
+def merge_partials(parts: Sequence[GroupedMetrics], disjoint: bool = False) -> GroupedMetrics:
+    """Combine `aggregate` results over disjoint row sets into one.
+
+    Sums and first-order keys are mergeable, so groups split across parts
+    are re-added; derived metrics must be computed after the merge. With
+    `disjoint`, the parts' leading keys are known not to overlap and to
+    ascend from part to part, so they are simply concatenated.
+    """
+    parts = [p for p in parts if len(p)] or list(parts[:1])
+    if len(parts) == 1:
+        return parts[0]
+    if disjoint:
+        return GroupedMetrics(
+            [np.concatenate(k) for k in zip(*(p.keys for p in parts))],
+            {m: np.concatenate([p.totals[m] for p in parts]) for m in parts[0].totals},
+            np.concatenate([p.first for p in parts]),
+        )
+    return aggregate(
+        [np.concatenate(k) for k in zip(*(p.keys for p in parts))],
+        {m: np.concatenate([p.totals[m] for p in parts]) for m in parts[0].totals},
+        order_key=np.concatenate([p.first for p in parts]),
+    )
+
+
+def top_k(values: np.ndarray, k: int, descending: bool = True) -> np.ndarray:
+    """Indices of the k largest (or smallest) values, best first.
+    
+    Uses a partial selection (`np.partition`, O(n)) and sorts only the k
+    winners, instead of sorting all n values. Ties are resolved by position,
+    as a stable sort would.
+    """
+    values = np.asarray(values)
+    n = len(values)
+    key = -values if descending else values
+    if k >= n:
+        return np.argsort(key, kind="stable")
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    
+    kth = np.partition(key, k - 1)[k - 1]
+    better = np.flatnonzero(key < kth)
+    ties = np.flatnonzero(key == kth)[:k - len(better)]
+    chosen = np.concatenate([better, ties])
+    return chosen[np.lexsort((chosen, key[chosen]))]
+
+
+def rounded_metric(name: str, value: float):
+    """Apply the tool output convention: rounded value, or 0 when undefined."""
+    if value != value:  # NaN
+        return 0
+    return round(value, DERIVED_METRICS[name][3])
+
@@ -7,25 +7,36 @@ Provides tools for querying application data sources:
 - Projects
 """
 
+import os
 import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Any, Optional
+from typing import Any, Callable, Optional
+import numpy as np
 from crewai.tools import BaseTool
 from mock_data_generator import get_db
+from fact_store import FactStore, METRIC_COLUMNS, date_to_ordinal, ordinal_to_date
+from aggregation import DERIVED_METRICS, GroupedMetrics, ROW_METRICS, aggregate, derived_metrics, rounded_metric
+from rollups import RollupSet, bucket_offset, offset_bucket_start
+from dimensions import DimensionTables, get_dimensions
+from keyword_index import fold_text
+from ttl_cache import TTLCache
+from snapshot import SnapshotDB, acquire_writer_lock, current_snapshot_id, load_snapshot, save_snapshot, snapshot_dir
+from storage import AdsStorage, InMemoryStorage, SQLStorage, storage_url
+from pagination import SORT_ORDERS, clamp_page_size, decode_cursor, encode_cursor, page_positions
+from export_loader import EXPORT_CHUNK_ROWS, ExportTotals, LoadReport, read_export
+from entities import account_records, campaign_records
+from sampling import CONFIDENCE_LEVEL, SampleInfo, margin_of_error, variance_column
 
-# Initialize mock database
-db = get_db()
+logger = logging.getLogger("AI_AGENT")
 
 import re
 
-def parse_date_range(query: str) -> tuple[str, str]:
-    """Parse natural language date ranges into start/end dates.
-    
-    Supports:
-    - "last N days/ngay/ngày" (e.g., "last 5 days", "7 ngày qua")
-    - Specific month names (Vietnamese)
-    - "this week", "this month"
-    """
+def _match_date_range(query: str) -> Optional[tuple[str, str]]:
+    """Dates for a recognized natural-language range, or None."""
     today = datetime.now()
     query_lower = query.lower()
     
@@ -37,34 +48,19 @@ def parse_date_range(query: str) -> tuple[str, str]:
         start = today - timedelta(days=days)
         return start.strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d")
 
-    # 2. Vietnamese month names
-    vn_months = {
-        "tháng 1": 1, "tháng 01": 1, "thang 1": 1,
-        "tháng 2": 2, "tháng 02": 2, "thang 2": 2,
-        "tháng 3": 3, "tháng 03": 3, "thang 3": 3,
-        "tháng 4": 4, "tháng 04": 4, "thang 4": 4,
-        "tháng 5": 5, "tháng 05": 5, "thang 5": 5,
-        "tháng 6": 6, "tháng 06": 6, "thang 6": 6,
-        "tháng 7": 7, "tháng 07": 7, "thang 7": 7,
-        "tháng 8": 8, "tháng 08": 8, "thang 8": 8,
-        "tháng 9": 9, "tháng 09": 9, "thang 9": 9,
-        "tháng 10": 10, "thang 10": 10,
-        "tháng 11": 11, "thang 11": 11,
-        "tháng 12": 12, "thang 12": 12,
-    }
-    
-    # Check for specific months
-    for month_name, month_num in vn_months.items():
-        if month_name in query_lower:
-            year = today.year
-            if month_num > today.month:
-                year -= 1
-            start = datetime(year, month_num, 1)
-            if month_num == 12:
-                end = datetime(year + 1, 1, 1) - timedelta(days=1)
-            else:
-                end = datetime(year, month_num + 1, 1) - timedelta(days=1)
-            return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+    # 2. Vietnamese month names ("tháng 1" must not match "tháng 10")
+    match = re.search(r'(?:tháng|thang)\s*0?(1[0-2]|[1-9])(?!\d)', query_lower)
+    if match:
+        month_num = int(match.group(1))
+        year = today.year
+        if month_num > today.month:
+            year -= 1
+        start = datetime(year, month_num, 1)
+        if month_num == 12:
+            end = datetime(year + 1, 1, 1) - timedelta(days=1)
+        else:
+            end = datetime(year, month_num + 1, 1) - timedelta(days=1)
+        return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
     
     # 3. Common patterns
     if "this week" in query_lower or "tuần này" in query_lower:
@@ -75,11 +71,1061 @@ def parse_date_range(query: str) -> tuple[str, str]:
         start = datetime(today.year, today.month, 1)
         return start.strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d")
     
+    if "last week" in query_lower or "tuần trước" in query_lower:
+        end = today - timedelta(days=today.weekday() + 1)
+        start = end - timedelta(days=6)
+        return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+    
+    if "last month" in query_lower or "tháng trước" in query_lower:
+        end = datetime(today.year, today.month, 1) - timedelta(days=1)
+        start = datetime(end.year, end.month, 1)
+        return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+    
+    return None
+
+
+def parse_date_range(query: str) -> tuple[str, str]:
+    """Parse natural language date ranges into start/end dates.
+    
+    Supports:
+    - "last N days/ngay/ngày" (e.g., "last 5 days", "7 ngày qua")
+    - Specific month names (Vietnamese)
+    - "this week", "this month", "last week", "last month"
+    """
+    match = _match_date_range(query)
+    if match:
+        return match
+    
     # Default: last 30 days
+    today = datetime.now()
     start = today - timedelta(days=30)
     return start.strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d")
 
 
+def _dimensions() -> DimensionTables:
+    """Shared account/campaign lookups over the current storage."""
+    return get_dimensions(storage, storage.campaign_ids)
+
+
+def _build_rows(groups: GroupedMetrics, labels: list, entities: Optional[list] = None) -> list:
+    """Turn aggregated groups into the row dicts returned by the tools."""
+    columns = {m: groups.totals[m].tolist() for m in METRIC_COLUMNS}
+    derived = {name: values.tolist() for name, values in groups.derived(ROW_METRICS).items()}
+    rows = []
+    for i, label in enumerate(labels):
+        row = {"date": label}
+        if entities is not None:
+            row["entity"] = entities[i]
+        for m in METRIC_COLUMNS:
+            row[m] = columns[m][i]
+        for name in ROW_METRICS:
+            row[name] = rounded_metric(name, derived[name][i])
+        rows.append(row)
+    return rows
+
+
+def _summarize(table: dict) -> dict:
+    """Calculate the summary block over the returned groups (columnar totals)."""
+    overall = calculate_group_metrics(table, metrics=["cpc", "ctr", "roas", "cpa"], undefined=np.nan)
+    totals = {m: overall.totals[m][0].item() for m in METRIC_COLUMNS}
+    averages = {name: rounded_metric(name, v[0].item()) for name, v in overall.metrics.items()}
+    
+    return {
+        "totalClicks": totals["clicks"],
+        "totalCost": totals["cost"],
+        "totalRevenue": totals["revenue"],
+        "totalConversions": totals["conversions"],
+        "totalImpressions": totals["impressions"],
+        "avgCPC": averages["cpc"],
+        "avgCTR": averages["ctr"],
+        "avgROAS": averages["roas"],
+        "avgCPA": averages["cpa"]
+    }
+
+
+def _build_in_memory() -> tuple:
+    """Generate the mock database and build (db, fact_store, rollups) from it.
+    
+    `db` holds the entities as compact records, not the generator's dicts.
+    """
+    source_db = get_db()
+    db = SnapshotDB(account_records(source_db.accounts), campaign_records(source_db.campaigns))
+    store = FactStore.from_records(source_db.daily_data, db.campaigns)
+    cubes = RollupSet.build(store, get_dimensions(db, store.campaign_ids).campaign_account)
+    return db, store, cubes
+
+
+# Id of the snapshot the in-memory storage was loaded from or last saved as
+_snapshot_id = None
+# Held from this process's first ingest on: it is then the snapshot's only writer
+_snapshot_writer = None
+
+
+def _save_built_snapshot(path: str, db, store: FactStore, cubes: RollupSet, seen_id: Optional[str]):
+    """Save freshly built data as the snapshot, unless another process holds it or saved since `seen_id`."""
+    global _snapshot_id
+    os.makedirs(path, exist_ok=True)
+    lock = acquire_writer_lock(path)
+    if lock is None:
+        logger.info(f"📦 Not writing snapshot {path}: another process is writing it")
+        return
+    with lock:
+        if current_snapshot_id(path) == seen_id:
+            _snapshot_id = save_snapshot(path, db, store, cubes)
+
+
+def _load_storage() -> AdsStorage:
+    """Open the storage backend selected by ADS_STORAGE.
+    
+    In memory (default): memory-maps the on-disk snapshot when one exists
+    and is current (see snapshot.py: generated data is rebuilt daily);
+    otherwise builds the columnar fact store and the week/month x
+    account/campaign rollup cubes and writes a snapshot for the next start.
+    
+    SQL file: opens the database, building it from the mock generator if the
+    file does not exist yet.
+    """
+    url = storage_url()
+    if url != "memory":
+        _, _, path = url.partition(":")
+        if os.path.exists(path):
+            return SQLStorage(url)
+        source_db, store, cubes = _build_in_memory()
+        return SQLStorage.build(url, source_db, store, cubes.campaign_account)
+    
+    global _snapshot_id
+    path = snapshot_dir()
+    seen_id = current_snapshot_id(path) if path else None
+    snapshot = load_snapshot(path) if path else None
+    if snapshot is not None:
+        _snapshot_id = snapshot.id
+        return InMemoryStorage(snapshot.db, snapshot.rollups)
+    
+    source_db, store, cubes = _build_in_memory()
+    if path:
+        try:
+            _save_built_snapshot(path, source_db, store, cubes, seen_id)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write data snapshot to {path}: {e}")
+    return InMemoryStorage(source_db, cubes)
+
+
+# Initialize the storage backend (in-memory fact store + rollups, or a SQL file)
+storage = _load_storage()
+
+
+# Results of query_ads_campaigns, keyed on the normalized query
+query_cache = TTLCache(
+    maxsize=int(os.getenv("QUERY_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("QUERY_CACHE_TTL", "300")),
+)
+
+
+# Metrics QueryAdsCampaignsTool can rank entities by
+RANK_METRICS = (*METRIC_COLUMNS, *DERIVED_METRICS)
+
+
+def _positive_int(value) -> Optional[int]:
+    """Parse a caller-supplied count, ignoring anything that is not a positive integer."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+@dataclass
+class CampaignQuery:
+    """Typed parameters for `query_ads_campaigns` (see QueryAdsCampaignsTool)."""
+    date_range: str = "last 30 days"
+    account_ids: list = field(default_factory=list)
+    campaign_ids: list = field(default_factory=list)
+    program: Optional[str] = None
+    keywords: list = field(default_factory=list)
+    group_by: str = "day"
+    breakdown: Optional[str] = None
+    sort_by: Optional[str] = None
+    sort_order: str = "desc"
+    limit: Optional[int] = None
+    approximate: bool = False
+    
+    @classmethod
+    def from_params(cls, params: dict) -> "CampaignQuery":
+        """Build a query from the tool's JSON parameter dict."""
+        return cls(
+            date_range=params.get("date_range", "last 30 days"),
+            account_ids=params.get("account_ids", []),
+            campaign_ids=params.get("campaign_ids", []),
+            program=params.get("program"),
+            keywords=params.get("keywords", []),
+            group_by=params.get("group_by", "day"),
+            breakdown=params.get("breakdown"),
+            sort_by=params.get("sort_by") if params.get("sort_by") in RANK_METRICS else None,
+            sort_order="asc" if params.get("sort_order") == "asc" else "desc",
+            limit=_positive_int(params.get("limit")),
+            approximate=params.get("approximate") in (True, "true", "1", 1),
+        )
+    
+    def cache_key(self, start_date: str, end_date: str) -> tuple:
+        """Normalized key: resolved dates, sorted/folded filters, grouping."""
+        return (
+            start_date,
+            end_date,
+            tuple(sorted(set(self.account_ids))),
+            tuple(sorted(set(self.campaign_ids))),
+            fold_text(self.program) if self.program else None,
+            tuple(sorted({fold_text(k) for k in self.keywords})),
+            self.group_by,
+            self.breakdown if self.breakdown in ["account", "campaign"] else None,
+            self.sort_by,
+            self.sort_order,
+            self.limit,
+            self.approximate,
+        )
+
+
+@dataclass
+class CampaignQueryResult:
+    """Structured result of `query_ads_campaigns`.
+    
+    `data` holds the chart rows; `groups` holds the same groups as columnar
+    arrays for callers that want to keep computing on them. `approximation`
+    is set for approximate queries: how the totals were estimated, their
+    error bounds and, for unfiltered queries, sketch-based distinct campaign
+    counts and percentiles of daily per-campaign values.
+    """
+    data: list
+    start_date: str
+    end_date: str
+    summary: dict
+    breakdown: Optional[str] = None
+    groups: Optional[GroupedMetrics] = None
+    approximation: Optional[dict] = None
+    
+    @property
+    def is_granular(self) -> bool:
+        return self.breakdown is not None
+    
+    @property
+    def date_range(self) -> dict:
+        return {"start": self.start_date, "end": self.end_date}
+    
+    def to_dict(self) -> dict:
+        """The JSON shape returned by QueryAdsCampaignsTool."""
+        result = {
+            "data": self.data,
+            "dateRange": self.date_range,
+            "totalRecords": len(self.data),
+        }
+        if self.is_granular:
+            result["is_granular"] = True
+            result["breakdown"] = self.breakdown
+        result["summary"] = self.summary
+        if self.approximation is not None:
+            result["approximation"] = self.approximation
+        return result
+
+
+@dataclass
+class MetricsResult:
+    """Structured result of `calculate_metrics`."""
+    metrics: dict
+    totals: dict
+    
+    def to_dict(self) -> dict:
+        return {"metrics": self.metrics, "totals": self.totals}
+
+
+@dataclass
+class AccountSummary:
+    """Structured result of `list_accounts` (one page of accounts)."""
+    accounts: list
+    total_accounts: int
+    active_accounts: int
+    next_cursor: Optional[str] = None
+    
+    def to_dict(self) -> dict:
+        return {
+            "accounts": self.accounts,
+            "totalAccounts": self.total_accounts,
+            "activeAccounts": self.active_accounts,
+            "nextCursor": self.next_cursor
+        }
+
+
+@dataclass
+class CampaignList:
+    """Structured result of `list_campaigns` (one page of campaigns)."""
+    campaigns: list
+    total_campaigns: int
+    next_cursor: Optional[str] = None
+    
+    def to_dict(self) -> dict:
+        return {
+            "campaigns": self.campaigns,
+            "totalCampaigns": self.total_campaigns,
+            "nextCursor": self.next_cursor
+        }
+
+
+@dataclass
+class PeriodComparison:
+    """Structured result of `compare_periods`.
+    
+    `data` rows are aligned bucket by bucket from each period's start: for
+    every metric `m` a row holds `m` (current), `mPrevious`, `mDelta` and
+    `mDeltaPct` (None when the previous value is 0).
+    """
+    current: tuple
+    previous: tuple
+    time_grain: str
+    data: list
+    summary: dict
+    
+    def to_dict(self) -> dict:
+        return {
+            "data": self.data,
+            "current": {"start": self.current[0], "end": self.current[1]},
+            "previous": {"start": self.previous[0], "end": self.previous[1]},
+            "timeGrain": self.time_grain,
+            "totalRecords": len(self.data),
+            "summary": self.summary
+        }
+
+
+@dataclass
+class IngestResult:
+    """Structured result of `ingest_daily_metrics`."""
+    received: int
+    inserted: int
+    updated: int
+    new_campaigns: int
+    version: int
+    
+    def to_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "newCampaigns": self.new_campaigns,
+            "version": self.version
+        }
+
+
+# Record fields the list tools can sort by
+ACCOUNT_SORT_KEYS = ("id", "name", "status", "platform")
+CAMPAIGN_SORT_KEYS = ("id", "name", "program", "accountId", "status")
+
+
+def query_ads_campaigns(query: CampaignQuery) -> CampaignQueryResult:
+    """Query aggregated campaign performance (Python-level API behind QueryAdsCampaignsTool).
+    
+    Results are cached per normalized query and data version, and shared
+    between callers: treat them as read-only.
+    """
+    start_date, end_date = parse_date_range(query.date_range)
+    key = query.cache_key(start_date, end_date)
+    
+    result = query_cache.get(key, version=storage.version)
+    if result is None:
+        result = _execute_campaign_query(query, start_date, end_date)
+        query_cache.set(key, result, version=storage.version)
+    return result
+
+
+def _filter_campaigns(dims: DimensionTables, query: CampaignQuery) -> np.ndarray:
+    """Resolve the query's filters to campaign codes (all known campaigns by default)."""
+    camp_codes = dims.known_campaigns
+    
+    if query.account_ids:
+        camp_codes = np.intersect1d(camp_codes, dims.campaigns_for_accounts(query.account_ids))
+    
+    if query.campaign_ids:
+        camp_codes = np.intersect1d(camp_codes, dims.campaign_codes(query.campaign_ids))
+        
+    if query.program:
+        camp_codes = np.intersect1d(camp_codes, dims.search_index().match_program(query.program))
+        
+    if query.keywords:
+        # Campaign matches if ANY of its keywords (or its name) match ANY of the filter keywords
+        camp_codes = np.intersect1d(camp_codes, dims.search_index().match_keywords(query.keywords))
+    
+    return camp_codes
+
+
+def _execute_campaign_query(query: CampaignQuery, start_date: str, end_date: str) -> CampaignQueryResult:
+    """Run a campaign query against the storage backend (uncached)."""
+    group_by = query.group_by
+    dims = _dimensions()
+    
+    camp_codes = _filter_campaigns(dims, query)
+    
+    start_ord, end_ord = date_to_ordinal(start_date), date_to_ordinal(end_date)
+    
+    # Resolve the group dimensions: an optional time bucket and an optional entity
+    breakdown_by = query.breakdown if query.breakdown in ["account", "campaign"] else None
+    time_grain = group_by if group_by in ["week", "month"] else None
+    entity_dim = breakdown_by or (group_by if group_by in ["account", "campaign"] else None)
+    if time_grain is None and (breakdown_by or entity_dim is None):
+        time_grain = "day"
+    
+    sample = None
+    if query.approximate:
+        groups, sample = storage.aggregate_approx(start_ord, end_ord, camp_codes, time_grain=time_grain,
+                                                  entity_grain=entity_dim)
+    else:
+        groups = storage.aggregate(start_ord, end_ord, camp_codes, time_grain=time_grain, entity_grain=entity_dim)
+    
+    if entity_dim:
+        # Merge entities that share a display name
+        campaign_codes, account_codes, entity_names = dims.labels(entity_dim)
+        name_codes = (account_codes if entity_dim == "account" else campaign_codes)[groups.keys[-1]]
+        groups = aggregate(groups.keys[:-1] + [name_codes], groups.totals, order_key=groups.first)
+    
+    # Time buckets ascending; entities in order of first appearance
+    if time_grain and entity_dim:
+        groups = groups.take(np.lexsort((groups.first, groups.keys[0])))
+    elif entity_dim:
+        groups = groups.take(np.argsort(groups.first, kind="stable"))
+    
+    if entity_dim and not breakdown_by and (group_by == "campaign" or query.sort_by or query.limit):
+        # Rank entities; by default the top 10 campaigns by spend (cost)
+        limit = query.limit or (10 if group_by == "campaign" else len(groups))
+        groups = groups.top(query.sort_by or "cost", limit, descending=query.sort_order == "desc")
+    
+    time_labels = [ordinal_to_date(k) for k in groups.keys[0]] if time_grain else None
+    entity_labels = [entity_names[k] for k in groups.keys[-1]] if entity_dim else None
+    
+    if breakdown_by:
+        # Granular data (date + entity) for multi-line charts
+        result = _build_rows(groups, time_labels, entities=entity_labels)
+    else:
+        result = _build_rows(groups, time_labels if time_grain else entity_labels)
+    
+    return CampaignQueryResult(
+        data=result,
+        start_date=start_date,
+        end_date=end_date,
+        summary=_summarize(groups.totals),
+        breakdown=breakdown_by,
+        groups=groups,
+        approximation=_approximation(query, groups, sample, start_ord, end_ord) if query.approximate else None,
+    )
+
+
+# Percentiles of daily per-campaign values reported with approximate answers
+APPROX_PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def _approximation(query: CampaignQuery, groups: GroupedMetrics, sample: Optional[SampleInfo],
+                   start_ord: int, end_ord: int) -> dict:
+    """Describe how an approximate query was answered (see CampaignQueryResult)."""
+    info = {"method": "stratified-sample" if sample else "exact", "confidence": CONFIDENCE_LEVEL}
+    if sample:
+        info.update({
+            "sampledRows": sample.sampled_rows,
+            "totalRows": sample.total_rows,
+            "sampleRate": round(sample.rate, 4),
+            "strata": sample.strata,
+        })
+        bounds = {}
+        for m in METRIC_COLUMNS:
+            total = float(groups.totals[m].sum())
+            margin = float(margin_of_error(groups.totals[variance_column(m)].sum()))
+            bounds[m] = {"margin": round(margin, 2), "relative": round(margin / total, 4) if total else None}
+        info["errorBounds"] = bounds
+    
+    sketches = storage.sketches
+    unfiltered = not (query.account_ids or query.campaign_ids or query.program or query.keywords)
+    if unfiltered and sketches is not None:
+        # Sketches are per month: they cover the whole months around the range
+        first, last = sketches.covered_range(start_ord, end_ord)
+        labels = [f"p{round(q * 100)}" for q in APPROX_PERCENTILES]
+        info["sketches"] = {
+            "dateRange": {"start": ordinal_to_date(first), "end": ordinal_to_date(last)},
+            "activeCampaigns": sketches.distinct_campaigns(start_ord, end_ord),
+            "dailyPercentiles": {
+                m: {label: round(v, 2) if v is not None else None
+                    for label, v in zip(labels, sketches.quantiles(m, start_ord, end_ord, APPROX_PERCENTILES))}
+                for m in METRIC_COLUMNS
+            },
+        }
+    return info
+
+
+# Separators between the two periods of a comparison ("tháng 10 và 11", "tuần này vs tuần trước")
+_COMPARISON_SPLIT = re.compile(r"\s+(?:so với|vs\.?|versus|compared to|với|và|and)\s+")
+
+
+def resolve_comparison_periods(text: str, time_range: Optional[str] = None,
+                               compare_to: Optional[str] = None) -> tuple:
+    """Resolve ((current_start, current_end), (previous_start, previous_end)).
+    
+    Uses `compare_to` when given, otherwise the first two date ranges named
+    in `text` ("so sánh tháng 10 và 11"); the later one is current. Falls
+    back to `time_range` against the period of the same length just before it.
+    """
+    if compare_to:
+        periods = [_match_date_range(time_range or text), _match_date_range(compare_to)]
+    else:
+        periods = []
+        parts = _COMPARISON_SPLIT.split(text.lower())
+        for previous_part, part in zip([""] + parts, parts):
+            # "tháng 10 và 11": a bare number continues a month list
+            if re.match(r"\s*\d{1,2}(?!\d)", part) and re.search(r"tháng|thang", previous_part):
+                part = f"tháng {part}"
+            period = _match_date_range(part)
+            if period and period not in periods:
+                periods.append(period)
+    if len(periods) >= 2 and all(periods[:2]) and periods[0] != periods[1]:
+        current, previous = sorted(periods[:2], reverse=True)
+        return current, previous
+    
+    start, end = parse_date_range(time_range or text)
+    start_ord, end_ord = date_to_ordinal(start), date_to_ordinal(end)
+    length = end_ord - start_ord + 1
+    return (start, end), (ordinal_to_date(start_ord - length), ordinal_to_date(start_ord - 1))
+
+
+def _metric_change(name: str, current, previous) -> dict:
+    """Current/previous values of one metric with absolute and percent change."""
+    if name in DERIVED_METRICS:
+        digits = DERIVED_METRICS[name][3]
+        current_value, previous_value = rounded_metric(name, current), rounded_metric(name, previous)
+        delta = round(current_value - previous_value, digits)
+        current, previous = (0 if v != v else v for v in (current, previous))
+    else:
+        current_value, previous_value = current, previous
+        delta = current - previous
+    return {
+        "current": current_value,
+        "previous": previous_value,
+        "delta": delta,
+        "deltaPct": round((current - previous) / abs(previous) * 100, 2) if previous else None,
+    }
+
+
+def compare_periods(query: CampaignQuery, current: tuple, previous: tuple,
+                    time_grain: Optional[str] = None) -> PeriodComparison:
+    """Compare two date ranges (API behind the comparison intent).
+    
+    Both periods come from one aggregation over the date range covering
+    them, with the query's filters. Buckets are days, weeks or months
+    (`time_grain`, chosen from the period length by default) counted from
+    each period's own start, so day 1 of one period lines up with day 1 of
+    the other.
+    """
+    bounds = [(date_to_ordinal(start), date_to_ordinal(end)) for start, end in (current, previous)]
+    if time_grain not in ["day", "week", "month"]:
+        longest = max(end - start + 1 for start, end in bounds)
+        time_grain = "day" if longest <= 92 else "week" if longest <= 366 else "month"
+    
+    key = ("compare", query.cache_key(*current), previous, time_grain)
+    result = query_cache.get(key, version=storage.version)
+    if result is not None:
+        return result
+    
+    dims = _dimensions()
+    camp_codes = _filter_campaigns(dims, query)
+    
+    # Single scan at day grain over both periods (they may overlap or be apart)
+    days = storage.aggregate(min(s for s, _ in bounds), max(e for _, e in bounds), camp_codes, time_grain="day")
+    date_ord = days.keys[0]
+    
+    # Re-bucket each period's days by their offset from the period start
+    period_keys, offset_keys, picks = [], [], []
+    n_buckets = 0
+    for p, (start, end) in enumerate(bounds):
+        inside = np.flatnonzero((date_ord >= start) & (date_ord <= end))
+        picks.append(inside)
+        period_keys.append(np.full(len(inside), p, dtype=np.int64))
+        offset_keys.append(bucket_offset(date_ord[inside], start, time_grain))
+        n_buckets = max(n_buckets, int(bucket_offset(end, start, time_grain)) + 1)
+    picked = np.concatenate(picks)
+    buckets = aggregate(
+        [np.concatenate(period_keys), np.concatenate(offset_keys)],
+        {m: days.totals[m][picked] for m in METRIC_COLUMNS},
+    )
+    
+    # Dense (period, bucket) grids, zero where a bucket has no data
+    grids = []
+    for p in range(2):
+        mask = buckets.keys[0] == p
+        totals = {}
+        for m in METRIC_COLUMNS:
+            totals[m] = np.zeros(n_buckets, dtype=days.totals[m].dtype)
+            totals[m][buckets.keys[1][mask]] = buckets.totals[m][mask]
+        grids.append(totals)
+    
+    labels = []
+    for start, end in bounds:
+        firsts = np.maximum(offset_bucket_start(start, np.arange(n_buckets), time_grain), start)
+        labels.append([ordinal_to_date(d) if d <= end else None for d in firsts.tolist()])
+    
+    names = [*METRIC_COLUMNS, *ROW_METRICS]
+    values = []
+    for grid in grids:
+        columns = {m: grid[m].tolist() for m in METRIC_COLUMNS}
+        columns.update({name: v.tolist() for name, v in derived_metrics(grid, ROW_METRICS).items()})
+        values.append(columns)
+    
+    data = []
+    for i in range(n_buckets):
+        row = {"date": labels[0][i], "previousDate": labels[1][i]}
+        for name in names:
+            change = _metric_change(name, values[0][name][i], values[1][name][i])
+            row[name] = change["current"]
+            row[f"{name}Previous"] = change["previous"]
+            row[f"{name}Delta"] = change["delta"]
+            row[f"{name}DeltaPct"] = change["deltaPct"]
+        data.append(row)
+    
+    period_values = []
+    for grid in grids:
+        totals = {m: grid[m].sum(keepdims=True) for m in METRIC_COLUMNS}
+        period_values.append({
+            **{m: totals[m].item() for m in METRIC_COLUMNS},
+            **{name: v.item() for name, v in derived_metrics(totals, ROW_METRICS).items()},
+        })
+    summary = {name: _metric_change(name, period_values[0][name], period_values[1][name]) for name in names}
+    
+    result = PeriodComparison(
+        current=tuple(current),
+        previous=tuple(previous),
+        time_grain=time_grain,
+        data=data,
+        summary=summary,
+    )
+    query_cache.set(key, result, version=storage.version)
+    return result
+
+
+def _list_state(kind: str, filters: dict, sort_by: Optional[str], sort_order: str,
+                page_size: Optional[int], cursor: Optional[str], sort_keys: tuple) -> dict:
+    """Pagination state from a cursor, or a fresh first-page state.
+    
+    Cursors come back from clients, so every field is checked again: filters
+    limited to this list's filter names with string values, a known sort key
+    and order, an integer position, and a page size clamped like a fresh one.
+    Raises ValueError for anything else.
+    """
+    if cursor:
+        state = decode_cursor(cursor)
+        if state.get("kind") != kind:
+            raise ValueError(f"Cursor does not belong to the {kind} list")
+        if state.get("version") != storage.version:
+            raise ValueError("Cursor expired: the data has changed, run the query again")
+        cursor_filters = state.get("filters")
+        if (not isinstance(cursor_filters, dict) or not set(cursor_filters) <= set(filters)
+                or not all(v is None or isinstance(v, str) for v in cursor_filters.values())):
+            raise ValueError("Invalid cursor")
+        if state.get("sort_by") is not None and state.get("sort_by") not in sort_keys:
+            raise ValueError("Invalid cursor")
+        if state.get("sort_order") not in SORT_ORDERS:
+            raise ValueError("Invalid cursor")
+        for field in ("page_size", "after"):
+            if not isinstance(state.get(field), int) or isinstance(state.get(field), bool):
+                raise ValueError("Invalid cursor")
+        if state["after"] < -1:
+            raise ValueError("Invalid cursor")
+        return {
+            "kind": kind,
+            "filters": cursor_filters,
+            "sort_by": state.get("sort_by"),
+            "sort_order": state["sort_order"],
+            "page_size": clamp_page_size(state["page_size"]),
+            "after": state["after"],
+            "version": state["version"],
+        }
+    return {
+        "kind": kind,
+        "filters": filters,
+        "sort_by": sort_by if sort_by in sort_keys else None,
+        "sort_order": sort_order if sort_order in SORT_ORDERS else "asc",
+        "page_size": clamp_page_size(page_size),
+        "after": -1,
+        "version": storage.version,
+    }
+
+
+def _next_page(dims: DimensionTables, entity_type: str, positions: np.ndarray, state: dict) -> tuple:
+    """(positions on this page, cursor for the following page or None)."""
+    ranks, order = dims.ranking(entity_type, state["sort_by"], state["sort_order"] == "desc")
+    page, last = page_positions(positions, ranks, order, state["after"], state["page_size"])
+    next_cursor = encode_cursor({**state, "after": last}) if last is not None else None
+    return page, next_cursor
+
+
+def list_accounts(sort_by: Optional[str] = None, sort_order: str = "asc",
+                  page_size: Optional[int] = None, cursor: Optional[str] = None) -> AccountSummary:
+    """List one page of ad accounts with active/total counts (API behind QueryAccountsTool).
+    
+    Pass the returned `next_cursor` back as `cursor` for the following page;
+    the cursor carries the sort and page size.
+    """
+    state = _list_state("accounts", {}, sort_by, sort_order, page_size, cursor, ACCOUNT_SORT_KEYS)
+    dims = _dimensions()
+    accounts = storage.accounts
+    page, next_cursor = _next_page(dims, "account", np.arange(len(accounts)), state)
+    return AccountSummary(
+        accounts=[accounts[i].to_dict() for i in page],
+        total_accounts=len(accounts),
+        active_accounts=dims.active_accounts,
+        next_cursor=next_cursor,
+    )
+
+
+def list_campaigns(account_id: Optional[str] = None, program: Optional[str] = None,
+                   keyword: Optional[str] = None, sort_by: Optional[str] = None, sort_order: str = "asc",
+                   page_size: Optional[int] = None, cursor: Optional[str] = None) -> CampaignList:
+    """List one page of campaign metadata matching the filters (API behind QueryCampaignListTool).
+    
+    Pass the returned `next_cursor` back as `cursor` for the following page;
+    the cursor carries the filters, sort and page size, so the other
+    arguments are ignored then.
+    """
+    filters = {"account_id": account_id, "program": program, "keyword": keyword}
+    state = _list_state("campaigns", filters, sort_by, sort_order, page_size, cursor, CAMPAIGN_SORT_KEYS)
+    filters = state["filters"]
+    
+    dims = _dimensions()
+    camp_codes = dims.known_campaigns
+    
+    if filters.get("account_id"):
+        camp_codes = np.intersect1d(camp_codes, dims.campaigns_for_accounts([filters["account_id"]]))
+    if filters.get("program"):
+        camp_codes = np.intersect1d(camp_codes, dims.search_index().match_program(filters["program"]))
+    if filters.get("keyword"):
+        camp_codes = np.intersect1d(camp_codes, dims.search_index().match_keywords([filters["keyword"]]))
+    
+    page, next_cursor = _next_page(dims, "campaign", camp_codes, state)
+    return CampaignList(
+        campaigns=[dims.campaigns[i].to_dict() for i in page],
+        total_campaigns=len(camp_codes),
+        next_cursor=next_cursor,
+    )
+
+
+def next_list_page(cursor: str):
+    """Follow-up page for a cursor returned by `list_campaigns` or `list_accounts`."""
+    kind = decode_cursor(cursor).get("kind")
+    if kind == "campaigns":
+        return list_campaigns(cursor=cursor)
+    if kind == "accounts":
+        return list_accounts(cursor=cursor)
+    raise ValueError("Invalid cursor")
+
+
+# Serializes ingestion batches (campaign code assignment + upsert)
+_ingest_lock = threading.Lock()
+
+# Serializes background snapshot writes; a pending flag coalesces bursts of upserts
+_snapshot_lock = threading.Lock()
+_snapshot_pending = threading.Event()
+
+
+def _claim_snapshot():
+    """Become the snapshot's only writer before this process first ingests; call with `_ingest_lock` held.
+    
+    In-memory rows live in one process, and each process would save its own
+    copy over the others'. So the first process to ingest keeps the lock on
+    the snapshot for as long as it runs, and ingesting in any other (a
+    second uvicorn worker, `python export_loader.py` against a running
+    server) raises RuntimeError. A snapshot another process saved since this
+    one loaded its data is loaded first, so its rows are kept.
+    """
+    global _snapshot_id, _snapshot_writer
+    path = snapshot_dir()
+    if _snapshot_writer is not None or not path or not isinstance(storage, InMemoryStorage):
+        return
+    os.makedirs(path, exist_ok=True)
+    lock = acquire_writer_lock(path)
+    if lock is None:
+        raise RuntimeError(
+            f"Ingest is handled by another process that holds {path}; "
+            f"run a single worker, and stop the server before loading exports from the command line"
+        )
+    current = current_snapshot_id(path)
+    if current is not None and current != _snapshot_id:
+        snapshot = load_snapshot(path)
+        if snapshot is not None:
+            storage.replace(snapshot.db, snapshot.rollups)
+            _snapshot_id = snapshot.id
+            logger.info(f"📦 Reloaded snapshot {snapshot.id} written by another process -> v{storage.version}")
+    _snapshot_writer = lock
+
+
+def _save_snapshot_later():
+    """Re-save the in-memory snapshot in the background so ingested rows survive a restart."""
+    path = snapshot_dir()
+    if not path or _snapshot_writer is None or _snapshot_pending.is_set():
+        return
+    _snapshot_pending.set()
+    
+    def run():
+        global _snapshot_id
+        with _snapshot_lock:
+            _snapshot_pending.clear()
+            rollups = storage.rollups
+            try:
+                _snapshot_id = save_snapshot(path, storage, rollups.store, rollups)
+            except OSError as e:
+                logger.warning(f"⚠️ Could not write data snapshot to {path}: {e}")
+    
+    # Not a daemon: an interpreter exit waits for the write to finish
+    threading.Thread(target=run, name="snapshot-writer").start()
+
+
+def _upsert_facts(date_ord: np.ndarray, campaign_ids: np.ndarray, metrics: dict,
+                  accounts: list = (), campaigns: list = ()) -> tuple:
+    """Write fact columns keyed by campaign id; call with `_ingest_lock` held.
+    
+    Unknown campaign ids get new codes. `accounts` / `campaigns` are
+    candidate `Account` / `Campaign` records; those whose id is not stored
+    yet are added. When a (date, campaign) pair repeats, the last row wins.
+    Returns (rows written, inserted, updated, new campaign codes).
+    """
+    dims = _dimensions()
+    known_accounts = {a.id for a in storage.accounts}
+    known_campaigns = {c.id for c in storage.campaigns}
+    new_accounts = list({a.id: a for a in accounts if a.id not in known_accounts}.values())
+    new_campaigns = list({c.id: c for c in campaigns if c.id not in known_campaigns}.values())
+    
+    # Map distinct ids to codes; new codes continue after the current ones, in order of appearance
+    unique_ids, first, inverse = np.unique(campaign_ids, return_index=True, return_inverse=True)
+    all_ids = list(dims.campaign_ids)
+    unique_codes = np.empty(len(unique_ids), dtype=np.int64)
+    for i in np.argsort(first, kind="stable").tolist():
+        cid = str(unique_ids[i])
+        code = dims.campaign_index.get(cid)
+        if code is None:
+            code = len(all_ids)
+            all_ids.append(cid)
+        unique_codes[i] = code
+    codes = unique_codes[inverse.ravel()]
+    
+    keys = np.asarray(date_ord, dtype=np.int64) * len(all_ids) + codes
+    _, last = np.unique(keys[::-1], return_index=True)
+    keep = len(keys) - 1 - last
+    
+    entities = {}
+    if new_accounts or new_campaigns or len(all_ids) > len(dims.campaign_ids):
+        account_records = [*storage.accounts, *new_accounts]
+        campaign_records = [*storage.campaigns, *new_campaigns]
+        entities = {
+            "campaign_ids": all_ids,
+            "campaign_account": DimensionTables(account_records, campaign_records, all_ids).campaign_account,
+            "accounts": account_records if new_accounts else None,
+            "campaigns": campaign_records if new_campaigns else None,
+        }
+    inserted, updated = storage.upsert(
+        np.asarray(date_ord)[keep], codes[keep], {m: np.asarray(metrics[m])[keep] for m in METRIC_COLUMNS},
+        **entities,
+    )
+    return len(keep), inserted, updated, len(all_ids) - len(dims.campaign_ids)
+
+
+def ingest_daily_metrics(records: list) -> IngestResult:
+    """Append or replace daily campaign metrics (one record per campaign and day).
+    
+    Records look like `daily_data` rows: `date` (YYYY-MM-DD), `campaignId`
+    and the metric columns; a missing metric counts as 0. A (date,
+    campaign) pair already stored is overwritten, and the last record wins
+    when the batch repeats one. Campaign ids without a campaign record are
+    stored like orphan facts. Queries keep running during the update and the
+    query cache is invalidated by the version bump. Raises ValueError for
+    malformed records.
+    """
+    if not records:
+        return IngestResult(received=0, inserted=0, updated=0, new_campaigns=0, version=storage.version)
+    
+    dates, campaign_ids, values = [], [], []
+    for i, record in enumerate(records):
+        try:
+            dates.append(date_to_ordinal(record["date"]))
+            campaign_ids.append(str(record["campaignId"]))
+            values.append([float(record.get(m) or 0) for m in METRIC_COLUMNS])
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"Invalid record {i}: {e!r}")
+    values = np.array(values, dtype=np.float64)
+    
+    with _ingest_lock:
+        _claim_snapshot()
+        rows, inserted, updated, new_campaigns = _upsert_facts(
+            np.asarray(dates, dtype=np.int64), np.asarray(campaign_ids),
+            {m: values[:, j] for j, m in enumerate(METRIC_COLUMNS)},
+        )
+    logger.info(f"📥 Ingested {rows} daily rows ({inserted} new, {updated} updated) -> v{storage.version}")
+    _save_snapshot_later()
+    
+    return IngestResult(
+        received=len(records),
+        inserted=inserted,
+        updated=updated,
+        new_campaigns=new_campaigns,
+        version=storage.version,
+    )
+
+
+def load_export(path: str, fmt: Optional[str] = None, chunk_rows: int = EXPORT_CHUNK_ROWS,
+                column_map: Optional[dict] = None, platform: Optional[str] = None,
+                progress: Optional[Callable[[LoadReport], None]] = None) -> LoadReport:
+    """Stream a CSV/NDJSON ad-platform export into the storage backend.
+    
+    The file is read `chunk_rows` rows at a time (see export_loader) and
+    summed per (date, campaign) pair: rows of the same campaign and day
+    (ad-set or ad-level exports) add up wherever they are in the file,
+    counted in `rows_combined`. The totals are written in one upsert once
+    the file is read, so the store is copied and the rollups updated once
+    per load; memory beyond the store grows with the distinct pairs, not
+    the rows. Stored pairs are replaced like in `ingest_daily_metrics`.
+    Campaigns and accounts named in the export that are not known yet get
+    records. Read progress and throughput are logged per chunk and passed to
+    `progress`. Raises ValueError for unreadable exports, before anything
+    is written.
+    """
+    report = LoadReport(path=path, total_bytes=os.path.getsize(path))
+    totals = ExportTotals()
+    for chunk in read_export(path, report, fmt=fmt, chunk_rows=chunk_rows, column_map=column_map,
+                             platform=platform):
+        totals.add(chunk)
+        report.chunks += 1
+        report.seconds = time.monotonic() - report.started
+        stats = report.to_dict()
+        logger.info(
+            f"📥 {os.path.basename(path)}: {report.rows_read:,} rows ({stats['progress']:.0%}), "
+            f"{stats['rowsPerSecond']:,} rows/s, {stats['mbPerSecond']} MB/s"
+        )
+        if progress:
+            progress(report)
+    
+    date_ord, campaign_ids, metrics = totals.columns()
+    report.rows_combined = totals.rows - len(date_ord)
+    if len(date_ord):
+        with _ingest_lock:
+            _claim_snapshot()
+            report.rows_written, report.inserted, report.updated, report.new_campaigns = _upsert_facts(
+                date_ord, campaign_ids, metrics, list(totals.accounts.values()), list(totals.campaigns.values())
+            )
+    
+    report.seconds = time.monotonic() - report.started
+    report.version = storage.version
+    logger.info(
+        f"✅ Loaded {path}: {report.rows_written:,} rows written ({report.inserted:,} new, "
+        f"{report.updated:,} updated, {report.rows_skipped:,} skipped) in {report.seconds:.1f}s"
+    )
+    if report.rows_combined:
+        logger.warning(
+            f"⚠️ {path}: {report.rows_combined:,} rows repeated the campaign and day of an earlier row "
+            f"and were summed into it (ad-set or ad-level export?)"
+        )
+    _save_snapshot_later()
+    return report
+
+
+def calculate_metrics(data, metrics: Optional[list] = None) -> MetricsResult:
+    """Calculate derived metrics over data rows (API behind CalculateMetricsTool).
+    
+    `data` is a list of row dicts, or a columnar table as taken by
+    `calculate_group_metrics`. Undefined ratios (denominator 0) are 0.
+    """
+    table = data if isinstance(data, dict) else _rows_to_table(data)
+    overall = calculate_group_metrics(
+        table, metrics=metrics if metrics is not None else ["cpc", "roas", "cpa"], undefined=np.nan
+    )
+    return MetricsResult(
+        metrics={name: _python_ratio(v[0]) for name, v in overall.metrics.items()},
+        totals={m: overall.totals[m][0].item() for m in _KPI_INPUTS},
+    )
+
+
+# Base metrics the KPI formulas read, in the order of MetricsResult.totals
+_KPI_INPUTS = ("clicks", "impressions", "cost", "revenue", "conversions")
+
+
+def _rows_to_table(data: list) -> dict:
+    """Columnar table from row dicts; a missing metric counts as 0."""
+    return {m: [d.get(m, 0) for d in data] for m in _KPI_INPUTS}
+
+
+def _python_ratio(value: np.floating):
+    # Plain float, or int 0 for undefined ratios (as the scalar formulas returned)
+    return 0 if value != value else value.item()
+
+
+@dataclass
+class GroupMetricsResult:
+    """Structured result of `calculate_group_metrics`.
+    
+    `groups` holds the labels in order of first appearance; `metrics` and
+    `totals` hold one array per name, aligned with them.
+    """
+    groups: list
+    metrics: dict
+    totals: dict
+    
+    def to_dict(self) -> dict:
+        metrics = {name: v.tolist() for name, v in self.metrics.items()}
+        totals = {m: self.totals[m].tolist() for m in _KPI_INPUTS}
+        return {
+            "groups": [
+                {
+                    "group": label,
+                    "metrics": {name: values[i] for name, values in metrics.items()},
+                    "totals": {m: values[i] for m, values in totals.items()},
+                }
+                for i, label in enumerate(self.groups)
+            ]
+        }
+
+
+def calculate_group_metrics(table: dict, groups=None, metrics: Optional[list] = None,
+                            undefined: float = 0.0) -> GroupMetricsResult:
+    """Derived metrics for every group of a columnar table in one vectorized pass.
+    
+    Args:
+        table: base metric name -> column (list or array); missing columns
+            and null cells count as 0, other columns are ignored
+        groups: label of each row, or None for a single group over all rows
+        metrics: derived metrics to compute (cpc, ctr, roas, cpa, roi)
+        undefined: value of ratios whose denominator is not positive
+    """
+    requested = metrics if metrics is not None else ["cpc", "roas", "cpa"]
+    names = [name for name in DERIVED_METRICS if name in requested]
+    given = {m: np.asarray(table[m]) for m in METRIC_COLUMNS if m in table}
+    lengths = {len(column) for column in given.values()} | ({len(groups)} if groups is not None else set())
+    if len(lengths) > 1:
+        raise ValueError(f"columns and groups differ in length: {sorted(lengths)}")
+    n = lengths.pop() if lengths else 0
+    
+    columns = {}
+    for m in METRIC_COLUMNS:
+        column = given.get(m)
+        if column is None or not n:
+            column = np.zeros(n, dtype=np.int64)
+        elif column.dtype.kind not in "iuf":
+            # Mixed or null cells: nulls count as 0
+            column = np.nan_to_num(column.astype(np.float64))
+        columns[m] = column
+    
+    if groups is None:
+        codes = np.zeros(n, dtype=np.int64)
+    else:
+        labels, codes = np.unique(np.asarray(groups), return_inverse=True)
+    # Sum each base column per group (integer columns stay exact), in first-appearance order
+    grouped = aggregate([codes.reshape(-1)], columns)
+    grouped = grouped.take(np.argsort(grouped.first, kind="stable"))
+    totals = grouped.totals
+    if groups is None and n == 0:
+        totals = {m: np.zeros(1, dtype=np.int64) for m in METRIC_COLUMNS}
+    ratios = derived_metrics(totals, names)
+    if undefined == undefined:  # not NaN
+        ratios = {name: np.nan_to_num(v, nan=undefined) for name, v in ratios.items()}
+    
+    group_labels = [None] if groups is None else labels[grouped.keys[0]].tolist()
+    return GroupMetricsResult(groups=group_labels, metrics=ratios, totals=totals)
+
+
 class QueryAdsCampaignsTool(BaseTool):
     """Tool for querying ads campaign data."""
     
@@ -91,7 +1137,18 @@ class QueryAdsCampaignsTool(BaseTool):
     - campaign_ids: list of campaign IDs to filter
     - program: affiliate program name (e.g. "Shopee", "Binance")
     - keywords: list of keywords to filter campaigns by (partial match)
-    - group_by: "day", "week", or "month"
+    - group_by: "day", "week", "month", "account" or "campaign"
+    - breakdown: "account" or "campaign" to split each time bucket per entity
+      (daily buckets unless group_by is "week" or "month")
+    - sort_by: metric to rank accounts/campaigns by (cost, revenue, clicks,
+      impressions, conversions, cpc, ctr, roas, cpa, roi); default cost
+    - sort_order: "desc" (default) or "asc"
+    - limit: number of top entities to return (default 10 for "campaign")
+    - compare_date_range: a second period (e.g. "tháng trước") to compare
+      date_range against; returns both periods aligned with absolute and %
+      deltas per metric
+    - approximate: true to estimate totals from a sample for long ranges
+      (trend shape only); adds an "approximation" block with error bounds
     
     Returns aggregated performance data suitable for charts."""
     
@@ -101,252 +1158,18 @@ class QueryAdsCampaignsTool(BaseTool):
         except json.JSONDecodeError:
             params = {"date_range": query}
         
-        date_range = params.get("date_range", "last 30 days")
-        account_ids = params.get("account_ids", [])
-        campaign_ids = params.get("campaign_ids", [])
-        program_filter = params.get("program")
-        keyword_filters = params.get("keywords", [])
-        group_by = params.get("group_by", "day")
-        
-        start_date, end_date = parse_date_range(date_range)
-        
-        # Get all campaigns first to filter
-        filtered_campaigns = db.campaigns
-        
-        if account_ids:
-            filtered_campaigns = [c for c in filtered_campaigns if c["accountId"] in account_ids]
-        
-        if campaign_ids:
-            filtered_campaigns = [c for c in filtered_campaigns if c["id"] in campaign_ids]
-            
-        if program_filter:
-            filtered_campaigns = [c for c in filtered_campaigns if program_filter.lower() in c["program"].lower()]
-            
-        if keyword_filters:
-            # Campaign matches if ANY of its keywords match ANY of the filter keywords
-            filtered_campaigns = [
-                c for c in filtered_campaigns 
-                if any(
-                    k_filter.lower() in k_camp.lower() 
-                    for k_camp in c["keywords"] 
-                    for k_filter in keyword_filters
-                ) or any(k_filter.lower() in c["name"].lower() for k_filter in keyword_filters)
-            ]
-            
-        filtered_camp_ids = set(c["id"] for c in filtered_campaigns)
-        
-        # Filter daily data
-        relevant_data = [
-            d for d in db.daily_data 
-            if d["campaignId"] in filtered_camp_ids 
-            and start_date <= d["date"] <= end_date
-        ]
-        
-        # Aggregate by date
-        aggregated = {}
-        for record in relevant_data:
-            date_key = record["date"]
-            if date_key not in aggregated:
-                aggregated[date_key] = {
-                    "date": date_key,
-                    "clicks": 0,
-                    "impressions": 0,
-                    "cost": 0,
-                    "conversions": 0,
-                    "revenue": 0
-                }
-            aggregated[date_key]["clicks"] += record["clicks"]
-            aggregated[date_key]["impressions"] += record["impressions"]
-            aggregated[date_key]["cost"] += record["cost"]
-            aggregated[date_key]["conversions"] += record["conversions"]
-            aggregated[date_key]["revenue"] += record["revenue"]
-        
-        # Add calculated metrics to each day
-        for date_key, day in aggregated.items():
-            clicks = day["clicks"]
-            impressions = day["impressions"]
-            cost = day["cost"]
-            revenue = day["revenue"]
-            conversions = day["conversions"]
-            
-            # Calculate CPC, CTR, ROAS, CPA
-            day["cpc"] = round(cost / clicks, 0) if clicks > 0 else 0
-            day["ctr"] = round((clicks / impressions * 100), 2) if impressions > 0 else 0
-            day["roas"] = round(revenue / cost, 2) if cost > 0 else 0
-            day["cpa"] = round(cost / conversions, 0) if conversions > 0 else 0
-        
-        result = sorted(aggregated.values(), key=lambda x: x["date"])
-        
-        # Group by week/month if needed
-        # Group by week/month/account/campaign if needed
-        if group_by == "week":
-            weekly = {}
-            for day in result:
-                dt = datetime.strptime(day["date"], "%Y-%m-%d")
-                week_start = dt - timedelta(days=dt.weekday())
-                week_key = week_start.strftime("%Y-%m-%d")
-                if week_key not in weekly:
-                    weekly[week_key] = {"date": week_key, "clicks": 0, "impressions": 0, "cost": 0, "conversions": 0, "revenue": 0}
-                for metric in ["clicks", "impressions", "cost", "conversions", "revenue"]:
-                    weekly[week_key][metric] += day[metric]
-            # Calculate metrics for weekly
-            for week in weekly.values():
-                week["cpc"] = round(week["cost"] / week["clicks"], 0) if week["clicks"] > 0 else 0
-                week["ctr"] = round((week["clicks"] / week["impressions"] * 100), 2) if week["impressions"] > 0 else 0
-                week["roas"] = round(week["revenue"] / week["cost"], 2) if week["cost"] > 0 else 0
-                week["cpa"] = round(week["cost"] / week["conversions"], 0) if week["conversions"] > 0 else 0
-            result = sorted(weekly.values(), key=lambda x: x["date"])
-        elif group_by == "month":
-            monthly = {}
-            for day in result:
-                month_key = day["date"][:7] + "-01"
-                if month_key not in monthly:
-                    monthly[month_key] = {"date": month_key, "clicks": 0, "impressions": 0, "cost": 0, "conversions": 0, "revenue": 0}
-                for metric in ["clicks", "impressions", "cost", "conversions", "revenue"]:
-                    monthly[month_key][metric] += day[metric]
-            # Calculate metrics for monthly
-            for month in monthly.values():
-                month["cpc"] = round(month["cost"] / month["clicks"], 0) if month["clicks"] > 0 else 0
-                month["ctr"] = round((month["clicks"] / month["impressions"] * 100), 2) if month["impressions"] > 0 else 0
-                month["roas"] = round(month["revenue"] / month["cost"], 2) if month["cost"] > 0 else 0
-                month["cpa"] = round(month["cost"] / month["conversions"], 0) if month["conversions"] > 0 else 0
-            result = sorted(monthly.values(), key=lambda x: x["date"])
-        elif group_by == "account":
-            # Re-aggregate original data by account
-            by_account = {}
-            # We need to map campaign IDs back to account names
-            camp_to_acc = {c["id"]: next((a["name"] for a in db.accounts if a["id"] == c["accountId"]), "Unknown") for c in db.campaigns}
-            
-            for record in relevant_data:
-                acc_name = camp_to_acc.get(record["campaignId"], "Unknown")
-                if acc_name not in by_account:
-                    by_account[acc_name] = {"date": acc_name, "clicks": 0, "impressions": 0, "cost": 0, "conversions": 0, "revenue": 0}
-                for metric in ["clicks", "impressions", "cost", "conversions", "revenue"]:
-                    by_account[acc_name][metric] += record[metric]
-            
-            for acc in by_account.values():
-                acc["cpc"] = round(acc["cost"] / acc["clicks"], 0) if acc["clicks"] > 0 else 0
-                acc["ctr"] = round((acc["clicks"] / acc["impressions"] * 100), 2) if acc["impressions"] > 0 else 0
-                acc["roas"] = round(acc["revenue"] / acc["cost"], 2) if acc["cost"] > 0 else 0
-                acc["cpa"] = round(acc["cost"] / acc["conversions"], 0) if acc["conversions"] > 0 else 0
-            result = list(by_account.values())
-
-        elif group_by == "campaign":
-             # Re-aggregate original data by campaign
-            by_campaign = {}
-            camp_map = {c["id"]: c["name"] for c in db.campaigns}
-            
-            for record in relevant_data:
-                camp_name = camp_map.get(record["campaignId"], "Unknown")
-                if camp_name not in by_campaign:
-                    by_campaign[camp_name] = {"date": camp_name, "clicks": 0, "impressions": 0, "cost": 0, "conversions": 0, "revenue": 0}
-                for metric in ["clicks", "impressions", "cost", "conversions", "revenue"]:
-                    by_campaign[camp_name][metric] += record[metric]
-            
-            for camp in by_campaign.values():
-                camp["cpc"] = round(camp["cost"] / camp["clicks"], 0) if camp["clicks"] > 0 else 0
-                camp["ctr"] = round((camp["clicks"] / camp["impressions"] * 100), 2) if camp["impressions"] > 0 else 0
-                camp["roas"] = round(camp["revenue"] / camp["cost"], 2) if camp["cost"] > 0 else 0
-                camp["cpa"] = round(camp["cost"] / camp["conversions"], 0) if camp["conversions"] > 0 else 0
-            
-            # Sort by spend (cost) desc to show top campaigns
-            result = sorted(by_campaign.values(), key=lambda x: x["cost"], reverse=True)[:10]
-
-        
-        # Helper to get entity name
-        def get_entity_name(camp_id, breakdown_type):
-            if breakdown_type == "account":
-                return camp_to_acc.get(camp_id, "Unknown")
-            elif breakdown_type == "campaign":
-                return camp_map.get(camp_id, "Unknown")
-            return "Unknown"
-
-        # Handle Breakdown (Granular Data for Multi-line Charts)
-        breakdown_by = params.get("breakdown")
-        if breakdown_by in ["account", "campaign"]:
-            # Need granular data: Date + Entity + Metrics
-            camp_map = {c["id"]: c["name"] for c in db.campaigns}
-            camp_to_acc = {c["id"]: next((a["name"] for a in db.accounts if a["id"] == c["accountId"]), "Unknown") for c in db.campaigns}
-            
-            granular_data = {} # Key: date_entity
-            
-            for record in relevant_data:
-                date_key = record["date"]
-                entity_name = get_entity_name(record["campaignId"], breakdown_by)
-                key = f"{date_key}_{entity_name}"
-                
-                if key not in granular_data:
-                    granular_data[key] = {
-                        "date": date_key,
-                        "entity": entity_name,
-                        "clicks": 0, "impressions": 0, "cost": 0, "conversions": 0, "revenue": 0
-                    }
-                
-                for metric in ["clicks", "impressions", "cost", "conversions", "revenue"]:
-                    granular_data[key][metric] += record[metric]
-            
-            # Convert to list and calculate derived metrics
-            result = []
-            for item in granular_data.values():
-                item["cpc"] = round(item["cost"] / item["clicks"], 0) if item["clicks"] > 0 else 0
-                item["ctr"] = round((item["clicks"] / item["impressions"] * 100), 2) if item["impressions"] > 0 else 0
-                item["roas"] = round(item["revenue"] / item["cost"], 2) if item["cost"] > 0 else 0
-                item["cpa"] = round(item["cost"] / item["conversions"], 0) if item["conversions"] > 0 else 0
-                result.append(item)
-            
-            result.sort(key=lambda x: x["date"])
-            
-            # Return granular data directly
-            # Summary calculation remains the same
-            total_clicks = sum(d["clicks"] for d in result)
-            total_cost = sum(d["cost"] for d in result)
-            total_revenue = sum(d["revenue"] for d in result)
-            total_conversions = sum(d["conversions"] for d in result)
-            total_impressions = sum(d["impressions"] for d in result)
-            
-            return json.dumps({
-                "data": result,
-                "dateRange": {"start": start_date, "end": end_date},
-                "totalRecords": len(result),
-                "is_granular": True,
-                "breakdown": breakdown_by,
-                "summary": {
-                    "totalClicks": total_clicks,
-                    "totalCost": total_cost,
-                    "totalRevenue": total_revenue,
-                    "totalConversions": total_conversions,
-                    "totalImpressions": total_impressions,
-                    "avgCPC": round(total_cost / total_clicks, 0) if total_clicks > 0 else 0,
-                    "avgCTR": round((total_clicks / total_impressions * 100), 2) if total_impressions > 0 else 0,
-                    "avgROAS": round(total_revenue / total_cost, 2) if total_cost > 0 else 0,
-                    "avgCPA": round(total_cost / total_conversions, 0) if total_conversions > 0 else 0
-                }
-            }, ensure_ascii=False)
-
-        
-        # Calculate summary
-        total_clicks = sum(d["clicks"] for d in result)
-        total_cost = sum(d["cost"] for d in result)
-        total_revenue = sum(d["revenue"] for d in result)
-        total_conversions = sum(d["conversions"] for d in result)
-        total_impressions = sum(d["impressions"] for d in result)
-        
-        return json.dumps({
-            "data": result,
-            "dateRange": {"start": start_date, "end": end_date},
-            "totalRecords": len(result),
-            "summary": {
-                "totalClicks": total_clicks,
-                "totalCost": total_cost,
-                "totalRevenue": total_revenue,
-                "totalConversions": total_conversions,
-                "totalImpressions": total_impressions,
-                "avgCPC": round(total_cost / total_clicks, 0) if total_clicks > 0 else 0,
-                "avgCTR": round((total_clicks / total_impressions * 100), 2) if total_impressions > 0 else 0,
-                "avgROAS": round(total_revenue / total_cost, 2) if total_cost > 0 else 0,
-                "avgCPA": round(total_cost / total_conversions, 0) if total_conversions > 0 else 0
-            }
-        }, ensure_ascii=False)
+        campaign_query = CampaignQuery.from_params(params)
+        if params.get("compare_date_range"):
+            group_by = campaign_query.group_by
+            result = compare_periods(
+                campaign_query,
+                parse_date_range(campaign_query.date_range),
+                parse_date_range(params["compare_date_range"]),
+                time_grain=group_by if group_by in ["day", "week", "month"] and "group_by" in params else None,
+            )
+        else:
+            result = query_ads_campaigns(campaign_query)
+        return json.dumps(result.to_dict(), ensure_ascii=False)
 
 
 class QueryAccountsTool(BaseTool):
@@ -354,15 +1177,30 @@ class QueryAccountsTool(BaseTool):
     
     name: str = "query_accounts"
     description: str = """Query ad account information.
-    Returns list of connected ad accounts with their status and platform."""
+    Input can be a JSON with paging options:
+    - sort_by: "id", "name", "status" or "platform"
+    - sort_order: "asc" or "desc"
+    - page_size: accounts per page
+    - cursor: nextCursor from a previous call, to fetch the next page
+    
+    Returns one page of connected ad accounts with their status and platform."""
     
     def _run(self, query: str = "") -> str:
-        accounts = db.accounts
-        return json.dumps({
-            "accounts": accounts,
-            "totalAccounts": len(accounts),
-            "activeAccounts": len([a for a in accounts if a["status"] == "active"])
-        }, ensure_ascii=False)
+        try:
+            params = json.loads(query) if query.strip().startswith("{") else {}
+        except json.JSONDecodeError:
+            params = {}
+        
+        try:
+            result = list_accounts(
+                sort_by=params.get("sort_by"),
+                sort_order=params.get("sort_order", "asc"),
+                page_size=params.get("page_size"),
+                cursor=params.get("cursor"),
+            )
+        except ValueError as e:
+            return json.dumps({"error": str(e)})
+        return json.dumps(result.to_dict(), ensure_ascii=False)
 
 
 class QueryCampaignListTool(BaseTool):
@@ -374,8 +1212,13 @@ class QueryCampaignListTool(BaseTool):
     - account_id: filter by account
     - program: filter by affiliate program name
     - keyword: filter by keyword (partial match)
+    and paging options:
+    - sort_by: "id", "name", "program", "accountId" or "status"
+    - sort_order: "asc" or "desc"
+    - page_size: campaigns per page
+    - cursor: nextCursor from a previous call, to fetch the next page
     
-    Returns campaign list with names, programs, and keywords."""
+    Returns one page of campaigns with names, programs, and keywords."""
     
     def _run(self, query: str = "") -> str:
         try:
@@ -383,29 +1226,19 @@ class QueryCampaignListTool(BaseTool):
         except json.JSONDecodeError:
             params = {}
         
-        campaigns = db.campaigns
-        
-        if params.get("account_id"):
-            campaigns = [c for c in campaigns if c["accountId"] == params["account_id"]]
-        if params.get("program"):
-            campaigns = [c for c in campaigns if params["program"].lower() in c["program"].lower()]
-        if params.get("keyword"):
-            kw = params["keyword"].lower()
-            campaigns = [c for c in campaigns if any(kw in k.lower() for k in c["keywords"]) or kw in c["name"].lower()]
-        
-        result = [{
-            "id": c["id"],
-            "name": c["name"],
-            "program": c["program"],
-            "keywords": c["keywords"],
-            "accountId": c["accountId"],
-            "status": c.get("status", "active")
-        } for c in campaigns]
-        
-        return json.dumps({
-            "campaigns": result,
-            "totalCampaigns": len(result)
-        }, ensure_ascii=False)
+        try:
+            result = list_campaigns(
+                account_id=params.get("account_id"),
+                program=params.get("program"),
+                keyword=params.get("keyword"),
+                sort_by=params.get("sort_by"),
+                sort_order=params.get("sort_order", "asc"),
+                page_size=params.get("page_size"),
+                cursor=params.get("cursor"),
+            )
+        except ValueError as e:
+            return json.dumps({"error": str(e)})
+        return json.dumps(result.to_dict(), ensure_ascii=False)
 
 
 class CalculateMetricsTool(BaseTool):
@@ -416,8 +1249,12 @@ class CalculateMetricsTool(BaseTool):
     Input should be a JSON with:
     - data: array of data points with clicks, cost, revenue, conversions
     - metrics: list of metrics to calculate (cpc, ctr, roas, cpa, roi)
+    Or, for per-group metrics in one call:
+    - table: {"clicks": [...], "cost": [...], ...} metric columns
+    - groups: label of each table row (e.g. account name)
+    - metrics: as above
     
-    Returns calculated metrics."""
+    Returns calculated metrics (per group for a table)."""
     
     def _run(self, query: str) -> str:
         try:
@@ -425,38 +1262,15 @@ class CalculateMetricsTool(BaseTool):
         except json.JSONDecodeError:
             return json.dumps({"error": "Invalid JSON input"})
         
-        data = params.get("data", [])
-        metrics_to_calc = params.get("metrics", ["cpc", "roas", "cpa"])
-        
-        total_clicks = sum(d.get("clicks", 0) for d in data)
-        total_impressions = sum(d.get("impressions", 0) for d in data)
-        total_cost = sum(d.get("cost", 0) for d in data)
-        total_revenue = sum(d.get("revenue", 0) for d in data)
-        total_conversions = sum(d.get("conversions", 0) for d in data)
-        
-        result = {}
-        
-        if "cpc" in metrics_to_calc:
-            result["cpc"] = total_cost / total_clicks if total_clicks > 0 else 0
-        if "ctr" in metrics_to_calc:
-            result["ctr"] = (total_clicks / total_impressions * 100) if total_impressions > 0 else 0
-        if "roas" in metrics_to_calc:
-            result["roas"] = total_revenue / total_cost if total_cost > 0 else 0
-        if "cpa" in metrics_to_calc:
-            result["cpa"] = total_cost / total_conversions if total_conversions > 0 else 0
-        if "roi" in metrics_to_calc:
-            result["roi"] = ((total_revenue - total_cost) / total_cost * 100) if total_cost > 0 else 0
-        
-        return json.dumps({
-            "metrics": result,
-            "totals": {
-                "clicks": total_clicks,
-                "impressions": total_impressions,
-                "cost": total_cost,
-                "revenue": total_revenue,
-                "conversions": total_conversions
-            }
-        }, ensure_ascii=False)
+        metrics = params.get("metrics", ["cpc", "roas", "cpa"])
+        if isinstance(params.get("table"), dict):
+            try:
+                result = calculate_group_metrics(params["table"], params.get("groups"), metrics)
+            except (TypeError, ValueError) as e:
+                return json.dumps({"error": f"Invalid table: {e}"})
+        else:
+            result = calculate_metrics(params.get("data", []), metrics)
+        return json.dumps(result.to_dict(), ensure_ascii=False)
 
 
 # Export all tools
@@ -0,0 +1,143 @@
+"""
+Dimension Tables for Accounts and Campaigns
+
+Builds dense id -> code and code -> name maps for accounts and campaigns
+once, instead of every query re-scanning `db.accounts` / `db.campaigns`.
+The tables are shared by all data tools and rebuilt only when the
+underlying lists change.
+"""
+
+from typing import Iterable, Optional
+
+import numpy as np
+
+from keyword_index import CampaignSearchIndex
+from pagination import sort_order
+
+UNKNOWN_LABEL = "Unknown"
+
+
+class DimensionTables:
+    """Dense lookups over accounts and campaigns.
+
+    Campaign codes follow `campaign_ids` (the fact store's code space).
+    Account codes follow `accounts`; account ids referenced by campaigns but
+    missing from `accounts` get their own codes labelled "Unknown", and
+    campaigns that only exist in the fact data share a final orphan code.
+    Records are `entities.Account` / `entities.Campaign`.
+    """
+
+    def __init__(self, accounts: list, campaigns: list, campaign_ids: list):
+        self.accounts = accounts
+        self.account_ids = []
+        self.account_index = {}
+        self.account_names = []
+        for a in accounts:
+            if a.id not in self.account_index:
+                self._add_account(a.id, a.name)
+
+        campaign_records = {}
+        for c in campaigns:
+            campaign_records.setdefault(c.id, c)
+            if c.account_id not in self.account_index:
+                self._add_account(c.account_id, UNKNOWN_LABEL)
+
+        self.orphan_account = len(self.account_ids)
+        self.account_names.append(UNKNOWN_LABEL)
+
+        self.campaign_ids = list(campaign_ids)
+        self.campaign_index = {cid: i for i, cid in enumerate(self.campaign_ids)}
+        self.campaigns = [campaign_records.get(cid) for cid in self.campaign_ids]
+        self.campaign_names = [c.name if c else UNKNOWN_LABEL for c in self.campaigns]
+        self.known_campaigns = np.asarray([i for i, c in enumerate(self.campaigns) if c], dtype=np.int64)
+        self.campaign_account = np.array(
+            [self.account_index[c.account_id] if c else self.orphan_account for c in self.campaigns],
+            dtype=np.int64,
+        )
+
+        self.active_accounts = sum(1 for a in accounts if a.status == "active")
+        self._labels = {}
+        self._search_index = None
+        self._rankings = {}
+
+    def _add_account(self, account_id: str, name: str):
+        self.account_index[account_id] = len(self.account_ids)
+        self.account_ids.append(account_id)
+        self.account_names.append(name)
+
+    def account_codes(self, account_ids: Iterable[str]) -> np.ndarray:
+        """Codes of the given account ids, skipping unknown ids."""
+        return np.asarray(
+            sorted({self.account_index[a] for a in account_ids if a in self.account_index}),
+            dtype=np.int64,
+        )
+
+    def campaigns_for_accounts(self, account_ids: Iterable[str]) -> np.ndarray:
+        """Codes of campaigns belonging to any of the given accounts, ascending."""
+        return np.flatnonzero(np.isin(self.campaign_account, self.account_codes(account_ids)))
+
+    def campaign_codes(self, campaign_ids: Iterable[str]) -> np.ndarray:
+        """Codes of the given campaign ids, skipping unknown ids."""
+        return np.asarray(
+            sorted({self.campaign_index[c] for c in campaign_ids if c in self.campaign_index}),
+            dtype=np.int64,
+        )
+
+    def search_index(self) -> CampaignSearchIndex:
+        """Keyword/name/program substring index, built on first use."""
+        if self._search_index is None:
+            self._search_index = CampaignSearchIndex(self.campaigns)
+        return self._search_index
+
+    def ranking(self, entity_type: str, sort_by: Optional[str], descending: bool = False) -> tuple:
+        """(ranks, order) over `accounts` positions or campaign codes, cached per sort."""
+        key = (entity_type, sort_by, descending)
+        if key not in self._rankings:
+            records = self.accounts if entity_type == "account" else self.campaigns
+            self._rankings[key] = sort_order(records, sort_by, descending)
+        return self._rankings[key]
+
+    def labels(self, entity_type: str) -> tuple[np.ndarray, Optional[np.ndarray], list]:
+        """Name codes for grouping by account or campaign name.
+
+        Returns (campaign_codes, account_codes, names) where `campaign_codes[c]`
+        and `account_codes[a]` index into `names`. `account_codes` is None for
+        campaign labels. Entities sharing a name share a code.
+        """
+        if entity_type not in self._labels:
+            names = []
+            name_codes = {}
+
+            def encode(labels):
+                codes = np.empty(len(labels), dtype=np.int64)
+                for i, label in enumerate(labels):
+                    if label not in name_codes:
+                        name_codes[label] = len(names)
+                        names.append(label)
+                    codes[i] = name_codes[label]
+                return codes
+
+            if entity_type == "account":
+                account_codes = encode(self.account_names)
+                self._labels[entity_type] = (account_codes[self.campaign_account], account_codes, names)
+            else:
+                self._labels[entity_type] = (encode(self.campaign_names), None, names)
+        return self._labels[entity_type]
+
+
+_tables: Optional[DimensionTables] = None
+_signature: Optional[tuple] = None
+
+
+def get_dimensions(db, campaign_ids: list) -> DimensionTables:
+    """Return the shared dimension tables, rebuilding them if `db` changed."""
+    global _tables, _signature
+    signature = (
+        id(db.accounts), len(db.accounts),
+        id(db.campaigns), len(db.campaigns),
+        len(campaign_ids),
+    )
+    if _tables is None or signature != _signature:
+        _tables = DimensionTables(db.accounts, db.campaigns, campaign_ids)
+        _signature = signature
+    return _tables
@@ -0,0 +1,113 @@
+"""
+Time-Series Downsampling for Chart Payloads
+
+A chart a few hundred pixels wide cannot show more points than it has
+pixels, so long daily series are reduced before serialization:
+
+- "lttb": Largest-Triangle-Three-Buckets keeps the points that best
+  preserve the visual shape of the line.
+- "minmax": keeps the minimum and maximum of each bucket, so spikes and
+  dips are never lost.
+
+Rows are shared by every series of a chart (pivoted multi-series rows), so
+each series picks its points from its share of the budget and the chart
+keeps the union of the picked rows.
+"""
+
+import os
+from datetime import datetime
+
+import numpy as np
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+# Maximum chart rows sent to the frontend, and the method used to pick them
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "500"))
+CHART_DOWNSAMPLE = os.getenv("CHART_DOWNSAMPLE", "lttb")
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, target: int) -> np.ndarray:
+    """Indices of `target` points chosen by Largest-Triangle-Three-Buckets.
+
+    Always keeps the first and last point. `x` must be ascending.
+    """
+    n = len(y)
+    if target >= n:
+        return np.arange(n)
+    if target < 3:
+        return np.array([0, n - 1], dtype=np.int64)[:target]
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (target - 2)
+    selected = np.empty(target, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(target - 2):
+        # The third triangle vertex is the average of the next bucket
+        next_start = int((i + 1) * every) + 1
+        next_stop = min(int((i + 2) * every) + 1, n)
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+
+        start = int(i * every) + 1
+        stop = int((i + 1) * every) + 1
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:stop] - y[a])
+            - (x[a] - x[start:stop]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y: np.ndarray, target: int) -> np.ndarray:
+    """Indices of the minimum and maximum of equal buckets, plus both ends (at most `target`)."""
+    n = len(y)
+    if target >= n:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=np.float64)
+    n_buckets = (target - 2) // 2
+    if n_buckets < 1:
+        return np.array([0, n - 1], dtype=np.int64)[:max(target, 0)]
+    edges = np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+    picked = [0, n - 1]
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop > start:
+            picked.append(start + int(np.argmin(y[start:stop])))
+            picked.append(start + int(np.argmax(y[start:stop])))
+    return np.unique(picked)
+
+
+def _x_values(rows: list, x_key: str) -> np.ndarray:
+    """Day numbers for ISO-date x values, otherwise row positions."""
+    try:
+        return np.array([datetime.strptime(r[x_key], "%Y-%m-%d").toordinal() for r in rows], dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        return np.arange(len(rows), dtype=np.float64)
+
+
+def downsample_rows(rows: list, x_key: str, series_keys: list, target: int = CHART_MAX_POINTS,
+                    method: str = CHART_DOWNSAMPLE) -> list:
+    """Reduce chart rows (sorted by `x_key`) to at most about `target` rows.
+
+    Each series gets an equal share of the budget; missing values count as
+    0. Returns `rows` unchanged when it is already small enough.
+    """
+    if target <= 0 or len(rows) <= target or not series_keys:
+        return rows
+
+    x = _x_values(rows, x_key)
+    budget = max(target // len(series_keys), 3)
+    keep = set()
+    for key in series_keys:
+        y = np.array([r.get(key) or 0 for r in rows], dtype=np.float64)
+        if method == "minmax":
+            picked = minmax_indices(y, budget)
+        else:
+            picked = lttb_indices(x, y, budget)
+        keep.update(picked.tolist())
+    return [rows[i] for i in sorted(keep)]
@@ -0,0 +1,154 @@
+"""
+Compact Account and Campaign Records
+
+A worker can hold hundreds of thousands of campaigns, so entity records are
+slotted objects rather than dicts: no per-record hash table or key strings,
+and every string value is interned, so repeated values (account ids on
+campaigns, programs, statuses, platforms, keywords, recurring names) are
+one shared object. Keywords are tuples.
+
+The data tools read the attributes directly. Dicts are built at the
+serialization boundary only: `to_dict()` is the API shape (camelCase keys,
+the known fields only), and `to_record()` is what snapshots and the SQL
+stores persist, which also keeps the keys a source adds beyond the known
+fields (held in `extra`) so they are written back unchanged. An account
+without a status or platform stays without one.
+"""
+
+import sys
+from typing import Iterable, Optional
+
+
+def _interned(value) -> str:
+    return sys.intern(str(value)) if value is not None else ""
+
+
+def _interned_optional(value) -> Optional[str]:
+    return sys.intern(str(value)) if value is not None else None
+
+
+def _extra(record: dict, fields: dict) -> Optional[dict]:
+    extra = {k: v for k, v in record.items() if k not in fields}
+    return extra or None
+
+
+class Account:
+    """An ad account."""
+
+    __slots__ = ("id", "name", "status", "platform", "extra")
+
+    # JSON key -> attribute, in serialization order
+    FIELDS = {"id": "id", "name": "name", "status": "status", "platform": "platform"}
+
+    def __init__(self, id: str, name: str, status: Optional[str] = None, platform: Optional[str] = None,
+                 extra: Optional[dict] = None):
+        self.id = _interned(id)
+        self.name = _interned(name)
+        self.status = _interned_optional(status)
+        self.platform = _interned_optional(platform)
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, record: dict) -> "Account":
+        return cls(
+            record["id"],
+            record.get("name", record["id"]),
+            record.get("status"),
+            record.get("platform"),
+            _extra(record, cls.FIELDS),
+        )
+
+    def to_dict(self) -> dict:
+        record = {"id": self.id, "name": self.name}
+        if self.status is not None:
+            record["status"] = self.status
+        if self.platform is not None:
+            record["platform"] = self.platform
+        return record
+
+    def to_record(self) -> dict:
+        """`to_dict()` plus the source's extra keys, for persisting."""
+        record = self.to_dict()
+        if self.extra:
+            record.update(self.extra)
+        return record
+
+    def get(self, key: str, default=None):
+        """Dict-style read by JSON key (used by generic sorting)."""
+        if key in self.FIELDS:
+            return getattr(self, self.FIELDS[key])
+        return self.extra.get(key, default) if self.extra else default
+
+    def __repr__(self) -> str:
+        return f"Account({self.id!r}, {self.name!r})"
+
+
+class Campaign:
+    """An ad campaign; `account_id` is the owning account's id."""
+
+    __slots__ = ("id", "name", "program", "keywords", "account_id", "status", "extra")
+
+    # JSON key -> attribute, in serialization order
+    FIELDS = {
+        "id": "id", "name": "name", "program": "program", "keywords": "keywords",
+        "accountId": "account_id", "status": "status",
+    }
+
+    def __init__(self, id: str, account_id: str, name: str, program: str = "", keywords: Iterable[str] = (),
+                 status: str = "active", extra: Optional[dict] = None):
+        self.id = _interned(id)
+        self.account_id = _interned(account_id)
+        self.name = _interned(name)
+        self.program = _interned(program)
+        self.keywords = tuple(_interned(k) for k in keywords)
+        self.status = _interned(status)
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, record: dict) -> "Campaign":
+        return cls(
+            record["id"],
+            record["accountId"],
+            record.get("name", record["id"]),
+            record.get("program") or "",
+            record.get("keywords") or (),
+            record.get("status", "active"),
+            _extra(record, cls.FIELDS),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "program": self.program,
+            "keywords": list(self.keywords),
+            "accountId": self.account_id,
+            "status": self.status,
+        }
+
+    def to_record(self) -> dict:
+        """`to_dict()` plus the source's extra keys, for persisting."""
+        record = self.to_dict()
+        if self.extra:
+            record.update(self.extra)
+        return record
+
+    def get(self, key: str, default=None):
+        """Dict-style read by JSON key (used by generic sorting)."""
+        if key in self.FIELDS:
+            return getattr(self, self.FIELDS[key])
+        return self.extra.get(key, default) if self.extra else default
+
+    def __repr__(self) -> str:
+        return f"Campaign({self.id!r}, {self.name!r})"
+
+
+def account_records(records: Iterable) -> list:
+    """Accounts from JSON dicts (records that are already `Account`s pass through)."""
+    return [r if isinstance(r, Account) else Account.from_dict(r) for r in records]
+
+
+def campaign_records(records: Iterable) -> list:
+    """Campaigns from JSON dicts (records that are already `Campaign`s pass through)."""
+    return [r if isinstance(r, Campaign) else Campaign.from_dict(r) for r in records]
+
@@ -0,0 +1,379 @@
+"""
+Streaming Reader for Ad-Platform Exports
+
+Reads CSV or NDJSON exports (optionally gzip-compressed) in fixed-size
+chunks and maps their columns onto the campaign/account/daily schema:
+
+    date, campaignId            required
+    campaignName, accountId,    optional; used to create records for
+    accountName, program        campaigns and accounts not known yet
+    clicks, impressions, cost,  metrics; a missing column or value counts as 0
+    conversions, revenue
+
+Header names are matched case-insensitively against common export spellings
+("Campaign ID", "Amount spent", "cost_micros", ...). Each chunk is transposed
+into column arrays directly (CSV rows are never turned into dicts), so
+reading memory stays bounded by the chunk size however long the file is.
+
+Exports at ad-set or ad level have several rows per campaign and day, in
+any order. `ExportTotals` sums the chunks per (date, campaign) pair, so
+what is held grows with the distinct pairs rather than the rows.
+
+`data_tools.load_export` writes the totals into the storage backend; run
+`python export_loader.py <file>` to load a file from the command line.
+"""
+
+import gc
+import io
+import os
+import re
+import csv
+import gzip
+import json
+import time
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from itertools import islice, zip_longest
+from typing import Iterator, Optional
+
+import numpy as np
+
+from fact_store import METRIC_COLUMNS, dates_to_ordinals
+from aggregation import aggregate
+from entities import Account, Campaign
+
+logger = logging.getLogger("AI_AGENT")
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+# Rows read per chunk
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "200000"))
+
+# Folded header name -> (schema field, scale)
+COLUMN_ALIASES = {
+    **{name: ("date", 1) for name in ("date", "day", "date_start", "reporting_starts", "segments_date")},
+    **{name: ("campaignId", 1) for name in ("campaignid", "campaign_id")},
+    **{name: ("campaignName", 1) for name in ("campaign", "campaignname", "campaign_name")},
+    **{name: ("accountId", 1) for name in ("accountid", "account_id", "ad_account_id", "customer_id")},
+    **{name: ("accountName", 1) for name in ("account", "accountname", "account_name", "customer_name")},
+    "program": ("program", 1),
+    **{name: ("clicks", 1) for name in ("clicks", "link_clicks")},
+    **{name: ("impressions", 1) for name in ("impressions", "impr")},
+    **{name: ("cost", 1) for name in ("cost", "spend", "amount_spent")},
+    "cost_micros": ("cost", 1e-6),
+    **{name: ("conversions", 1) for name in ("conversions", "conv", "results", "purchases")},
+    **{name: ("revenue", 1) for name in ("revenue", "conversion_value", "conv_value", "purchase_value")},
+}
+
+_TEXT_FIELDS = ("campaignName", "accountId", "accountName", "program")
+
+
+def fold_header(name: str) -> str:
+    """'Campaign ID' -> 'campaign_id', 'metrics.cost_micros' -> 'cost_micros'."""
+    folded = re.sub(r"[^a-z0-9]+", "_", str(name).strip().lower()).strip("_")
+    return folded[len("metrics_"):] if folded.startswith("metrics_") else folded
+
+
+def map_columns(headers: list, column_map: Optional[dict] = None) -> dict:
+    """Schema field -> (header position, scale); `column_map` ({header: field}) overrides the aliases.
+
+    Raises ValueError if the required date or campaign id column is missing.
+    """
+    overrides = {fold_header(h): f for h, f in (column_map or {}).items()}
+    mapping = {}
+    for i, header in enumerate(headers):
+        folded = fold_header(header)
+        target = (overrides[folded], 1) if folded in overrides else COLUMN_ALIASES.get(folded)
+        if target and target[0] not in mapping:
+            mapping[target[0]] = (i, target[1])
+    missing = [f for f in ("date", "campaignId") if f not in mapping]
+    if missing:
+        raise ValueError(f"Export has no {' / '.join(missing)} column (headers: {headers})")
+    return mapping
+
+
+def _numeric(values, scale: float = 1) -> np.ndarray:
+    """Float column from raw values; blanks count as 0, thousands separators are dropped."""
+    try:
+        column = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        cleaned = np.char.replace(np.asarray(values, dtype=str), ",", "")
+        cleaned[np.char.strip(cleaned) == ""] = "0"
+        column = cleaned.astype(np.float64)
+    column = np.nan_to_num(column)
+    return column * scale if scale != 1 else column
+
+
+def _text(values) -> np.ndarray:
+    """String column from raw values; None becomes a blank."""
+    column = np.asarray(values, dtype=object)
+    column[np.equal(column, None)] = ""
+    return column.astype(str)
+
+
+@dataclass
+class ExportChunk:
+    """One chunk of an export as columns.
+
+    `accounts` / `campaigns` are `Account` / `Campaign` records built from
+    the optional entity columns (one per id in the chunk); the writer keeps
+    only unknown ones.
+    """
+    date_ord: np.ndarray
+    campaign_ids: np.ndarray
+    metrics: dict
+    accounts: list = field(default_factory=list)
+    campaigns: list = field(default_factory=list)
+
+
+@dataclass
+class LoadReport:
+    """Progress and throughput of one export load."""
+    path: str
+    total_bytes: int
+    bytes_read: int = 0
+    rows_read: int = 0
+    rows_skipped: int = 0
+    rows_combined: int = 0  # summed into another row of the same campaign and day
+    rows_written: int = 0
+    inserted: int = 0
+    updated: int = 0
+    new_campaigns: int = 0
+    chunks: int = 0
+    started: float = field(default_factory=time.monotonic)
+    seconds: float = 0.0
+    version: Optional[int] = None
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_read / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "rowsRead": self.rows_read,
+            "rowsSkipped": self.rows_skipped,
+            "rowsCombined": self.rows_combined,
+            "rowsWritten": self.rows_written,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "newCampaigns": self.new_campaigns,
+            "chunks": self.chunks,
+            "progress": round(self.bytes_read / self.total_bytes, 4) if self.total_bytes else 1.0,
+            "seconds": round(self.seconds, 2),
+            "rowsPerSecond": round(self.rows_per_second),
+            "mbPerSecond": round(self.bytes_read / 1e6 / self.seconds, 2) if self.seconds else 0.0,
+            "version": self.version,
+        }
+
+
+class ExportTotals:
+    """Metric sums per (date, campaign id) over the chunks of one export.
+
+    Chunks are appended as they arrive and merged into sorted totals once
+    the pending rows outnumber them, so each row is re-aggregated O(log)
+    times. Account and campaign records keep the first one seen per id.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.campaign_ids = []
+        self.accounts = {}
+        self.campaigns = {}
+        self._codes = {}
+        self._keys = np.empty(0, dtype=np.int64)  # date_ord << 32 | campaign code
+        self._totals = {m: np.empty(0) for m in METRIC_COLUMNS}
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, chunk: ExportChunk):
+        unique_ids, inverse = np.unique(chunk.campaign_ids, return_inverse=True)
+        codes = np.array([self._code(str(cid)) for cid in unique_ids.tolist()], dtype=np.int64)
+        keys = (np.asarray(chunk.date_ord, dtype=np.int64) << 32) | codes[inverse.ravel()]
+        self._pending.append((keys, chunk.metrics))
+        self._pending_rows += len(keys)
+        self.rows += len(keys)
+        for account in chunk.accounts:
+            self.accounts.setdefault(account.id, account)
+        for campaign in chunk.campaigns:
+            self.campaigns.setdefault(campaign.id, campaign)
+        if self._pending_rows >= len(self._keys):
+            self._merge()
+
+    def _code(self, campaign_id: str) -> int:
+        code = self._codes.get(campaign_id)
+        if code is None:
+            code = self._codes[campaign_id] = len(self.campaign_ids)
+            self.campaign_ids.append(campaign_id)
+        return code
+
+    def _merge(self):
+        if not self._pending:
+            return
+        keys = np.concatenate([self._keys, *(k for k, _ in self._pending)])
+        columns = {
+            m: np.concatenate([self._totals[m], *(np.asarray(v[m], dtype=np.float64) for _, v in self._pending)])
+            for m in METRIC_COLUMNS
+        }
+        groups = aggregate([keys], columns)
+        self._keys, self._totals = groups.keys[0], groups.totals
+        self._pending, self._pending_rows = [], 0
+
+    def columns(self) -> tuple:
+        """(date_ord, campaign ids, metric totals), one row per distinct pair."""
+        self._merge()
+        codes = self._keys & 0xFFFFFFFF
+        return self._keys >> 32, np.asarray(self.campaign_ids, dtype=str)[codes], self._totals
+
+
+def export_format(path: str, fmt: Optional[str] = None) -> str:
+    """Explicit format, or the one implied by the file extension."""
+    if fmt is None:
+        base = path[:-3] if path.endswith(".gz") else path
+        fmt = "ndjson" if base.endswith((".ndjson", ".jsonl", ".json")) else "csv"
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return fmt
+
+
+@contextmanager
+def _gc_paused():
+    """Pause the cyclic GC while a chunk allocates millions of (acyclic) tuples and strings."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _csv_chunks(text, chunk_rows: int, column_map: Optional[dict]) -> Iterator[tuple]:
+    reader = csv.reader(text)
+    headers = next(reader, None)
+    if headers is None:
+        return
+    mapping = map_columns(headers, column_map)
+    while True:
+        with _gc_paused():
+            rows = list(islice(reader, chunk_rows))
+            # Transpose in C; ragged rows are padded with blanks
+            columns = list(zip_longest(*rows, fillvalue=""))
+        n_rows = len(rows)
+        del rows
+        if not n_rows:
+            return
+        width = len(columns)
+        yield {
+            f: (columns[i] if i < width else ("",) * n_rows, scale)
+            for f, (i, scale) in mapping.items()
+        }, n_rows
+
+
+def _ndjson_chunks(text, chunk_rows: int, column_map: Optional[dict]) -> Iterator[tuple]:
+    mapping = None
+    while True:
+        with _gc_paused():
+            records = [json.loads(line) for line in islice(text, chunk_rows) if line.strip()]
+        if not records:
+            return
+        if mapping is None:
+            headers = list(dict.fromkeys(k for r in records[:1000] for k in r))
+            mapping = {f: (headers[i], scale) for f, (i, scale) in map_columns(headers, column_map).items()}
+        yield {
+            f: ([r.get(key) for r in records], scale)
+            for f, (key, scale) in mapping.items()
+        }, len(records)
+
+
+def _entity_records(columns: dict, campaign_ids: np.ndarray, platform: Optional[str]) -> tuple:
+    """Account and campaign records for the distinct ids of a chunk (first row wins)."""
+    if "accountId" not in columns:
+        return [], []
+    first = np.unique(campaign_ids, return_index=True)[1].tolist()
+    picked = {f: [columns[f][i] for i in first] if f in columns else [None] * len(first) for f in _TEXT_FIELDS}
+
+    campaigns, accounts = [], {}
+    for i, account_id, name, account_name, program in zip(
+        first, picked["accountId"], picked["campaignName"], picked["accountName"], picked["program"]
+    ):
+        if account_id in (None, ""):
+            continue
+        account_id = str(account_id)
+        campaign_id = str(campaign_ids[i])
+        campaigns.append(Campaign(
+            campaign_id,
+            account_id,
+            name if name not in (None, "") else campaign_id,
+            program=program if program not in (None, "") else "",
+        ))
+        if account_id not in accounts:
+            accounts[account_id] = Account(
+                account_id,
+                account_name if account_name not in (None, "") else account_id,
+                status="active",
+                platform=platform or "unknown",
+            )
+    return list(accounts.values()), campaigns
+
+
+def read_export(path: str, report: LoadReport, fmt: Optional[str] = None, chunk_rows: int = EXPORT_CHUNK_ROWS,
+                column_map: Optional[dict] = None, platform: Optional[str] = None) -> Iterator[ExportChunk]:
+    """Yield an export file as `ExportChunk`s of up to `chunk_rows` rows.
+
+    Rows without a date or campaign id are skipped; `report` is updated with
+    bytes/rows read as the file is consumed. Raises ValueError for unknown
+    formats, missing required columns and unparseable dates or numbers.
+    """
+    fmt = export_format(path, fmt)
+    with open(path, "rb") as raw:
+        stream = gzip.GzipFile(fileobj=raw) if path.endswith(".gz") else raw
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        chunks = _csv_chunks(text, chunk_rows, column_map) if fmt == "csv" else _ndjson_chunks(text, chunk_rows, column_map)
+
+        for columns, n_rows in chunks:
+            report.bytes_read = raw.tell()
+            report.rows_read += n_rows
+            texts = {f: values for f, (values, _) in columns.items() if f in _TEXT_FIELDS}
+
+            dates = _text(columns["date"][0]).astype("U10")
+            campaign_ids = _text(columns["campaignId"][0])
+            valid = (dates != "") & (campaign_ids != "")
+            if not valid.all():
+                report.rows_skipped += int(n_rows - valid.sum())
+                dates, campaign_ids = dates[valid], campaign_ids[valid]
+                texts = {f: [v for v, ok in zip(values, valid) if ok] for f, values in texts.items()}
+            try:
+                date_ord = dates_to_ordinals(np.char.replace(dates, "/", "-"))
+                metrics = {}
+                for m in METRIC_COLUMNS:
+                    if m in columns:
+                        values, scale = columns[m]
+                        metrics[m] = _numeric(values, scale)[valid]
+                    else:
+                        metrics[m] = np.zeros(len(date_ord))
+            except ValueError as e:
+                raise ValueError(f"{path}: bad value in rows {report.rows_read - n_rows + 1}-{report.rows_read}: {e}")
+
+            accounts, campaigns = _entity_records(texts, campaign_ids, platform)
+            yield ExportChunk(date_ord, campaign_ids, metrics, accounts, campaigns)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Load a CSV/NDJSON ad-platform export into the data store.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=EXPORT_FORMATS)
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS)
+    parser.add_argument("--platform")
+    args = parser.parse_args()
+
+    from data_tools import load_export
+    try:
+        result = load_export(args.path, fmt=args.format, chunk_rows=args.chunk_rows, platform=args.platform)
+    except (ValueError, RuntimeError) as e:
+        raise SystemExit(str(e))
+    print(json.dumps(result.to_dict(), indent=2))
@@ -0,0 +1,264 @@
+"""
+Columnar Fact Store for Daily Campaign Metrics
+
+Keeps the campaign-day facts behind `db.daily_data` as parallel NumPy arrays
+so that filters and aggregations run as vectorized masks and reductions
+instead of Python loops over lists of dicts.
+
+Rows are kept sorted by (date, campaign) so a date range resolves to a
+contiguous slice by binary search, and a secondary per-campaign offset index
+resolves a campaign filter to one slice per campaign.
+"""
+
+from datetime import date
+from typing import Optional
+
+import numpy as np
+
+# Base (additive) metrics stored for every campaign-day row
+METRIC_COLUMNS = ("clicks", "impressions", "cost", "conversions", "revenue")
+
+
+def date_to_ordinal(value: str) -> int:
+    """Convert a 'YYYY-MM-DD' string to a proleptic Gregorian ordinal."""
+    return date.fromisoformat(value).toordinal()
+
+
+def dates_to_ordinals(values) -> np.ndarray:
+    """Vectorized `date_to_ordinal` for 'YYYY-MM-DD' strings (any time suffix is ignored)."""
+    days = np.asarray(values, dtype="U10").astype("datetime64[D]").astype(np.int64)
+    return days + date(1970, 1, 1).toordinal()
+
+
+def ordinal_to_date(ordinal: int) -> str:
+    """Convert a proleptic Gregorian ordinal back to 'YYYY-MM-DD'."""
+    return date.fromordinal(int(ordinal)).isoformat()
+
+
+def _metric_array(values: list) -> np.ndarray:
+    """Build a metric column, keeping integers exact when every value is an int."""
+    if all(isinstance(v, int) for v in values):
+        return np.asarray(values, dtype=np.int64)
+    return np.asarray(values, dtype=np.float64)
+
+
+class FactStore:
+    """Parallel arrays for campaign-day facts.
+
+    Columns:
+    - date_ord: date as ordinal (int32)
+    - campaign: dense campaign code (int32), index into `campaign_ids`
+    - one array per metric in METRIC_COLUMNS (int64, or float64 when the
+      source data contains fractional values)
+
+    Rows are sorted by (date_ord, campaign). The per-campaign index is a
+    permutation `by_campaign` grouping row numbers by campaign (dates ascending
+    within each group) with CSR-style `campaign_offsets`, so rows of campaign c
+    are `by_campaign[campaign_offsets[c]:campaign_offsets[c + 1]]`.
+    """
+
+    def __init__(self, date_ord: np.ndarray, campaign: np.ndarray, metrics: dict, campaign_ids: list,
+                 campaign_index: Optional[tuple] = None):
+        """Wrap columns that are already sorted by (date_ord, campaign).
+
+        `campaign_index` is a prebuilt (by_campaign, campaign_offsets,
+        campaign_dates) triple, e.g. from a snapshot; it is computed if omitted.
+        Use `from_columns` for unsorted input.
+        """
+        self.date_ord = date_ord
+        self.campaign = campaign
+        self.metrics = metrics
+        self.campaign_ids = campaign_ids
+        self.campaign_index = {cid: i for i, cid in enumerate(campaign_ids)}
+        # Bumped whenever the facts change; caches keyed on query results check it
+        self.version = 0
+        self._campaign_date_keys = None
+        if campaign_index is None:
+            self._build_campaign_index()
+        else:
+            self.by_campaign, self.campaign_offsets, self.campaign_dates = campaign_index
+
+    def _build_campaign_index(self):
+        """Build the per-campaign offset index over the date-sorted rows."""
+        self.by_campaign = np.argsort(self.campaign, kind="stable")
+        counts = np.bincount(self.campaign, minlength=len(self.campaign_ids))
+        self.campaign_offsets = np.r_[0, np.cumsum(counts)]
+        self.campaign_dates = self.date_ord[self.by_campaign]
+
+    @classmethod
+    def from_columns(cls, date_ord: np.ndarray, campaign: np.ndarray, metrics: dict, campaign_ids: list) -> "FactStore":
+        """Sort unsorted columns by (date, campaign) and build the store."""
+        order = np.lexsort((campaign, date_ord))
+        return cls(
+            date_ord[order],
+            campaign[order],
+            {m: col[order] for m, col in metrics.items()},
+            campaign_ids,
+        )
+
+    @classmethod
+    def from_records(cls, daily_data: list, campaigns: list) -> "FactStore":
+        """Build the store from the row-oriented `daily_data` list of dicts.
+
+        Campaign codes follow the order of `campaigns` (`Campaign` records);
+        rows referencing an unknown campaign id get codes appended after the
+        known ones.
+        """
+        campaign_ids = [c.id for c in campaigns]
+        campaign_index = {cid: i for i, cid in enumerate(campaign_ids)}
+
+        codes = []
+        for record in daily_data:
+            cid = record["campaignId"]
+            code = campaign_index.get(cid)
+            if code is None:
+                code = campaign_index[cid] = len(campaign_ids)
+                campaign_ids.append(cid)
+            codes.append(code)
+
+        date_ord = np.fromiter(
+            (date_to_ordinal(d["date"]) for d in daily_data),
+            dtype=np.int32,
+            count=len(daily_data),
+        )
+        metrics = {m: _metric_array([d[m] for d in daily_data]) for m in METRIC_COLUMNS}
+
+        return cls.from_columns(date_ord, np.asarray(codes, dtype=np.int32), metrics, campaign_ids)
+
+    def __len__(self) -> int:
+        return len(self.date_ord)
+
+    def row_keys(self, date_ord: np.ndarray, campaign: np.ndarray, n_campaigns: Optional[int] = None) -> np.ndarray:
+        """Monotonic int64 key of (date, campaign) pairs, matching the store's row order."""
+        n = len(self.campaign_ids) if n_campaigns is None else n_campaigns
+        return np.asarray(date_ord, dtype=np.int64) * n + campaign
+
+    def upsert(self, date_ord: np.ndarray, campaign: np.ndarray, metrics: dict,
+               campaign_ids: Optional[list] = None) -> tuple:
+        """Insert or replace rows keyed on (date_ord, campaign), copy-on-write.
+
+        Keys must be unique within the batch. `campaign_ids` extends the code
+        space when the batch introduces new campaigns. Incoming values are
+        cast to each column's dtype (rounded for integer columns).
+
+        Returns (new_store, changes, n_inserted) where `changes` is
+        (date_ord, campaign, metric deltas, new metric values, inserted mask)
+        for the batch rows, sorted by key, for maintaining rollups. This store is left untouched so readers
+        holding it keep a consistent view; the new store's version is bumped.
+        The campaign index is spliced rather than rebuilt.
+        """
+        campaign_ids = list(campaign_ids) if campaign_ids is not None else self.campaign_ids
+        n_campaigns = len(campaign_ids)
+        date_ord = np.asarray(date_ord, dtype=self.date_ord.dtype)
+        campaign = np.asarray(campaign, dtype=self.campaign.dtype)
+        order = np.lexsort((campaign, date_ord))
+        date_ord, campaign = date_ord[order], campaign[order]
+
+        old_keys = self.row_keys(self.date_ord, self.campaign, n_campaigns)
+        new_keys = self.row_keys(date_ord, campaign, n_campaigns)
+        pos = np.searchsorted(old_keys, new_keys)
+        exists = np.zeros(len(new_keys), dtype=bool)
+        in_range = pos < len(old_keys)
+        exists[in_range] = old_keys[pos[in_range]] == new_keys[in_range]
+        replace_at = pos[exists]
+        insert_at = pos[~exists]
+
+        new_metrics, deltas, new_values = {}, {}, {}
+        for m in METRIC_COLUMNS:
+            column = self.metrics[m]
+            values = np.asarray(metrics[m])[order]
+            if np.issubdtype(column.dtype, np.integer):
+                values = np.round(values)
+            values = values.astype(column.dtype)
+            delta = values.copy()
+            delta[exists] -= column[replace_at]
+            deltas[m] = delta
+            new_values[m] = values
+            updated = np.array(column, copy=True)
+            updated[replace_at] = values[exists]
+            new_metrics[m] = np.insert(updated, insert_at, values[~exists])
+
+        new_date_ord = np.insert(self.date_ord, insert_at, date_ord[~exists])
+        new_campaign = np.insert(self.campaign, insert_at, campaign[~exists])
+        campaign_index = self._spliced_campaign_index(
+            insert_at, date_ord[~exists], campaign[~exists], n_campaigns, len(new_date_ord)
+        )
+
+        store = FactStore(new_date_ord, new_campaign, new_metrics, campaign_ids, campaign_index=campaign_index)
+        store.version = self.version + 1
+        return store, (date_ord, campaign, deltas, new_values, ~exists), int(len(insert_at))
+
+    def _spliced_campaign_index(self, insert_at: np.ndarray, dates: np.ndarray, campaigns: np.ndarray,
+                                n_campaigns: int, n_rows: int) -> tuple:
+        """Campaign index after `np.insert(..., insert_at, ...)` of new rows, without re-sorting."""
+        # Row j of the batch lands at insert_at[j] + j; old rows shift past earlier inserts
+        new_rows = insert_at + np.arange(len(insert_at))
+        shifted = self.by_campaign + np.searchsorted(insert_at, self.by_campaign, side="right")
+
+        counts = np.zeros(n_campaigns, dtype=np.int64)
+        counts[:len(self.campaign_offsets) - 1] = np.diff(self.campaign_offsets)
+        entry_campaign = np.repeat(np.arange(n_campaigns), counts)
+        entry_keys = entry_campaign * n_rows + shifted
+
+        # Batch rows grouped by campaign, by position (= date order) within each
+        batch_keys = campaigns.astype(np.int64) * n_rows + new_rows
+        batch_order = np.argsort(batch_keys)
+        at = np.searchsorted(entry_keys, batch_keys[batch_order])
+
+        by_campaign = np.insert(shifted, at, new_rows[batch_order])
+        campaign_dates = np.insert(self.campaign_dates, at, dates[batch_order])
+        counts += np.bincount(campaigns, minlength=n_campaigns)
+        return by_campaign, np.r_[0, np.cumsum(counts)], campaign_dates
+
+    def date_slice(self, start_ord: int, end_ord: int) -> slice:
+        """Resolve an inclusive ordinal date range to a contiguous row slice by binary search."""
+        # Needles in the column dtype: a Python int would make NumPy cast the whole column
+        as_date = self.date_ord.dtype.type
+        lo = np.searchsorted(self.date_ord, as_date(start_ord), side="left")
+        hi = np.searchsorted(self.date_ord, as_date(end_ord), side="right")
+        return slice(int(lo), int(hi))
+
+    def campaign_slices(self, start_ord: int, end_ord: int, campaign_codes: np.ndarray) -> tuple:
+        """Resolve a date range for each campaign to a slice of `by_campaign`.
+
+        Returns (starts, stops) as arrays of positions into `by_campaign`.
+        All campaigns are resolved by one binary search over (campaign, date)
+        keys rather than one search per campaign.
+        """
+        keys = self.campaign_date_keys()
+        codes = np.asarray(campaign_codes, dtype=np.int64) << 32
+        starts = np.searchsorted(keys, codes | int(start_ord), side="left")
+        stops = np.searchsorted(keys, codes | int(end_ord), side="right")
+        return starts, stops
+
+    def campaign_date_keys(self) -> np.ndarray:
+        """`campaign << 32 | date` for every `by_campaign` entry (ascending), built on first use."""
+        if self._campaign_date_keys is None:
+            campaigns = np.repeat(np.arange(len(self.campaign_offsets) - 1, dtype=np.int64),
+                                  np.diff(self.campaign_offsets))
+            self._campaign_date_keys = (campaigns << 32) | self.campaign_dates
+        return self._campaign_date_keys
+
+    def rows(self, start_ord: int, end_ord: int, campaign_codes: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return row numbers inside [start_ord, end_ord] (inclusive), in store order.
+
+        If `campaign_codes` is given, rows are further restricted to those
+        campaigns. Narrow campaign filters gather the per-campaign slices;
+        broad ones mask the contiguous date slice instead, whichever touches
+        fewer rows.
+        """
+        window = self.date_slice(start_ord, end_ord)
+        if campaign_codes is None:
+            return np.arange(window.start, window.stop)
+
+        starts, stops = self.campaign_slices(start_ord, end_ord, campaign_codes)
+        selected = int((stops - starts).sum())
+        if selected * 2 >= window.stop - window.start:
+            in_window = np.isin(self.campaign[window], campaign_codes)
+            return window.start + np.flatnonzero(in_window)
+
+        positions = np.concatenate(
+            [np.arange(a, b) for a, b in zip(starts.tolist(), stops.tolist())]
+        ) if len(starts) else np.empty(0, dtype=np.int64)
+        return np.sort(self.by_campaign[positions])
+
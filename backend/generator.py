@@ -1,10 +1,13 @@
 import os
 import json
+import asyncio
 import os
 import json
 from google import genai
 from dotenv import load_dotenv
 
+from json_stream import JSONArrayStream
+
 # Load environment variables
 load_dotenv()
 
@@ -41,52 +44,70 @@ Return ONLY the JSON array.
 """
 
 
-async def generate_research_stream(niche: str):
-    """Generate affiliate program research for a niche."""
-    # Note: Duplicate docstring removed
-    prompt = PROMPT_TEMPLATE.format(niche=niche, context="")
+def _table_from_text(buffer: str) -> list:
+    """Table rows from a complete research answer (fenced, wrapped or bare JSON array)."""
+    # Post-process: Strip markdown wrappers if present
+    cleaned_buffer = buffer.strip()
+    if cleaned_buffer.startswith('```'):
+        # Remove markdown code block
+        lines = cleaned_buffer.split('\n')
+        if lines[0].startswith('```'):
+            lines = lines[1:]
+        if lines and lines[-1].strip() == '```':
+            lines = lines[:-1]
+        cleaned_buffer = '\n'.join(lines).strip()
     
+    # Check if AI returned the full structured response or just the array
+    try:
+        parsed = json.loads(cleaned_buffer)
+    except json.JSONDecodeError:
+        # If JSON is invalid, return error
+        return [{"error": "Invalid JSON from AI"}]
+    # If it's already structured with "type" and "content", extract content
+    if isinstance(parsed, dict) and 'content' in parsed:
+        return parsed['content']
+    # If it's just the array, use it
+    if isinstance(parsed, list):
+        return parsed
+    # Fallback: return as-is
+    return cleaned_buffer
+
+
+async def _stream_research_table(prompt: str):
+    """Research results as NDJSON lines, generated from `prompt`.
+    
+    Each program is sent as {"type": "row", "index": i, "content": {...}}
+    as soon as its object closes in the model's output; the last line is
+    {"type": "table", "content": [...]} with every row (or an error row).
+    """
+    parser = JSONArrayStream()
+    rows = []
     try:
         response = await client.aio.models.generate_content_stream(
             model="gemini-3-flash-preview",
             contents=prompt
         )
-        buffer = ""
         async for chunk in response:
             if chunk.text:
-                buffer += chunk.text
-        
-        # Post-process: Strip markdown wrappers if present
-        cleaned_buffer = buffer.strip()
-        if cleaned_buffer.startswith('```'):
-            # Remove markdown code block
-            lines = cleaned_buffer.split('\n')
-            if lines[0].startswith('```'):
-                lines = lines[1:]
-            if lines and lines[-1].strip() == '```':
-                lines = lines[:-1]
-            cleaned_buffer = '\n'.join(lines).strip()
-        
-        # Check if AI returned the full structured response or just the array
-        try:
-            parsed = json.loads(cleaned_buffer)
-            # If it's already structured with "type" and "content", extract content
-            if isinstance(parsed, dict) and 'content' in parsed:
-                content_array = parsed['content']
-                yield f'{{"type": "table", "content": {json.dumps(content_array)}}}'
-            # If it's just the array, wrap it
-            elif isinstance(parsed, list):
-                yield f'{{"type": "table", "content": {json.dumps(parsed)}}}'
-            else:
-                # Fallback: return as-is
-                yield f'{{"type": "table", "content": {cleaned_buffer}}}'
-        except json.JSONDecodeError:
-            # If JSON is invalid, return error
-            yield f'{{"type": "table", "content": [{{"error": "Invalid JSON from AI"}}]}}'
-            
+                for row in parser.feed(chunk.text):
+                    yield json.dumps({"type": "row", "index": len(rows), "content": row}, ensure_ascii=False) + "\n"
+                    rows.append(row)
     except Exception as e:
         print(f"Error in research generation: {e}")
-        yield f'{{"type": "table", "content": [{{"error": "Generation failed: {str(e)}"}}]}}'
+        if not rows:
+            yield json.dumps({"type": "table", "content": [{"error": f"Generation failed: {str(e)}"}]}) + "\n"
+            return
+    
+    # Rows already sent stand even if the array was cut off; otherwise the whole answer decides
+    table = rows if rows or parser.closed else _table_from_text(parser.text)
+    yield json.dumps({"type": "table", "content": table}, ensure_ascii=False) + "\n"
+
+
+async def generate_research_stream(niche: str):
+    """Generate affiliate program research for a niche, streamed row by row (see _stream_research_table)."""
+    prompt = PROMPT_TEMPLATE.format(niche=niche, context="")
+    async for line in _stream_research_table(prompt):
+        yield line
 
 
 async def generate_chat_stream(messages: list):
@@ -99,7 +120,8 @@ async def generate_chat_stream(messages: list):
         messages: List of message dicts with 'role' and 'content'
     
     Yields:
-        JSON-formatted response chunks
+        JSON-formatted response chunks: NDJSON research rows and then the
+        table (see _stream_research_table), or one text response
     """
     # Get last user message
     user_messages = [m for m in messages if m.get('role') == 'user']
@@ -122,48 +144,9 @@ async def generate_chat_stream(messages: list):
     
     # Route based on intent
     if intent in ['research', 'followup']:
-        try:
-            prompt = PROMPT_TEMPLATE.format(niche=user_query, context=conversation_history)
-            
-            response = await client.aio.models.generate_content_stream(
-                model="gemini-3-flash-preview",
-                contents=prompt
-            )
-            buffer = ""
-            async for chunk in response:
-                if chunk.text:
-                    buffer += chunk.text
-            
-            # Post-process: Strip markdown wrappers if present
-            cleaned_buffer = buffer.strip()
-            if cleaned_buffer.startswith('```'):
-                # Remove markdown code block
-                lines = cleaned_buffer.split('\n')
-                if lines[0].startswith('```'):
-                    lines = lines[1:]
-                if lines and lines[-1].strip() == '```':
-                    lines = lines[:-1]
-                cleaned_buffer = '\n'.join(lines).strip()
-            
-            # Parse and return JSON
-            try:
-                parsed = json.loads(cleaned_buffer)
-                # If it's already structured with "type" and "content", extract content
-                if isinstance(parsed, dict) and 'content' in parsed:
-                    content_array = parsed['content']
-                    yield json.dumps({"type": "table", "content": content_array})
-                # If it's just the array, wrap it
-                elif isinstance(parsed, list):
-                    yield json.dumps({"type": "table", "content": parsed})
-                else:
-                    # Fallback: return as-is
-                    yield json.dumps({"type": "table", "content": cleaned_buffer})
-            except json.JSONDecodeError:
-                # If JSON is invalid, return error
-                yield json.dumps({"type": "table", "content": [{"error": "Invalid JSON from AI"}]})
-                
-        except Exception as e:
-            yield json.dumps({"type": "table", "content": [{"error": f"Generation failed: {str(e)}"}]})
+        prompt = PROMPT_TEMPLATE.format(niche=user_query, context=conversation_history)
+        async for line in _stream_research_table(prompt):
+            yield line
     else:
         # Generate text response (explanation)
         prompt = f"""{CHAT_SYSTEM_INSTRUCTION}
@@ -248,24 +231,39 @@ async def generate_agent_stream(messages: list):
         messages: List of message dicts with 'role' and 'content'
     
     Yields:
-        JSON-formatted response with type (composite, chart, table, text)
+        NDJSON lines, one event each, as the answer is built: a status event
+        once the intent is routed, chart/table sections once their data is
+        ready, narrative tokens as Gemini streams them (see
+        agents.run_agent_workflow), then {"event": "done", "message": ...}
+        with the complete response (type composite, chart, table or text)
     """
+    events = asyncio.Queue()
+    
+    async def run():
+        try:
+            from agents import run_agent_workflow
+            return await run_agent_workflow(messages, emit=events.put)
+        finally:
+            await events.put(None)
+    
+    workflow = asyncio.create_task(run())
     try:
-        from agents import run_agent_workflow
-        
-        # Run the agent workflow
-        result = await run_agent_workflow(messages)
-        
-        # Yield the result as JSON
-        yield json.dumps(result, ensure_ascii=False)
+        while (event := await events.get()) is not None:
+            yield json.dumps(event, ensure_ascii=False) + "\n"
         
-    except Exception as e:
-        print(f"Error in agent workflow: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        # Fallback to simple text response
-        yield json.dumps({
-            "type": "text",
-            "content": f"Xin lỗi, có lỗi xảy ra trong quá trình xử lý. Vui lòng thử lại.\n\nChi tiết: {str(e)}"
-        }, ensure_ascii=False)
+        try:
+            result = workflow.result()
+        except Exception as e:
+            print(f"Error in agent workflow: {e}")
+            import traceback
+            traceback.print_exc()
+            
+            # Fallback to simple text response
+            result = {
+                "type": "text",
+                "content": f"Xin lỗi, có lỗi xảy ra trong quá trình xử lý. Vui lòng thử lại.\n\nChi tiết: {str(e)}"
+            }
+        yield json.dumps({"event": "done", "message": result}, ensure_ascii=False) + "\n"
+    finally:
+        # The client went away mid-answer
+        workflow.cancel()
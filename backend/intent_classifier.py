@@ -1,16 +1,39 @@
 """
 Intent Classifier for Adecos MVP Chat System
 
-This module uses Gemini API to intelligently classify user intents for better routing.
+This module classifies user intents for routing in tiers:
+
+1. keyword rules for unambiguous phrasings ("CPC là gì?", "liệt kê chiến dịch"),
+2. a small naive Bayes model over the words of the examples in CLASSIFIER_PROMPT,
+3. the Gemini API, only when the local tiers are less confident than
+   LOCAL_INTENT_THRESHOLD.
+
+Local answers also extract entities (time range, metrics, grouping, top-N)
+with the same keys as Gemini's. A query with words the local tiers have
+never seen (a program or campaign name, say) loses confidence, so entities
+they cannot extract still go to Gemini.
+
+Gemini answers are cached by normalized query and conversation context
+(optionally persisted to INTENT_CACHE_PATH), so a repeated or re-typed
+question is not sent again.
 IMPORTANT: Always use gemini-3-flash-preview - DO NOT CHANGE
 """
 
 import os
+import copy
+import hashlib
+import math
+import re
+import threading
+from collections import Counter
 from google import genai
 from dotenv import load_dotenv
 import json
 import logging
 
+from keyword_index import fold_text
+from ttl_cache import TTLCache
+
 load_dotenv()
 
 # Configure logging
@@ -46,6 +69,7 @@ Phân loại câu hỏi của người dùng vào MỘT trong các loại sau:
 1. **data_analysis** - Người dùng muốn xem dữ liệu, biểu đồ, metrics về quảng cáo. BAO GỒM CẢ PHÂN TÍCH THEO GROUP.
    Ví dụ: "Chi phí tháng 11", "Hiển thị clicks tuần này", "ROAS của tôi thế nào?", "CPC", "Cost per click"
    Ví dụ Grouping: "Chi phí theo tài khoản", "Doanh thu theo chiến dịch", "Hiệu quả từng account" -> Intent này.
+   Ví dụ Xếp hạng: "Top 20 chiến dịch theo ROAS", "5 chiến dịch có CPC thấp nhất" -> Intent này, kèm group_by, sort_by, sort_order, limit.
    
 2. **data_query** - Người dùng muốn danh sách, bảng dữ liệu cụ thể về campaigns/accounts (CHỈ LIST/TABLE)
    Ví dụ: "Liệt kê các chiến dịch", "Tài khoản nào đang active?", "Danh sách tài khoản"
@@ -73,6 +97,7 @@ Trả lời CHÍNH XÁC theo format JSON:
     "reasoning": "ngắn gọn",
     "entities": {{
         "time_range": "<khoảng thời gian nếu có, ví dụ: last 30 days, this week, November>", 
+        "compare_time_range": "<khoảng thời gian được so sánh với (intent comparison), v.d. tháng 10, tuần trước>",
         "metrics": ["<metrics được nhắc đến>"], 
         "campaigns": ["<campaigns nếu có>"], 
         "niche": "<ngách/lĩnh vực nếu có>",
@@ -80,42 +105,371 @@ Trả lời CHÍNH XÁC theo format JSON:
         "keywords": ["<từ khóa cần lọc nều có, v.d. crypto, forex>"],
         "group_by": "<account|campaign|day|week|month|none>",
         "breakdown": "<account|campaign|none>",
-        "visual_type": "<line|bar|area|none>"
+        "visual_type": "<line|bar|area|none>",
+        "sort_by": "<metric để xếp hạng: cost|revenue|clicks|impressions|conversions|cpc|ctr|roas|cpa|roi|none>",
+        "sort_order": "<desc nếu cao nhất/top, asc nếu thấp nhất|none>",
+        "limit": <số lượng N trong "top N" nếu có, nếu không thì null>,
+        "full_resolution": <true nếu người dùng muốn xem đầy đủ từng điểm dữ liệu (không rút gọn biểu đồ), ngược lại false>,
+        "approximate": <true nếu người dùng chỉ cần xu hướng/ước tính nhanh trên khoảng thời gian rất dài (v.d. "toàn bộ lịch sử", "ước tính", "đại khái"), ngược lại false>
     }}
 }}
 """
 
 
+# Answer without calling Gemini at or above this confidence
+LOCAL_INTENT_THRESHOLD = float(os.getenv("LOCAL_INTENT_THRESHOLD", "0.75"))
+
+# Features found only in the predicted intent's examples that the model tier
+# needs before it may answer without Gemini
+MODEL_MIN_EVIDENCE = 2
+
+# Which tier produced a classification
+TIER_RULES = "rules"
+TIER_MODEL = "model"
+TIER_CACHE = "cache"  # an earlier Gemini answer
+TIER_GEMINI = "gemini"
+TIER_FALLBACK = "fallback"  # Gemini failed: best local guess or the default
+TIERS = [TIER_RULES, TIER_MODEL, TIER_CACHE, TIER_GEMINI, TIER_FALLBACK]
+
+
+def _tokens(text: str) -> list:
+    """Diacritic-folded word tokens ("Chi phí?" -> ["chi", "phi"])."""
+    return re.findall(r"[a-z0-9]+", fold_text(text))
+
+
+# (intent, pattern over the folded query, confidence, only with conversation history), first match wins
+_INTENT_RULES = [
+    (INTENT_FOLLOWUP, r"^(?:chi tiet hon|giai thich them|noi them|them nua|nua di|tiep di|tell me more|more details?|expand on that)\b", 0.9, True),
+    (INTENT_EXPLANATION, r"\b(?:la gi|nghia la gi|what is|what are|giai thich|huong dan|how to|cach (?:toi uu|tang|giam|tinh))\b", 0.9, False),
+    (INTENT_EXPLANATION, r"^(?:tai sao|vi sao|why)\b", 0.85, False),
+    (INTENT_COMPARISON, r"\b(?:so sanh|so voi|compare|versus|vs|tot hon|kem hon|hieu qua hon)\b", 0.9, False),
+    (INTENT_DATA_QUERY, r"\b(?:liet ke|danh sach|list)\b", 0.9, False),
+    (INTENT_DATA_QUERY, r"\b(?:tai khoan|accounts?|chien dich|campaigns?) nao\b.*\b(?:active|hoat dong|dang chay|tam dung|paused)\b", 0.85, False),
+    (INTENT_RESEARCH, r"\b(?:affiliate|ngach|niche|kiem tien)\b", 0.85, False),
+    (INTENT_DATA_ANALYSIS, r"\b(?:chi phi|doanh thu|costs?|revenue|clicks?|impressions?|luot hien thi|chuyen doi|conversions?|cpc|ctr|roas|cpa|roi|hieu qua|bieu do)\b", 0.85, False),
+]
+
+# Folded phrase -> metric, longest phrases first so "cost per click" is not "cost"
+_METRIC_PHRASES = {
+    "cost per click": "cpc", "chi phi": "cost", "cost": "cost", "doanh thu": "revenue", "revenue": "revenue",
+    "luot click": "clicks", "clicks": "clicks", "click": "clicks", "luot hien thi": "impressions",
+    "impressions": "impressions", "impression": "impressions", "chuyen doi": "conversions",
+    "conversions": "conversions", "conversion": "conversions",
+    "cpc": "cpc", "ctr": "ctr", "roas": "roas", "cpa": "cpa", "roi": "roi",
+}
+_METRIC_ALTERNATION = "|".join(sorted(map(re.escape, _METRIC_PHRASES), key=len, reverse=True))
+_METRIC_PATTERN = re.compile(rf"\b({_METRIC_ALTERNATION})\b")
+
+# Folded time phrases -> a range data_tools.parse_date_range understands
+_TIME_RANGES = [
+    (r"\b(\d+) (?:days?|ngay)\b", lambda m: f"last {m.group(1)} days"),
+    (r"\b(?:this week|tuan nay)\b", lambda m: "this week"),
+    (r"\b(?:last week|tuan truoc)\b", lambda m: "last week"),
+    (r"\b(?:this month|thang nay)\b", lambda m: "this month"),
+    (r"\b(?:last month|thang truoc)\b", lambda m: "last month"),
+    (r"\bthang 0?(1[0-2]|[1-9])\b", lambda m: f"tháng {m.group(1)}"),
+]
+
+_ENTITY_GRAINS = [("account", r"\b(?:tai khoan|accounts?)\b"), ("campaign", r"\b(?:chien dich|campaigns?)\b")]
+_TIME_GRAIN = re.compile(r"\b(?:(?:theo|tung|moi|hang|by|per) (ngay|tuan|thang|day|week|month)|(daily|weekly|monthly))\b")
+_GRAIN_NAMES = {"ngay": "day", "tuan": "week", "thang": "month", "daily": "day", "weekly": "week", "monthly": "month"}
+_RANKING = re.compile(r"\b(?:top \d+|cao nhat|thap nhat|nhieu nhat|it nhat|tot nhat|kem nhat|highest|lowest|best|worst)\b")
+_ASCENDING = re.compile(r"\b(?:thap nhat|it nhat|kem nhat|lowest|worst|bottom)\b")
+_LIMIT = re.compile(r"\b(?:top (\d+)|(\d+) (?:chien dich|campaigns?|tai khoan|accounts?))\b")
+_VISUAL_TYPES = [("line", r"\b(?:bieu do duong|line chart)\b"), ("bar", r"\b(?:bieu do cot|bar chart)\b"),
+                 ("area", r"\b(?:bieu do (?:mien|vung)|area chart)\b")]
+_FULL_RESOLUTION = re.compile(r"\b(?:day du|tung diem|full resolution|khong rut gon)\b")
+_APPROXIMATE = re.compile(r"\b(?:uoc tinh|dai khai|toan bo lich su|roughly|estimate)\b")
+
+# Words the local tiers understand besides the prompt examples; anything else
+# may be a name (program, campaign, keyword) only Gemini can extract
+_COMMON_WORDS = set("""
+    toi minh ban cua cho va voi la cac nhung mot co khong duoc nay do kia nao gi bao nhieu the
+    xem hien thi thi da dang se bi tu den trong ngoai tren duoi theo tung moi hang tat ca
+    lai cao thap tang giam nhat hon nhieu it tot kem top so sanh voi vs versus compare tim kiem
+    ngay tuan thang nam qua truoc sau hom nay qua day days week month this last by per daily weekly monthly
+    tai khoan chien dich account accounts campaign campaigns quang cao ads ad
+    chi phi doanh thu cost revenue click clicks luot hien thi impressions impression chuyen doi conversions
+    conversion cpc ctr roas cpa roi per hieu qua bieu do duong cot mien vung line bar area chart
+    liet ke danh sach list active hoat dong chay tam dung paused
+    giai thich nghia huong dan cach toi uu tinh tai sao vi why what is are how to
+    chi tiet them noi nua di tiep tell me more details expand on that
+    day du diem full resolution rut gon uoc dai khai toan bo lich su roughly estimate
+    affiliate ngach niche kiem tien chuong trinh program programs
+    please show the of and for in my i me
+""".split())
+
+
+def _features(tokens: list) -> list:
+    """Word unigrams and bigrams."""
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def prompt_examples(prompt: str) -> list:
+    """(example query, intent) pairs from the "Ví dụ" lines under each numbered intent of a prompt."""
+    examples = []
+    intent = None
+    for line in prompt.splitlines():
+        heading = re.match(r"\s*\d+\.\s+\*\*(\w+)\*\*", line)
+        if heading:
+            intent = heading.group(1) if heading.group(1) in VALID_INTENTS else None
+        elif intent and line.strip().startswith("Ví dụ"):
+            # Only the quoted examples before "->" ("... -> Intent này")
+            examples.extend((text, intent) for text in re.findall(r'"([^"]+)"', line.split("->")[0]))
+    return examples
+
+
+class LexicalIntentModel:
+    """Multinomial naive Bayes over word unigrams and bigrams of folded text.
+
+    The prior is uniform: the training examples say how each intent is
+    phrased, not how often it is asked. With a few examples per intent, a
+    small additive smoothing lets one word decide, so `evidence` tells how
+    many of a query's features no other intent's examples share.
+    """
+
+    SMOOTHING = 0.1
+
+    def __init__(self, examples: list):
+        self.counts = {}
+        for text, intent in examples:
+            self.counts.setdefault(intent, Counter()).update(_features(_tokens(text)))
+        self.totals = {intent: sum(counts.values()) for intent, counts in self.counts.items()}
+        self.vocabulary = set().union(*self.counts.values())
+        seen = Counter(f for counts in self.counts.values() for f in counts)
+        self.exclusive = {intent: {f for f in counts if seen[f] == 1} for intent, counts in self.counts.items()}
+
+    def predict(self, tokens: list, intents: list) -> tuple:
+        """(most likely intent among `intents`, its posterior probability); (None, 0.0) if no word is known."""
+        features = [f for f in _features(tokens) if f in self.vocabulary]
+        intents = [i for i in intents if i in self.counts]
+        if not features or not intents:
+            return None, 0.0
+        scores = {}
+        for intent in intents:
+            counts = self.counts[intent]
+            denominator = math.log(self.totals[intent] + self.SMOOTHING * len(self.vocabulary))
+            scores[intent] = sum(math.log(counts[f] + self.SMOOTHING) - denominator for f in features)
+        best = max(scores, key=scores.get)
+        log_total = math.log(sum(math.exp(s - scores[best]) for s in scores.values())) + scores[best]
+        return best, math.exp(scores[best] - log_total)
+
+    def evidence(self, tokens: list, intent: str) -> int:
+        """Number of distinct features of `tokens` seen only in `intent`'s examples."""
+        return len(set(_features(tokens)) & self.exclusive.get(intent, set()))
+
+
+def extract_entities(query: str, intent: str) -> dict:
+    """Entities the local tiers can read off a query, with the keys Gemini uses (only those found)."""
+    text = " ".join(_tokens(query))
+    entities = {}
+
+    periods = sorted(
+        (m.start(), to_range(m)) for pattern, to_range in _TIME_RANGES for m in re.finditer(pattern, text)
+    )
+    if periods:
+        entities["time_range"] = periods[0][1]
+        if intent == INTENT_COMPARISON and len(periods) > 1:
+            entities["compare_time_range"] = periods[1][1]
+    metrics = list(dict.fromkeys(_METRIC_PHRASES[m] for m in _METRIC_PATTERN.findall(text)))
+    if metrics:
+        entities["metrics"] = metrics
+    if intent not in (INTENT_DATA_ANALYSIS, INTENT_COMPARISON):
+        return entities
+
+    grain = _TIME_GRAIN.search(text)
+    time_grain = _GRAIN_NAMES.get(grain.group(1) or grain.group(2), grain.group(1) or grain.group(2)) if grain else None
+    entity_grain = min(
+        ((m.start(), name) for name, pattern in _ENTITY_GRAINS for m in [re.search(pattern, text)] if m),
+        default=(None, None),
+    )[1]
+    if time_grain and entity_grain:
+        entities["group_by"], entities["breakdown"] = time_grain, entity_grain
+    elif time_grain or entity_grain:
+        entities["group_by"] = time_grain or entity_grain
+    if intent == INTENT_COMPARISON:
+        return entities
+
+    if entity_grain and _RANKING.search(text):
+        ranked = re.search(rf"\b(?:theo|by|co) ({_METRIC_ALTERNATION})\b", text)
+        if ranked or metrics:
+            entities["sort_by"] = _METRIC_PHRASES[ranked.group(1)] if ranked else metrics[0]
+        entities["sort_order"] = "asc" if _ASCENDING.search(text) else "desc"
+        limit = _LIMIT.search(text)
+        if limit:
+            entities["limit"] = int(limit.group(1) or limit.group(2))
+    for visual_type, pattern in _VISUAL_TYPES:
+        if re.search(pattern, text):
+            entities["visual_type"] = visual_type
+            break
+    if _FULL_RESOLUTION.search(text):
+        entities["full_resolution"] = True
+    if _APPROXIMATE.search(text):
+        entities["approximate"] = True
+    return entities
+
+
+_MODEL = LexicalIntentModel(prompt_examples(CLASSIFIER_PROMPT))
+
+# Words known outside research: the research examples' own words are niches
+# ("Crypto", "Forex") that, in any other request, are a keyword filter only
+# Gemini extracts
+_KNOWN_WORDS = _COMMON_WORDS | set().union(
+    *(counts for intent, counts in _MODEL.counts.items() if intent != INTENT_RESEARCH)
+)
+
+
+def classify_local(user_query: str, has_history: bool = False) -> dict:
+    """Rules, then the lexical model: a classification without calling Gemini.
+
+    Confidence is scaled by the share of the query's words the local tiers
+    know (squared), except for research, whose niche is free text; a niche
+    word in another request ("chi phí crypto") counts as unknown. The model
+    tier never answers comparison, which needs an explicit cue the rules
+    catch ("so sánh", "vs"), and stays below LOCAL_INTENT_THRESHOLD unless
+    MODEL_MIN_EVIDENCE of the query's features are specific to its intent:
+    "tuần này" alone is a period, not a request Gemini can be skipped for.
+    """
+    tokens = _tokens(user_query)
+    text = " ".join(tokens)
+    intents = [i for i in VALID_INTENTS if has_history or i != INTENT_FOLLOWUP]
+
+    intent, confidence, tier, reasoning = None, 0.0, TIER_MODEL, "local model"
+    for rule_intent, pattern, rule_confidence, needs_history in _INTENT_RULES:
+        match = re.search(pattern, text) if has_history or not needs_history else None
+        if match:
+            intent, confidence, tier, reasoning = rule_intent, rule_confidence, TIER_RULES, f"local rule '{match.group(0)}'"
+            break
+    if intent is None:
+        intent, confidence = _MODEL.predict(tokens, [i for i in intents if i != INTENT_COMPARISON])
+        if intent and _MODEL.evidence(tokens, intent) < MODEL_MIN_EVIDENCE:
+            confidence = min(confidence, LOCAL_INTENT_THRESHOLD / 2)
+
+    words = [t for t in tokens if not t.isdigit()]
+    if intent != INTENT_RESEARCH and words:
+        known = sum(1 for t in words if t in _KNOWN_WORDS)
+        confidence *= (known / len(words)) ** 2
+
+    return {
+        "intent": intent or INTENT_DATA_ANALYSIS,
+        "confidence": round(confidence, 4),
+        "reasoning": reasoning,
+        "entities": extract_entities(user_query, intent) if intent else {},
+        "tier": tier,
+    }
+
+
+# Gemini classifications by (normalized query, context digest). Entries are
+# only valid for the prompt and model they were produced with.
+intent_cache = TTLCache(
+    maxsize=int(os.getenv("INTENT_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("INTENT_CACHE_TTL", "86400")),
+)
+INTENT_CACHE_PATH = os.getenv("INTENT_CACHE_PATH", "")
+_CACHE_VERSION = hashlib.sha1(f"{MODEL_NAME}\n{CLASSIFIER_PROMPT}".encode("utf-8")).hexdigest()[:16]
+
+if INTENT_CACHE_PATH:
+    logger.info(f"📦 Loaded {intent_cache.load(INTENT_CACHE_PATH, version=_CACHE_VERSION)} cached intents from {INTENT_CACHE_PATH}")
+
+# Serializes background cache writes; a pending flag coalesces bursts of new entries
+_cache_write_lock = threading.Lock()
+_cache_write_pending = threading.Event()
+
+
+def _save_intent_cache_later():
+    """Write the intent cache to INTENT_CACHE_PATH in the background."""
+    if not INTENT_CACHE_PATH or _cache_write_pending.is_set():
+        return
+    _cache_write_pending.set()
+
+    def run():
+        with _cache_write_lock:
+            _cache_write_pending.clear()
+            try:
+                intent_cache.save(INTENT_CACHE_PATH)
+            except OSError as e:
+                logger.warning(f"⚠️ Could not write intent cache to {INTENT_CACHE_PATH}: {e}")
+
+    threading.Thread(target=run, name="intent-cache-writer").start()
+
+
+def normalize_query(user_query: str) -> str:
+    """Case-, diacritic-, punctuation- and whitespace-insensitive form of a query."""
+    return " ".join(_tokens(user_query))
+
+
+def _conversation_context(conversation_history) -> str:
+    """The last 3 messages (or lines of a history string), each truncated to 100 characters."""
+    if not conversation_history:
+        return "None (first message)"
+    if isinstance(conversation_history, str):
+        messages = [line.split(": ", 1) for line in conversation_history.splitlines() if line.strip()]
+        messages = [(m[0], m[1]) if len(m) == 2 else ("", m[0]) for m in messages]
+    else:
+        messages = [(msg.get("role", ""), msg.get("content", "")) for msg in conversation_history]
+    context_parts = []
+    for role, content in messages[-3:]:
+        if not isinstance(content, str):
+            content = "[Previous data/chart response]"
+        # Truncate long messages
+        if len(content) > 100:
+            content = content[:100] + "..."
+        context_parts.append(f"{role}: {content}")
+    return " | ".join(context_parts)
+
+
+_tier_counts = Counter()
+
+
+def _record_tier(result: dict) -> dict:
+    _tier_counts[result["tier"]] += 1
+    return result
+
+
+def classifier_stats() -> dict:
+    """How many classifications each tier answered, and the share answered locally."""
+    total = sum(_tier_counts.values())
+    local = _tier_counts[TIER_RULES] + _tier_counts[TIER_MODEL]
+    return {
+        "classified": total,
+        "threshold": LOCAL_INTENT_THRESHOLD,
+        "tiers": {tier: _tier_counts[tier] for tier in TIERS},
+        "localHitRate": round(local / total, 4) if total else 0,
+        "cache": intent_cache.stats(),
+    }
+
+
 async def classify_intent(user_query: str, conversation_history: list = None) -> dict:
     """
-    Classify user intent using Gemini API.
+    Classify user intent, locally when confident enough, otherwise with the Gemini API.
     
     Args:
         user_query: The current user message
         conversation_history: Optional list of previous messages for context
         
     Returns:
-        dict: {"intent": str, "entities": dict, "confidence": float, "reasoning": str}
+        dict: {"intent": str, "entities": dict, "confidence": float, "reasoning": str, "tier": str}
     """
+    local = classify_local(user_query, has_history=bool(conversation_history))
+    if local["confidence"] >= LOCAL_INTENT_THRESHOLD:
+        _record_tier(local)
+        logger.info(
+            f"⚡ INTENT CLASSIFIED LOCALLY ({local['tier']}, {local['confidence']:.2f}): {local['intent']} "
+            f"| Entities: {local['entities']} | Local hit rate: {classifier_stats()['localHitRate']:.0%}"
+        )
+        return local
+    
+    # Same question in the same recent context: reuse Gemini's earlier answer
+    context = _conversation_context(conversation_history)
+    cache_key = (normalize_query(user_query), hashlib.sha1(context.encode("utf-8")).hexdigest()[:16])
+    cached = intent_cache.get(cache_key, version=_CACHE_VERSION)
+    if cached is not None:
+        result = copy.deepcopy(cached)
+        result["tier"] = TIER_CACHE
+        logger.info(f"✅ INTENT CLASSIFIED (cached): {result.get('intent')} | Entities: {result.get('entities')}")
+        return _record_tier(result)
+    
     try:
-        # Build context from conversation history
-        context = "None (first message)"
-        if conversation_history:
-            if isinstance(conversation_history, list) and len(conversation_history) > 0:
-                # Get last 2-3 messages for context
-                recent_messages = conversation_history[-3:]
-                context_parts = []
-                for msg in recent_messages:
-                    role = msg.get("role", "")
-                    content = msg.get("content", "")
-                    # Truncate long messages
-                    if len(content) > 100:
-                        content = content[:100] + "..."
-                    context_parts.append(f"{role}: {content}")
-                context = " | ".join(context_parts)
-            elif isinstance(conversation_history, str):
-                context = conversation_history
-        
         # Format the prompt
         prompt = CLASSIFIER_PROMPT.format(query=user_query, context=context)
         
@@ -145,7 +499,8 @@ async def classify_intent(user_query: str, conversation_history: list = None) ->
             raise ValueError("Missing 'intent' in response")
         
         # Ensure intent is valid
-        if result["intent"] not in VALID_INTENTS:
+        valid = result["intent"] in VALID_INTENTS
+        if not valid:
             # Default to research if invalid but looks like search, otherwise data_analysis
             result["intent"] = INTENT_DATA_ANALYSIS
             result["confidence"] = 0.5
@@ -154,19 +509,31 @@ async def classify_intent(user_query: str, conversation_history: list = None) ->
         # Ensure entities exists
         if "entities" not in result:
             result["entities"] = {}
+        result["tier"] = TIER_GEMINI
+        _record_tier(result)
+        if valid:
+            intent_cache.set(cache_key, copy.deepcopy(result), version=_CACHE_VERSION)
+            _save_intent_cache_later()
             
         logger.info(f"✅ INTENT CLASSIFIED: {result.get('intent')} | Entities: {result.get('entities')}")
         return result
         
     except Exception as e:
+        # If classification fails, use the local guess when there is one
+        if local["confidence"] > 0:
+            logger.warning(f"⚠️ Classification error: {e}, using local guess {local['intent']}")
+            local["reasoning"] = f"Classification failed: {str(e)}, using {local['reasoning']}"
+            local["tier"] = TIER_FALLBACK
+            return _record_tier(local)
         logger.warning(f"⚠️ Classification error: {e}, defaulting to data_analysis")
-        # If classification fails, default to data_analysis (safest assumption for dashboard app)
-        return {
+        # Otherwise default to data_analysis (safest assumption for dashboard app)
+        return _record_tier({
             "intent": INTENT_DATA_ANALYSIS,
             "confidence": 0.5,
             "reasoning": f"Classification failed: {str(e)}, defaulting to data_analysis",
-            "entities": {}
-        }
+            "entities": {},
+            "tier": TIER_FALLBACK
+        })
 
 
 def get_intent_type(classification_result: dict) -> str:
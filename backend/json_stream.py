@@ -0,0 +1,93 @@
+"""
+Incremental Parsing of a Streamed JSON Array
+
+Research answers are a JSON array of program objects that Gemini streams
+in arbitrary chunks, often inside a markdown fence or a
+{"type": ..., "content": [...]} wrapper. `JSONArrayStream` scans each chunk
+once, tracking string and nesting state, and hands back every object of
+the array as soon as its closing brace arrives, so rows can be sent before
+the model has finished writing the rest.
+"""
+
+import json
+import re
+from typing import Optional
+
+# "..., }" / "..., ]": the usual way a model's JSON is invalid
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def loads_tolerant(text: str) -> Optional[object]:
+    """`json.loads`, retried without trailing commas; None if the text still does not parse."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text))
+    except ValueError:
+        return None
+
+
+class JSONArrayStream:
+    """Objects of the first JSON array in a text that arrives in chunks.
+
+    Anything before the array's opening bracket (a fence, a wrapper object)
+    and after its closing bracket is ignored. Elements that are not objects
+    are skipped, as are objects that do not parse even without trailing
+    commas (counted in `skipped`).
+
+    Attributes:
+        text: everything fed so far
+        closed: whether the array's closing bracket has been seen
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.closed = False
+        self.skipped = 0
+        self._pos = 0
+        self._depth = -1  # -1 before the array, 0 between elements, > 0 inside one
+        self._start = None  # offset of the object being read
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> list:
+        """Append a chunk; returns the objects it completed, in order."""
+        self.text += chunk
+        objects = []
+        text = self.text
+        pos = self._pos
+        while pos < len(text) and not self.closed:
+            ch = text[pos]
+            pos += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif self._depth < 0:
+                if ch == "[":
+                    self._depth = 0
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._start = pos - 1 if ch == "{" else None
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    self.closed = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    value = loads_tolerant(text[self._start:pos])
+                    if isinstance(value, dict):
+                        objects.append(value)
+                    else:
+                        self.skipped += 1
+                    self._start = None
+        self._pos = pos
+        return objects
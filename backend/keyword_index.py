@@ -0,0 +1,97 @@
+"""
+Inverted Substring Index for Campaign Filtering
+
+Campaign keywords, names and program names are lowercased and
+diacritic-folded once ("Mỹ phẩm" -> "my pham"), then indexed as bigram and
+trigram posting lists. A substring query intersects the postings of its
+n-grams and only verifies the few surviving candidates, instead of
+lowercasing and scanning every campaign string on every request.
+"""
+
+import unicodedata
+from typing import Iterable
+
+import numpy as np
+
+
+def fold_text(text: str) -> str:
+    """Lowercase and strip Vietnamese diacritics."""
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return stripped.replace("đ", "d")
+
+
+def _ngrams(text: str, n: int) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class SubstringIndex:
+    """Bigram/trigram posting lists over a list of (campaign code, text) documents."""
+
+    def __init__(self, documents: Iterable[tuple]):
+        self.doc_campaign = []
+        self.doc_text = []
+        postings = {}
+        for code, text in documents:
+            doc = len(self.doc_text)
+            folded = fold_text(text)
+            self.doc_campaign.append(code)
+            self.doc_text.append(folded)
+            for gram in _ngrams(folded, 2) | _ngrams(folded, 3):
+                postings.setdefault(gram, []).append(doc)
+
+        self.doc_campaign = np.asarray(self.doc_campaign, dtype=np.int64)
+        self.postings = {gram: np.asarray(docs, dtype=np.int64) for gram, docs in postings.items()}
+
+    def _candidates(self, query: str) -> np.ndarray:
+        """Documents that contain every n-gram of the query."""
+        grams = _ngrams(query, 3) if len(query) >= 3 else {query}
+        lists = []
+        for gram in grams:
+            docs = self.postings.get(gram)
+            if docs is None:
+                return np.empty(0, dtype=np.int64)
+            lists.append(docs)
+        lists.sort(key=len)
+        result = lists[0]
+        for docs in lists[1:]:
+            result = np.intersect1d(result, docs, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def search(self, query: str) -> np.ndarray:
+        """Campaign codes with at least one document containing `query` (folded)."""
+        folded = fold_text(query)
+        if len(folded) < 2:
+            # Too short for the n-gram postings: scan the pre-folded texts
+            docs = [i for i, text in enumerate(self.doc_text) if folded in text]
+        else:
+            docs = [i for i in self._candidates(folded).tolist() if folded in self.doc_text[i]]
+        return np.unique(self.doc_campaign[np.asarray(docs, dtype=np.int64)])
+
+
+class CampaignSearchIndex:
+    """Substring indexes over campaign keywords/names and program names."""
+
+    def __init__(self, campaigns: list):
+        """`campaigns[code]` is the `Campaign` record for that code, or None."""
+        self.keywords = SubstringIndex(
+            (code, text)
+            for code, c in enumerate(campaigns) if c
+            for text in [*c.keywords, c.name]
+        )
+        self.programs = SubstringIndex(
+            (code, c.program) for code, c in enumerate(campaigns) if c
+        )
+
+    def match_keywords(self, keywords: Iterable[str]) -> np.ndarray:
+        """Campaigns whose keywords or name contain ANY of the given keywords."""
+        matches = [self.keywords.search(k) for k in keywords]
+        if not matches:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(matches))
+
+    def match_program(self, program: str) -> np.ndarray:
+        """Campaigns whose program name contains `program`."""
+        return self.programs.search(program)
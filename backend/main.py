@@ -1,9 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from pydantic import BaseModel
 import os
+import asyncio
 from generator import generate_research_stream
 from openrouter_client import fetch_suggestions
 
@@ -38,12 +39,19 @@ class ChatRequest(BaseModel):
 class SuggestionRequest(BaseModel):
     prompt: str
 
+class ListPageRequest(BaseModel):
+    cursor: str
+
+class IngestRequest(BaseModel):
+    rows: list
+
 @app.get("/")
 async def health_check():
     return {"status": "ok", "service": "Adecos MVP Backend"}
 
 @app.post("/api/research/stream")
 async def stream_research(request: ResearchRequest):
+    """Affiliate programs for a niche: one NDJSON row per program as it is generated, then the full table."""
     return StreamingResponse(
         generate_research_stream(request.niche),
         media_type="application/x-ndjson"
@@ -53,7 +61,7 @@ async def stream_research(request: ResearchRequest):
 async def stream_chat(request: ChatRequest):
     """
     LEGACY endpoint for conversational interface.
-    Accepts history, routes intent, and streams back 'type: table' or 'type: text'.
+    Accepts history, routes intent, and streams back 'type: row' lines then 'type: table', or 'type: text'.
     For the new AI Agent feature, use /api/agent/chat instead.
     """
     from generator import generate_chat_stream
@@ -73,6 +81,9 @@ async def agent_chat(request: ChatRequest):
     - Narrative introductions before data
     - Conversation context preservation
     
+    Streams NDJSON events: status (intent routed), section (chart/table
+    ready), token (narrative chunks), then done with the complete response.
+    
     Returns response types:
     - composite: narrative + chart/table sections
     - chart: chart data with config
@@ -85,6 +96,40 @@ async def agent_chat(request: ChatRequest):
         media_type="application/x-ndjson"
     )
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss/eviction counters of the data query cache."""
+    from data_tools import query_cache
+    return {"queryCache": query_cache.stats()}
+
+@app.get("/api/intent/stats")
+async def intent_stats():
+    """How many chat turns each intent classification tier answered."""
+    from intent_classifier import classifier_stats
+    return classifier_stats()
+
+@app.post("/api/list/next")
+async def next_list_page(request: ListPageRequest):
+    """Next page of a campaign/account table, from the cursor sent with the previous page."""
+    from data_tools import next_list_page as fetch_page
+    try:
+        page = await asyncio.to_thread(fetch_page, request.cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page.to_dict()
+
+@app.post("/api/ingest/daily")
+async def ingest_daily(request: IngestRequest):
+    """Append or update daily campaign metrics without rebuilding the data store."""
+    from data_tools import ingest_daily_metrics
+    try:
+        result = await asyncio.to_thread(ingest_daily_metrics, request.rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return result.to_dict()
+
 @app.post("/api/suggestions")
 async def get_suggestions(request: SuggestionRequest):
     """
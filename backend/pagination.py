@@ -0,0 +1,96 @@
+"""
+Cursor Pagination for the List Tools
+
+Campaign and account lists are returned one page at a time. Records are
+ranked once per (sort key, direction); a page is the next `page_size` ranks
+after the last row already sent, so only the rows on the page are turned
+into dicts. The cursor is an opaque token carrying the filters, sort and the
+last rank, which the follow-up endpoint hands back to fetch the next page.
+"""
+
+import os
+import json
+import base64
+from typing import Optional
+
+import numpy as np
+
+from keyword_index import fold_text
+
+DEFAULT_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 500
+
+SORT_ORDERS = ("asc", "desc")
+
+
+def encode_cursor(state: dict) -> str:
+    """Serialize pagination state into a URL-safe token."""
+    raw = json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Inverse of `encode_cursor`; raises ValueError for malformed tokens."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(state, dict):
+        raise ValueError("Invalid cursor")
+    return state
+
+
+def clamp_page_size(page_size: Optional[int]) -> int:
+    if page_size is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(page_size), MAX_PAGE_SIZE))
+
+
+def _sort_value(value):
+    # Strings compare diacritic-folded
+    if isinstance(value, str):
+        return fold_text(value)
+    return value
+
+
+def sort_order(records: list, sort_by: Optional[str], descending: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """Rank every record position for a sort key.
+
+    Returns (ranks, order): `ranks[i]` is the rank of `records[i]` and
+    `order[r]` the position holding rank r. With no `sort_by` the ranks
+    follow the list order. Ties keep list order in both directions, and
+    None records, then records missing the key, rank last in both
+    directions.
+    """
+    n = len(records)
+    if sort_by is None:
+        order = np.arange(n, dtype=np.int64)
+        if descending:
+            order = order[::-1].copy()
+    else:
+        present = [i for i, r in enumerate(records) if r is not None and r.get(sort_by) is not None]
+        present.sort(key=lambda i: _sort_value(records[i].get(sort_by)), reverse=descending)
+        # sort(reverse=True) keeps ties in list order, so no extra tie-breaker is needed
+        no_value = [i for i, r in enumerate(records) if r is not None and r.get(sort_by) is None]
+        missing = [i for i, r in enumerate(records) if r is None]
+        order = np.asarray(present + no_value + missing, dtype=np.int64)
+    ranks = np.empty(n, dtype=np.int64)
+    ranks[order] = np.arange(n, dtype=np.int64)
+    return ranks, order
+
+
+def page_positions(positions: np.ndarray, ranks: np.ndarray, order: np.ndarray,
+                   after: int, page_size: int) -> tuple[np.ndarray, Optional[int]]:
+    """The next page among candidate `positions`.
+
+    Picks the `page_size` smallest ranks greater than `after` with a partial
+    selection. Returns (page positions in rank order, last rank on the page
+    if more candidates remain, else None).
+    """
+    candidate_ranks = ranks[positions]
+    candidate_ranks = candidate_ranks[candidate_ranks > after]
+    if len(candidate_ranks) > page_size:
+        page = np.sort(np.partition(candidate_ranks, page_size - 1)[:page_size])
+        return order[page], int(page[-1])
+    return order[np.sort(candidate_ranks)], None
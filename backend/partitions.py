@@ -0,0 +1,69 @@
+"""
+Month-Partitioned Parallel Aggregation
+
+Large scans are split into contiguous, month-aligned date partitions that are
+aggregated concurrently on a shared thread pool; the per-partition sums are
+then merged (see `aggregation.merge_partials`). Threads rather than
+processes: the sorts and reductions run in NumPy with the GIL released, and
+the (possibly memory-mapped) fact arrays are shared without pickling.
+
+Tuning:
+    AGGREGATION_WORKERS   pool size (default: CPU count; 1 disables)
+    PARALLEL_MIN_ROWS     smallest planned scan worth partitioning
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+
+from rollups import bucket_start, next_bucket_start
+
+AGGREGATION_WORKERS = int(os.getenv("AGGREGATION_WORKERS", str(os.cpu_count() or 1)))
+PARALLEL_MIN_ROWS = int(os.getenv("PARALLEL_MIN_ROWS", "250000"))
+
+# Partitions per worker; a few more than workers evens out uneven months
+_PARTITIONS_PER_WORKER = 2
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=AGGREGATION_WORKERS, thread_name_prefix="aggregate")
+    return _pool
+
+
+def month_partitions(start_ord: int, end_ord: int, max_parts: Optional[int] = None) -> list:
+    """Split [start_ord, end_ord] at month starts into at most `max_parts` inclusive ranges.
+
+    Consecutive months are grouped so partitions hold about the same number
+    of months.
+    """
+    max_parts = max_parts or AGGREGATION_WORKERS * _PARTITIONS_PER_WORKER
+    starts = [start_ord]
+    month = int(next_bucket_start(np.int64(start_ord), "month"))
+    while month <= end_ord:
+        starts.append(month)
+        month = int(next_bucket_start(np.int64(month), "month"))
+    if len(starts) > max_parts:
+        starts = [starts[i] for i in np.linspace(0, len(starts), max_parts, endpoint=False).astype(int)]
+    return [(lo, hi - 1) for lo, hi in zip(starts, starts[1:] + [end_ord + 1])]
+
+
+def map_partitions(fn: Callable[[int, int], object], partitions: list) -> list:
+    """`fn(lo, hi)` for every partition on the pool, results in partition order."""
+    if len(partitions) <= 1 or AGGREGATION_WORKERS <= 1:
+        return [fn(lo, hi) for lo, hi in partitions]
+    return list(_executor().map(lambda part: fn(*part), partitions))
+
+
+def should_partition(planned_rows: int, start_ord: int, end_ord: int) -> bool:
+    """Whether a scan is big enough, and spans enough months, to run in parallel."""
+    return (
+        AGGREGATION_WORKERS > 1
+        and planned_rows >= PARALLEL_MIN_ROWS
+        and int(bucket_start(np.int64(end_ord), "month")) > start_ord
+    )
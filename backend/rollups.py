@@ -0,0 +1,335 @@
+"""
+Pre-aggregated Rollup Cubes for the Fact Store
+
+Totals are precomputed at (week, account), (month, account), (week, campaign)
+and (month, campaign) grains when the data loads. The scan planner answers a
+query from the coarsest cube that can serve it: whole buckets inside the date
+range come from the cube, and the partial buckets at either edge fall back to
+the daily fact rows. The set also carries the monthly sketches (see
+`sketches.py`) and keeps them in step with every upsert.
+"""
+
+import threading
+from typing import Optional
+
+import numpy as np
+
+from fact_store import FactStore, METRIC_COLUMNS
+from aggregation import aggregate
+from sketches import MonthlySketches
+
+TIME_GRAINS = ("month", "week")
+ENTITY_GRAINS = ("account", "campaign")
+
+_EPOCH_ORDINAL = 719163  # date(1970, 1, 1).toordinal()
+
+
+def bucket_start(date_ord: np.ndarray, grain: str) -> np.ndarray:
+    """Ordinal of the first day of the week (Monday) or month containing each date."""
+    date_ord = np.asarray(date_ord, dtype=np.int64)
+    if grain == "week":
+        # Python ordinal 1 is a Monday
+        return date_ord - (date_ord - 1) % 7
+    if grain == "month":
+        months = (date_ord - _EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]")
+        return months.astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+    return date_ord
+
+
+def next_bucket_start(date_ord: np.ndarray, grain: str) -> np.ndarray:
+    """Ordinal of the first day of the bucket following the one containing each date."""
+    date_ord = np.asarray(date_ord, dtype=np.int64)
+    if grain == "week":
+        return bucket_start(date_ord, "week") + 7
+    if grain == "month":
+        months = (date_ord - _EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]") + 1
+        return months.astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+    return date_ord + 1
+
+
+def _month_number(date_ord: np.ndarray) -> np.ndarray:
+    return (date_ord - _EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def bucket_offset(date_ord: np.ndarray, origin_ord: int, grain: str) -> np.ndarray:
+    """How many buckets each date lies after the bucket containing `origin_ord`."""
+    date_ord = np.asarray(date_ord, dtype=np.int64)
+    if grain == "week":
+        return (bucket_start(date_ord, "week") - bucket_start(origin_ord, "week")) // 7
+    if grain == "month":
+        return _month_number(date_ord) - _month_number(np.int64(origin_ord))
+    return date_ord - origin_ord
+
+
+def offset_bucket_start(origin_ord: int, offsets: np.ndarray, grain: str) -> np.ndarray:
+    """First day of the bucket `offsets` buckets after the one containing `origin_ord`."""
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if grain == "week":
+        return bucket_start(origin_ord, "week") + 7 * offsets
+    if grain == "month":
+        months = (_month_number(np.int64(origin_ord)) + offsets).astype("datetime64[M]")
+        return months.astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+    return origin_ord + offsets
+
+
+class Fragment:
+    """A piece of a scan: either raw fact rows or rollup cube cells.
+
+    `date_ord` is the row date, or the bucket start for cube cells.
+    Exactly one of `campaign` / `account` is set, depending on the grain.
+    `order_key` ranks rows in store order (date, then campaign) and is used to
+    keep first-appearance ordering stable regardless of the source.
+    """
+
+    def __init__(self, date_ord, metrics: dict, order_key, campaign=None, account=None):
+        self.date_ord = date_ord
+        self.metrics = metrics
+        self.order_key = order_key
+        self.campaign = campaign
+        self.account = account
+
+    def __len__(self) -> int:
+        return len(self.date_ord)
+
+
+def store_order_key(store: FactStore, date_ord: np.ndarray, campaign: np.ndarray) -> np.ndarray:
+    """Rank of a (date, campaign) pair in store order."""
+    return date_ord.astype(np.int64) * len(store.campaign_ids) + campaign
+
+
+class RollupCube:
+    """Totals per (time bucket, entity) cell, sorted by bucket then entity."""
+
+    def __init__(self, time_grain: str, entity_grain: str, bucket, entity, metrics: dict, order_key):
+        self.time_grain = time_grain
+        self.entity_grain = entity_grain
+        self.bucket = bucket
+        self.entity = entity
+        self.metrics = metrics
+        self.order_key = order_key
+
+    @classmethod
+    def build(cls, store: FactStore, time_grain: str, entity_grain: str, campaign_account: np.ndarray) -> "RollupCube":
+        """Aggregate the whole fact store at the given grain."""
+        bucket = bucket_start(store.date_ord, time_grain)
+        entity = store.campaign if entity_grain == "campaign" else campaign_account[store.campaign]
+        n_entities = int(entity.max()) + 1 if len(entity) else 1
+        keys = bucket * n_entities + entity
+
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        if len(sorted_keys):
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        else:
+            starts = np.empty(0, dtype=np.int64)
+        cell_keys = sorted_keys[starts]
+        metrics = {m: np.add.reduceat(store.metrics[m][order], starts) if len(starts) else store.metrics[m][:0]
+                   for m in METRIC_COLUMNS}
+        order_key = store_order_key(store, store.date_ord, store.campaign)[order]
+        order_key = np.minimum.reduceat(order_key, starts) if len(starts) else order_key[:0]
+
+        return cls(time_grain, entity_grain, cell_keys // n_entities, cell_keys % n_entities, metrics, order_key)
+
+    def __len__(self) -> int:
+        return len(self.bucket)
+
+    def merged(self, date_ord: np.ndarray, entity: np.ndarray, deltas: dict, order_key: np.ndarray) -> "RollupCube":
+        """A new cube with per-row metric deltas added to their cells (copy-on-write).
+
+        Cells that do not exist yet are inserted in (bucket, entity) order.
+        """
+        bucket = bucket_start(date_ord, self.time_grain)
+        n_entities = int(max(self.entity.max() if len(self.entity) else 0, entity.max() if len(entity) else 0)) + 1
+        changes = aggregate([bucket * n_entities + entity], deltas, order_key=order_key)
+        change_keys = changes.keys[0]
+
+        cell_keys = self.bucket.astype(np.int64) * n_entities + self.entity
+        pos = np.searchsorted(cell_keys, change_keys)
+        exists = np.zeros(len(change_keys), dtype=bool)
+        in_range = pos < len(cell_keys)
+        exists[in_range] = cell_keys[pos[in_range]] == change_keys[in_range]
+        update_at, insert_at = pos[exists], pos[~exists]
+
+        metrics = {}
+        for m, column in self.metrics.items():
+            updated = np.array(column, copy=True)
+            updated[update_at] += changes.totals[m][exists].astype(column.dtype)
+            metrics[m] = np.insert(updated, insert_at, changes.totals[m][~exists].astype(column.dtype))
+        cell_order = np.array(self.order_key, copy=True)
+        cell_order[update_at] = np.minimum(cell_order[update_at], changes.first[exists])
+        new_keys = change_keys[~exists]
+        return RollupCube(
+            self.time_grain, self.entity_grain,
+            np.insert(self.bucket, insert_at, new_keys // n_entities),
+            np.insert(self.entity, insert_at, new_keys % n_entities),
+            metrics,
+            np.insert(cell_order, insert_at, changes.first[~exists]),
+        )
+
+    def cell_range(self, first_bucket: int, last_bucket: int) -> slice:
+        """Cells whose bucket start lies in [first_bucket, last_bucket]."""
+        as_bucket = self.bucket.dtype.type
+        lo = np.searchsorted(self.bucket, as_bucket(first_bucket), side="left")
+        hi = np.searchsorted(self.bucket, as_bucket(last_bucket), side="right")
+        return slice(int(lo), int(hi))
+
+    def fragment(self, cells: slice, entity_codes: Optional[np.ndarray]) -> Fragment:
+        """Materialize a cell range, optionally restricted to some entities."""
+        idx = np.arange(cells.start, cells.stop)
+        if entity_codes is not None:
+            idx = idx[np.isin(self.entity[idx], entity_codes)]
+        metrics = {m: col[idx] for m, col in self.metrics.items()}
+        entity = self.entity[idx]
+        if self.entity_grain == "campaign":
+            return Fragment(self.bucket[idx], metrics, self.order_key[idx], campaign=entity)
+        return Fragment(self.bucket[idx], metrics, self.order_key[idx], account=entity)
+
+
+class RollupSet:
+    """All rollup cubes for one fact store, plus the scan planner."""
+
+    def __init__(self, store: FactStore, campaign_account: np.ndarray, cubes: dict,
+                 sketches: Optional[MonthlySketches] = None):
+        self.store = store
+        self.campaign_account = campaign_account
+        self.cubes = cubes
+        self.account_sizes = np.bincount(campaign_account)
+        self._sketches = sketches
+        self._sketch_lock = threading.Lock()
+
+    @property
+    def sketches(self) -> MonthlySketches:
+        """Monthly sketches of the store, built on first use and then maintained by `apply`."""
+        if self._sketches is None:
+            with self._sketch_lock:
+                if self._sketches is None:
+                    cube = self.cubes.get(("month", "campaign"))
+                    self._sketches = MonthlySketches.build(
+                        self.store, (cube.bucket, cube.entity) if cube is not None else None
+                    )
+        return self._sketches
+
+    @property
+    def has_sketches(self) -> bool:
+        return self._sketches is not None
+
+    @classmethod
+    def build(cls, store: FactStore, campaign_account: np.ndarray) -> "RollupSet":
+        """Precompute every (time grain, entity grain) cube.
+
+        `campaign_account[c]` is the account code of fact-store campaign code c.
+        """
+        cubes = {
+            (t, e): RollupCube.build(store, t, e, campaign_account)
+            for t in TIME_GRAINS for e in ENTITY_GRAINS
+        }
+        return cls(store, campaign_account, cubes)
+
+    def apply(self, store: FactStore, changes: tuple, campaign_account: np.ndarray) -> "RollupSet":
+        """Rollups for `store` after `FactStore.upsert`, updated cell by cell (copy-on-write).
+
+        `changes` is returned by the upsert and `campaign_account` covers any
+        new campaign codes. If existing campaigns moved to other account
+        codes, the account cubes are rebuilt instead. Sketches are updated
+        only if they have been built.
+        """
+        date_ord, campaign, deltas = changes[:3]
+        order_key = store_order_key(store, date_ord, campaign)
+        n_old, n_new = len(self.store.campaign_ids), len(store.campaign_ids)
+        accounts_moved = not np.array_equal(campaign_account[:n_old], self.campaign_account)
+        cubes = {}
+        for key, cube in self.cubes.items():
+            if accounts_moved and cube.entity_grain == "account":
+                cubes[key] = RollupCube.build(store, cube.time_grain, cube.entity_grain, campaign_account)
+                continue
+            if n_new != n_old:
+                # Order keys are date * n_campaigns + campaign; re-base them on the new code space
+                cube = RollupCube(cube.time_grain, cube.entity_grain, cube.bucket, cube.entity, cube.metrics,
+                                  (cube.order_key // n_old) * n_new + cube.order_key % n_old)
+            entity = campaign if cube.entity_grain == "campaign" else campaign_account[campaign]
+            cubes[key] = cube.merged(date_ord, entity, deltas, order_key)
+        sketches = self._sketches.apply(changes) if self._sketches is not None else None
+        return RollupSet(store, campaign_account, cubes, sketches)
+
+    def _account_codes_for(self, campaign_codes: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Account codes if the campaign selection is made of whole accounts, else None."""
+        if campaign_codes is None:
+            return np.arange(len(self.account_sizes))
+        accounts = self.campaign_account[campaign_codes]
+        selected = np.bincount(accounts, minlength=len(self.account_sizes))
+        touched = np.flatnonzero(selected)
+        if np.array_equal(selected[touched], self.account_sizes[touched]):
+            return touched
+        return None
+
+    def _base(self, start_ord: int, end_ord: int, campaign_codes: Optional[np.ndarray]) -> Fragment:
+        rows = self.store.rows(start_ord, end_ord, campaign_codes)
+        date_ord = self.store.date_ord[rows]
+        campaign = self.store.campaign[rows]
+        return Fragment(
+            date_ord,
+            {m: col[rows] for m, col in self.store.metrics.items()},
+            store_order_key(self.store, date_ord, campaign),
+            campaign=campaign,
+        )
+
+    def _rows_between(self, start_ord: int, end_ord: int) -> int:
+        if start_ord > end_ord:
+            return 0
+        window = self.store.date_slice(start_ord, end_ord)
+        return window.stop - window.start
+
+    def scan(self, start_ord: int, end_ord: int, campaign_codes: Optional[np.ndarray] = None,
+             time_grain: Optional[str] = None, entity_grain: str = "account") -> list:
+        """Return the fragments covering [start_ord, end_ord] for the selection.
+
+        Args:
+            time_grain: output time bucket ("week", "month") or None when the
+                result is not bucketed by time. Daily output must not use cubes.
+            entity_grain: finest entity the output needs ("account" or "campaign").
+
+        The cheapest eligible plan wins, estimated as cube cells plus edge rows
+        read; ties go to the coarser cube.
+        """
+        best_cost, best_plan, account_codes = self._plan(start_ord, end_ord, campaign_codes, time_grain, entity_grain)
+
+        if best_plan is None:
+            return [self._base(start_ord, end_ord, campaign_codes)]
+
+        cube, cells, first, last_end = best_plan
+        fragments = [cube.fragment(cells, account_codes if cube.entity_grain == "account" else campaign_codes)]
+        if start_ord < first:
+            fragments.append(self._base(start_ord, first - 1, campaign_codes))
+        if last_end < end_ord:
+            fragments.append(self._base(last_end + 1, end_ord, campaign_codes))
+        return fragments
+
+    def scan_cost(self, start_ord: int, end_ord: int, campaign_codes: Optional[np.ndarray] = None,
+                  time_grain: Optional[str] = None, entity_grain: str = "account") -> int:
+        """Rows and cube cells the cheapest `scan` plan reads."""
+        return self._plan(start_ord, end_ord, campaign_codes, time_grain, entity_grain)[0]
+
+    def _plan(self, start_ord: int, end_ord: int, campaign_codes: Optional[np.ndarray],
+              time_grain: Optional[str], entity_grain: str) -> tuple:
+        """(cost, best cube plan or None for a plain fact scan, account codes of the selection)."""
+        best_cost = self._rows_between(start_ord, end_ord)
+        best_plan = None
+
+        account_codes = self._account_codes_for(campaign_codes)
+        for (t, e), cube in self.cubes.items():
+            if time_grain is not None and t != time_grain:
+                continue
+            if e == "account" and (entity_grain != "account" or account_codes is None):
+                continue
+
+            first = int(next_bucket_start(start_ord - 1, t))
+            last_end = int(bucket_start(end_ord + 1, t)) - 1
+            if first > last_end:
+                continue
+            cells = cube.cell_range(first, int(bucket_start(last_end, t)))
+            cost = (cells.stop - cells.start) + self._rows_between(start_ord, first - 1) \
+                + self._rows_between(last_end + 1, end_ord)
+            if cost < best_cost:
+                best_cost = cost
+                best_plan = (cube, cells, first, last_end)
+        return best_cost, best_plan, account_codes
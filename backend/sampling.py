@@ -0,0 +1,152 @@
+"""
+Stratified Sampling for Approximate Aggregation
+
+An approximate query reads a fixed budget of fact rows however long the
+date range is. Every month of the range is a stratum and gets a share of
+`APPROX_SAMPLE_ROWS` proportional to its row count, taken as a simple
+random sample without replacement, which is what the variance estimate
+below assumes.
+
+Sampled metrics are scaled up by (rows / sampled rows) of their stratum.
+Each group also gets the estimated variance of every total, stored in the
+group's totals as `<metric>_variance` so it survives re-grouping, ranking
+and reordering like any other summed column: margins of error of summed
+groups come from summing their variances.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from fact_store import METRIC_COLUMNS
+from aggregation import GroupedMetrics, aggregate
+from rollups import RollupSet, bucket_start, next_bucket_start, store_order_key
+
+# Fact rows read per approximate query
+APPROX_SAMPLE_ROWS = int(os.getenv("APPROX_SAMPLE_ROWS", "100000"))
+
+# z for the reported two-sided confidence level
+CONFIDENCE_LEVEL = 0.95
+_Z = 1.96
+
+VARIANCE_SUFFIX = "_variance"
+
+
+@dataclass
+class SampleInfo:
+    """How an approximate aggregate was sampled."""
+    sampled_rows: int
+    total_rows: int
+    strata: int
+
+    @property
+    def rate(self) -> float:
+        return self.sampled_rows / self.total_rows if self.total_rows else 1.0
+
+
+def variance_column(metric: str) -> str:
+    return f"{metric}{VARIANCE_SUFFIX}"
+
+
+def margin_of_error(variance) -> np.ndarray:
+    """Half-width of the confidence interval for totals with the given variance."""
+    return _Z * np.sqrt(np.maximum(np.asarray(variance, dtype=np.float64), 0))
+
+
+def month_strata(store, start_ord: int, end_ord: int) -> list:
+    """Row slice of every month of [start_ord, end_ord] that has rows."""
+    strata = []
+    lo = start_ord
+    while lo <= end_ord:
+        hi = min(int(next_bucket_start(np.int64(lo), "month")) - 1, end_ord)
+        rows = store.date_slice(lo, hi)
+        if rows.stop > rows.start:
+            strata.append(rows)
+        lo = hi + 1
+    return strata
+
+
+def stratified_sample(strata: list, budget: int, rng: np.random.Generator) -> tuple:
+    """Simple random sample without replacement of each stratum, sized in proportion to it.
+
+    Returns (row numbers in ascending order within each stratum, stratum
+    index per row, sampled rows per stratum).
+    """
+    sizes = np.array([s.stop - s.start for s in strata], dtype=np.int64)
+    total = int(sizes.sum())
+    # At least 2 rows per stratum so its variance can be estimated
+    counts = np.minimum(sizes, np.maximum(np.round(sizes * budget / max(total, 1)).astype(np.int64), 2))
+
+    rows, stratum = [], []
+    for h, (window, n) in enumerate(zip(strata, counts.tolist())):
+        picked = rng.choice(window.stop - window.start, size=n, replace=False, shuffle=False)
+        rows.append(window.start + np.sort(picked).astype(np.int64))
+        stratum.append(np.full(n, h, dtype=np.int64))
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, counts
+    return np.concatenate(rows), np.concatenate(stratum), counts
+
+
+def sample_aggregate(rollups: RollupSet, start_ord: int, end_ord: int,
+                     campaign_codes: Optional[np.ndarray] = None, time_grain: Optional[str] = None,
+                     entity_grain: Optional[str] = None, budget: int = APPROX_SAMPLE_ROWS) -> tuple:
+    """Estimated `AdsStorage.aggregate` totals from a stratified sample of the fact rows.
+
+    Returns (GroupedMetrics, SampleInfo). Groups carry a `<metric>_variance`
+    column per metric. Rows outside `campaign_codes` count as zeros of their
+    stratum, so the estimates stay unbiased for any selection. Groups with
+    no sampled rows are missing. The sample is the same for a given range
+    and data version.
+    """
+    store = rollups.store
+    strata = month_strata(store, start_ord, end_ord)
+    rng = np.random.default_rng([start_ord, end_ord, store.version])
+    rows, stratum, counts = stratified_sample(strata, budget, rng)
+    sizes = np.array([s.stop - s.start for s in strata], dtype=np.int64)
+    info = SampleInfo(len(rows), int(sizes.sum()), len(strata))
+
+    if campaign_codes is not None:
+        selected = np.isin(store.campaign[rows], campaign_codes)
+        rows, stratum = rows[selected], stratum[selected]
+
+    date_ord = store.date_ord[rows]
+    campaign = store.campaign[rows]
+    keys = []
+    if time_grain:
+        keys.append(bucket_start(date_ord, time_grain))
+    if entity_grain == "campaign":
+        keys.append(campaign.astype(np.int64))
+    elif entity_grain == "account":
+        keys.append(rollups.campaign_account[campaign])
+    if not keys:
+        keys.append(np.zeros(len(rows), dtype=np.int64))
+
+    # Per (group, stratum): sum and sum of squares of each metric over the sample
+    columns = {}
+    for m in METRIC_COLUMNS:
+        values = store.metrics[m][rows].astype(np.float64)
+        columns[m] = values
+        columns[f"{m}_squares"] = values * values
+    cells = aggregate(keys + [stratum], columns, order_key=store_order_key(store, date_ord, campaign))
+
+    h = cells.keys[-1]
+    n_h = counts[h].astype(np.float64)
+    N_h = sizes[h].astype(np.float64)
+    # Var(N_h * mean) = N_h^2 (1 - n_h/N_h) s_h^2 / n_h, with s_h^2 over all n_h sampled rows (zeros included)
+    scale = N_h * N_h * (1 - n_h / N_h) / n_h / np.maximum(n_h - 1, 1)
+    estimates = {}
+    for m in METRIC_COLUMNS:
+        sums, squares = cells.totals[m], cells.totals[f"{m}_squares"]
+        estimates[m] = sums * (N_h / n_h)
+        estimates[variance_column(m)] = scale * np.maximum(squares - sums * sums / n_h, 0)
+    groups = aggregate(cells.keys[:-1], estimates, order_key=cells.first)
+
+    for m in METRIC_COLUMNS:
+        if np.issubdtype(store.metrics[m].dtype, np.integer):
+            groups.totals[m] = np.round(groups.totals[m]).astype(np.int64)
+    if not (time_grain or entity_grain):
+        groups = GroupedMetrics([], groups.totals, groups.first)
+    return groups, info
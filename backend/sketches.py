@@ -0,0 +1,221 @@
+"""
+Mergeable Monthly Sketches over the Fact Store
+
+Two fixed-size summaries are kept per calendar month:
+
+- a HyperLogLog of the campaigns with data that month (distinct counts),
+- a log-bucketed histogram of every daily metric value (quantiles with a
+  bounded relative error, as in DDSketch).
+
+Both merge across months (register max / bucket sums), so distinct counts
+and percentiles over any run of months cost the same however many fact
+rows the months hold. `MonthlySketches.apply` folds each upsert into them
+copy-on-write, alongside the rollup cubes.
+"""
+
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+
+from fact_store import FactStore, METRIC_COLUMNS
+
+# 2^14 registers (16 KB a month): about 0.8% standard error on distinct counts
+HLL_PRECISION = 14
+_HLL_REGISTERS = 1 << HLL_PRECISION
+
+# Quantiles are within this relative error of a true value
+SKETCH_RELATIVE_ACCURACY = float(os.getenv("SKETCH_RELATIVE_ACCURACY", "0.02"))
+_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = np.log(_GAMMA)
+# Bucket 0 holds zeros (and negatives); values are clipped to [_MIN_VALUE, _MAX_VALUE]
+_MIN_VALUE, _MAX_VALUE = 1e-2, 1e13
+_BUCKET_OFFSET = int(np.ceil(np.log(_MIN_VALUE) / _LOG_GAMMA)) - 1
+_N_BUCKETS = int(np.ceil(np.log(_MAX_VALUE) / _LOG_GAMMA)) - _BUCKET_OFFSET + 1
+
+_EPOCH_ORDINAL = 719163  # date(1970, 1, 1).toordinal()
+
+
+def month_number(date_ord) -> np.ndarray:
+    """Months since 1970-01 for each ordinal date."""
+    days = np.asarray(date_ord, dtype=np.int64) - _EPOCH_ORDINAL
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def month_bounds(month: int) -> tuple:
+    """(first, last) ordinal date of a month number."""
+    first = np.datetime64(int(month), "M").astype("datetime64[D]").astype(np.int64)
+    last = np.datetime64(int(month) + 1, "M").astype("datetime64[D]").astype(np.int64) - 1
+    return int(first) + _EPOCH_ORDINAL, int(last) + _EPOCH_ORDINAL
+
+
+def hash64(values) -> np.ndarray:
+    """splitmix64 finalizer: well-mixed 64-bit hashes of integer keys."""
+    x = np.asarray(values).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def hll_positions(keys) -> tuple:
+    """(register index, rank) of each key for a HyperLogLog with `HLL_PRECISION` bits."""
+    hashes = hash64(keys)
+    width = 64 - HLL_PRECISION
+    register = (hashes >> np.uint64(width)).astype(np.int64)
+    rest = (hashes & np.uint64((1 << width) - 1)).astype(np.float64)  # < 2^52, exact as float
+    # Rank = position of the leftmost 1 bit in the remaining `width` bits
+    bit_length = np.frexp(rest)[1]
+    return register, (width - bit_length + 1).astype(np.uint8)
+
+
+def hll_estimate(registers: np.ndarray) -> float:
+    """Cardinality estimate from one row of registers (with the small-range correction)."""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return float(estimate)
+
+
+def value_buckets(values) -> np.ndarray:
+    """Histogram bucket of each metric value."""
+    values = np.asarray(values, dtype=np.float64)
+    buckets = np.zeros(len(values), dtype=np.int64)
+    positive = values > 0
+    clipped = np.clip(values[positive], _MIN_VALUE, _MAX_VALUE)
+    buckets[positive] = np.ceil(np.log(clipped) / _LOG_GAMMA).astype(np.int64) - _BUCKET_OFFSET
+    return buckets
+
+
+def bucket_value(bucket: int) -> float:
+    """Representative value of a bucket (within the relative accuracy of anything in it)."""
+    if bucket <= 0:
+        return 0.0
+    return float(2 * _GAMMA ** (bucket + _BUCKET_OFFSET) / (_GAMMA + 1))
+
+
+def histogram_quantiles(counts: np.ndarray, quantiles: Sequence[float]) -> list:
+    """Values at the given quantiles (0-1) of one bucket-count histogram; None if empty."""
+    total = counts.sum()
+    if total <= 0:
+        return [None] * len(quantiles)
+    cumulative = np.cumsum(counts)
+    ranks = np.asarray(quantiles, dtype=np.float64) * (total - 1)
+    return [bucket_value(int(b)) for b in np.searchsorted(cumulative, ranks, side="right")]
+
+
+class MonthlySketches:
+    """HyperLogLog registers and metric histograms for each month in [first_month, ...].
+
+    Attributes:
+        first_month: month number (see `month_number`) of row 0
+        registers: (months, 2^HLL_PRECISION) uint8 registers of campaign codes
+        histograms: metric -> (months, buckets) counts of daily row values
+    """
+
+    def __init__(self, first_month: int, registers: np.ndarray, histograms: dict):
+        self.first_month = first_month
+        self.registers = registers
+        self.histograms = histograms
+
+    @classmethod
+    def empty(cls, first_month: int, n_months: int) -> "MonthlySketches":
+        return cls(
+            first_month,
+            np.zeros((n_months, _HLL_REGISTERS), dtype=np.uint8),
+            {m: np.zeros((n_months, _N_BUCKETS), dtype=np.int64) for m in METRIC_COLUMNS},
+        )
+
+    @classmethod
+    def build(cls, store: FactStore, month_cells: Optional[tuple] = None) -> "MonthlySketches":
+        """Sketch the whole fact store.
+
+        `month_cells` is an optional (month start ordinal, campaign code) pair
+        of arrays with every distinct month/campaign combination (e.g. the
+        (month, campaign) rollup cube), which saves a pass over the rows.
+        """
+        if not len(store):
+            return cls.empty(0, 0)
+        months = month_number(store.date_ord)
+        first = int(months[0])
+        sketches = cls.empty(first, int(months[-1]) - first + 1)
+
+        if month_cells is None:
+            pairs = np.unique(months * len(store.campaign_ids) + store.campaign)
+            cell_months, cell_campaigns = np.divmod(pairs, len(store.campaign_ids))
+        else:
+            cell_months, cell_campaigns = month_number(month_cells[0]), month_cells[1]
+        sketches._add_campaigns(cell_months - first, cell_campaigns)
+
+        rows = months - first
+        for m in METRIC_COLUMNS:
+            sketches._count_values(m, rows, store.metrics[m], 1)
+        return sketches
+
+    def _add_campaigns(self, rows: np.ndarray, campaigns: np.ndarray):
+        register, rank = hll_positions(campaigns)
+        np.maximum.at(self.registers, (rows, register), rank)
+
+    def _count_values(self, metric: str, rows: np.ndarray, values: np.ndarray, sign: int):
+        flat = np.asarray(rows, dtype=np.int64) * _N_BUCKETS + value_buckets(values)
+        counts = np.bincount(flat, minlength=self.histograms[metric].size)
+        self.histograms[metric] += sign * counts.reshape(self.histograms[metric].shape)
+
+    def _covering(self, first_month: int, last_month: int) -> "MonthlySketches":
+        """A copy whose month range also covers [first_month, last_month]."""
+        n = len(self.registers)
+        first = min(first_month, self.first_month) if n else first_month
+        last = max(last_month, self.first_month + n - 1) if n else last_month
+        grown = MonthlySketches.empty(first, last - first + 1)
+        at = self.first_month - first
+        grown.registers[at:at + n] = self.registers
+        for m in METRIC_COLUMNS:
+            grown.histograms[m][at:at + n] = self.histograms[m]
+        return grown
+
+    def apply(self, changes: tuple) -> "MonthlySketches":
+        """New sketches after `FactStore.upsert` (copy-on-write).
+
+        New rows add their campaign and values; replaced rows swap their old
+        values for the new ones in the histograms.
+        """
+        date_ord, campaign, deltas, values, inserted = changes
+        if not len(date_ord):
+            return self
+        months = month_number(date_ord)
+        sketches = self._covering(int(months.min()), int(months.max()))
+        rows = months - sketches.first_month
+
+        sketches._add_campaigns(rows[inserted], campaign[inserted])
+        replaced = ~inserted
+        for m in METRIC_COLUMNS:
+            sketches._count_values(m, rows, values[m], 1)
+            previous = values[m][replaced] - deltas[m][replaced]
+            sketches._count_values(m, rows[replaced], previous, -1)
+        return sketches
+
+    def _month_rows(self, start_ord: int, end_ord: int) -> slice:
+        lo = int(month_number(start_ord)) - self.first_month
+        hi = int(month_number(end_ord)) - self.first_month + 1
+        return slice(max(lo, 0), max(min(hi, len(self.registers)), 0))
+
+    @staticmethod
+    def covered_range(start_ord: int, end_ord: int) -> tuple:
+        """(first, last) ordinal date of the whole months a range is answered from."""
+        return month_bounds(month_number(start_ord))[0], month_bounds(month_number(end_ord))[1]
+
+    def distinct_campaigns(self, start_ord: int, end_ord: int) -> int:
+        """Estimated number of campaigns with data in the months overlapping the range."""
+        window = self._month_rows(start_ord, end_ord)
+        if window.stop <= window.start:
+            return 0
+        return round(hll_estimate(self.registers[window].max(axis=0)))
+
+    def quantiles(self, metric: str, start_ord: int, end_ord: int, quantiles: Sequence[float]) -> list:
+        """Daily `metric` values at the given quantiles over the months overlapping the range."""
+        window = self._month_rows(start_ord, end_ord)
+        return histogram_quantiles(self.histograms[metric][window].sum(axis=0), quantiles)
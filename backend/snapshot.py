@@ -0,0 +1,306 @@
+"""
+Memory-mapped Data Snapshot
+
+Persists accounts, campaigns, the columnar fact store (with its campaign
+index) and the rollup cubes to a directory of `.npy` files plus small JSON
+documents. Workers load the arrays with `mmap_mode="r"`, so startup does not
+regenerate or re-sort anything and multiple uvicorn workers share the same
+pages through the OS page cache instead of each holding a private copy.
+
+Each save writes a new `<id>/` subdirectory and then atomically replaces
+the `CURRENT` file naming it, so there is always a complete snapshot to
+load; older subdirectories are removed afterwards. (A directory with the
+files at the top level, from before this layout, still loads.) Writers in
+different processes serialize on `<dir>.lock` (`acquire_writer_lock`).
+
+Layout of `<id>/`:
+    manifest.json      format version, id, row count, cube list
+    entities.json      fact-store campaign ids
+    accounts.jsonl     one account record per line
+    campaigns.jsonl    one campaign record per line (read and compacted
+                       line by line, so the dicts never all exist at once)
+    facts/*.npy        date_ord, campaign, metrics, campaign index arrays
+    cubes/<t>_<e>/*.npy  bucket, entity, order_key, metrics per rollup cube
+    sketches/*.npy     monthly HyperLogLog registers and metric histograms
+
+The mock generator's dates are relative to the day it runs, so a snapshot
+of generated data that ingest never wrote to (fact store version 0) is only
+used on the day it was created; on a later day it is ignored and rebuilt.
+Snapshots with ingested rows are always used.
+
+Run `python snapshot.py` to (re)build the snapshot from the mock generator.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import logging
+from datetime import date, datetime
+from typing import IO, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+
+from fact_store import FactStore, METRIC_COLUMNS
+from rollups import RollupCube, RollupSet
+from sketches import MonthlySketches
+from entities import account_records, campaign_records
+
+logger = logging.getLogger("AI_AGENT")
+
+SNAPSHOT_FORMAT = 2
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_snapshot")
+
+
+def snapshot_dir() -> Optional[str]:
+    """Snapshot location from ADS_SNAPSHOT_DIR; set it to an empty string to disable."""
+    value = os.getenv("ADS_SNAPSHOT_DIR")
+    if value is None:
+        return DEFAULT_SNAPSHOT_DIR
+    return value or None
+
+
+class SnapshotDB:
+    """Compact entity lists, e.g. restored from a snapshot (stands in for `get_db()`).
+
+    Daily metrics are not materialized as `daily_data`; they live only in
+    the (memory-mapped) fact store.
+    """
+
+    def __init__(self, accounts: list, campaigns: list):
+        self.accounts = accounts
+        self.campaigns = campaigns
+
+
+class Snapshot:
+    """Everything the data tools need at startup; `id` is the save it came from."""
+
+    def __init__(self, db, fact_store: FactStore, rollups: RollupSet, id: str = ""):
+        self.db = db
+        self.fact_store = fact_store
+        self.rollups = rollups
+        self.id = id
+
+
+def acquire_writer_lock(path: str) -> Optional[IO]:
+    """Exclusive lock on `<path>.lock` without waiting.
+
+    Returns the open lock file (the lock is held until it is closed, or the
+    process exits), or None if another process holds it.
+    """
+    lock = open(f"{path}.lock", "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+
+def current_snapshot_id(path: str) -> Optional[str]:
+    """Id of the snapshot a load would read now ("" for the old flat layout); None if there is none."""
+    try:
+        with open(os.path.join(path, "CURRENT"), encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return "" if os.path.exists(os.path.join(path, "manifest.json")) else None
+
+
+def _save_arrays(directory: str, arrays: dict):
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array))
+
+
+def _load_arrays(directory: str, names) -> dict:
+    return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in names}
+
+
+def _save_records(path: str, records: list):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record.to_record(), ensure_ascii=False))
+            f.write("\n")
+
+
+def _read_records(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def save_snapshot(path: str, db, fact_store: FactStore, rollups: RollupSet) -> str:
+    """Write a new snapshot into `path` and make it current; returns its id.
+
+    Hold `acquire_writer_lock(path)` while calling this.
+    """
+    snapshot_id = uuid.uuid4().hex[:12]
+    tmp_path = os.path.join(path, snapshot_id)
+    os.makedirs(tmp_path)
+
+    _save_arrays(os.path.join(tmp_path, "facts"), {
+        "date_ord": fact_store.date_ord,
+        "campaign": fact_store.campaign,
+        "by_campaign": fact_store.by_campaign,
+        "campaign_offsets": fact_store.campaign_offsets,
+        "campaign_dates": fact_store.campaign_dates,
+        "campaign_account": rollups.campaign_account,
+        **{f"metric_{m}": fact_store.metrics[m] for m in METRIC_COLUMNS},
+    })
+    for (time_grain, entity_grain), cube in rollups.cubes.items():
+        _save_arrays(os.path.join(tmp_path, "cubes", f"{time_grain}_{entity_grain}"), {
+            "bucket": cube.bucket,
+            "entity": cube.entity,
+            "order_key": cube.order_key,
+            **{f"metric_{m}": cube.metrics[m] for m in METRIC_COLUMNS},
+        })
+    sketches = rollups.sketches
+    _save_arrays(os.path.join(tmp_path, "sketches"), {
+        "registers": sketches.registers,
+        **{f"metric_{m}": sketches.histograms[m] for m in METRIC_COLUMNS},
+    })
+
+    _save_records(os.path.join(tmp_path, "accounts.jsonl"), db.accounts)
+    _save_records(os.path.join(tmp_path, "campaigns.jsonl"), db.campaigns)
+    with open(os.path.join(tmp_path, "entities.json"), "w", encoding="utf-8") as f:
+        json.dump({"campaign_ids": fact_store.campaign_ids}, f, ensure_ascii=False)
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": SNAPSHOT_FORMAT,
+            "id": snapshot_id,
+            "rows": len(fact_store),
+            "version": fact_store.version,
+            "cubes": [list(key) for key in rollups.cubes],
+            "sketch_first_month": sketches.first_month,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }, f)
+
+    pointer = os.path.join(path, f"CURRENT.tmp-{os.getpid()}")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(snapshot_id)
+    os.replace(pointer, os.path.join(path, "CURRENT"))
+
+    # Earlier saves (and old flat-layout files); mapped pages stay valid for
+    # processes still using them, and on Windows files still open are kept
+    for name in os.listdir(path):
+        if name not in (snapshot_id, "CURRENT") and not name.startswith("CURRENT.tmp"):
+            target = os.path.join(path, name)
+            if os.path.isdir(target):
+                shutil.rmtree(target, ignore_errors=True)
+            else:
+                try:
+                    os.remove(target)
+                except OSError:
+                    pass
+    logger.info(f"💾 Data snapshot {snapshot_id} written to {path} ({len(fact_store)} rows)")
+    return snapshot_id
+
+
+def _generated_on_earlier_day(manifest: dict) -> bool:
+    """Whether a snapshot holds only generated data from before today (see the module docstring)."""
+    if manifest.get("version", 0):
+        return False
+    created = manifest.get("created", "")
+    return created[:10] < date.today().isoformat()
+
+
+def load_snapshot(path: str) -> Optional[Snapshot]:
+    """Memory-map the current snapshot of a directory; returns None if missing, incompatible or stale."""
+    for _ in range(2):
+        snapshot_id = current_snapshot_id(path)
+        if snapshot_id is None:
+            return None
+        snapshot = _load_snapshot_files(path, os.path.join(path, snapshot_id) if snapshot_id else path)
+        # Retry once if a save replaced the snapshot while it was being read
+        if snapshot is not None or current_snapshot_id(path) == snapshot_id:
+            return snapshot
+    return None
+
+
+def _load_snapshot_files(path: str, directory: str) -> Optional[Snapshot]:
+    manifest_path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            logger.warning(f"⚠️ Ignoring snapshot {path}: format {manifest.get('format')} != {SNAPSHOT_FORMAT}")
+            return None
+        if _generated_on_earlier_day(manifest):
+            logger.info(f"🔄 Ignoring snapshot {path}: generated data from {manifest.get('created', 'an unknown day')}")
+            return None
+        with open(os.path.join(directory, "entities.json"), encoding="utf-8") as f:
+            entities = json.load(f)
+
+        metric_names = [f"metric_{m}" for m in METRIC_COLUMNS]
+        facts = _load_arrays(os.path.join(directory, "facts"), [
+            "date_ord", "campaign", "by_campaign", "campaign_offsets", "campaign_dates",
+            "campaign_account", *metric_names,
+        ])
+        fact_store = FactStore(
+            facts["date_ord"],
+            facts["campaign"],
+            {m: facts[f"metric_{m}"] for m in METRIC_COLUMNS},
+            entities["campaign_ids"],
+            campaign_index=(facts["by_campaign"], facts["campaign_offsets"], facts["campaign_dates"]),
+        )
+        fact_store.version = manifest.get("version", 0)
+
+        cubes = {}
+        for time_grain, entity_grain in manifest["cubes"]:
+            arrays = _load_arrays(
+                os.path.join(directory, "cubes", f"{time_grain}_{entity_grain}"),
+                ["bucket", "entity", "order_key", *metric_names],
+            )
+            cubes[(time_grain, entity_grain)] = RollupCube(
+                time_grain, entity_grain, arrays["bucket"], arrays["entity"],
+                {m: arrays[f"metric_{m}"] for m in METRIC_COLUMNS}, arrays["order_key"],
+            )
+        sketches = None
+        if "sketch_first_month" in manifest:
+            arrays = _load_arrays(os.path.join(directory, "sketches"), ["registers", *metric_names])
+            sketches = MonthlySketches(
+                manifest["sketch_first_month"], arrays["registers"],
+                {m: arrays[f"metric_{m}"] for m in METRIC_COLUMNS},
+            )
+        rollups = RollupSet(fact_store, facts["campaign_account"], cubes, sketches)
+        db = SnapshotDB(
+            account_records(_read_records(os.path.join(directory, "accounts.jsonl"))),
+            campaign_records(_read_records(os.path.join(directory, "campaigns.jsonl"))),
+        )
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"⚠️ Could not load snapshot {path}: {e}")
+        return None
+
+    logger.info(f"📦 Data snapshot memory-mapped from {path} ({manifest['rows']} rows)")
+    return Snapshot(db, fact_store, rollups, manifest.get("id", ""))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from mock_data_generator import get_db
+    from dimensions import get_dimensions
+
+    target = snapshot_dir() or DEFAULT_SNAPSHOT_DIR
+    os.makedirs(target, exist_ok=True)
+    writer_lock = acquire_writer_lock(target)  # held until exit
+    if writer_lock is None:
+        raise SystemExit(f"{target} is locked by another process (a server that ingested data?)")
+    source_db = get_db()
+    entity_db = SnapshotDB(account_records(source_db.accounts), campaign_records(source_db.campaigns))
+    store = FactStore.from_records(source_db.daily_data, entity_db.campaigns)
+    cube_set = RollupSet.build(store, get_dimensions(entity_db, store.campaign_ids).campaign_account)
+    save_snapshot(target, entity_db, store, cube_set)
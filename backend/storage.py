@@ -0,0 +1,439 @@
+"""
+Pluggable Storage for Ads Data
+
+The data tools read accounts, campaigns and aggregated daily metrics through
+an `AdsStorage`. Two implementations are provided:
+
+- `InMemoryStorage`: the columnar fact store and rollup cubes (optionally
+  memory-mapped from a snapshot).
+- `SQLStorage`: an embedded SQL file (SQLite from the standard library, or
+  DuckDB when installed). Date/campaign filters and the group-by are pushed
+  down as SQL, so only per-group totals are loaded into Python and history
+  does not have to fit in RAM.
+
+Select a backend with ADS_STORAGE:
+    memory                  (default)
+    sqlite:/path/ads.db
+    duckdb:/path/ads.duckdb
+The SQL file is built from the mock generator on first start.
+"""
+
+import os
+import csv
+import json
+import logging
+import tempfile
+import threading
+from typing import Optional
+
+import numpy as np
+
+from fact_store import FactStore, METRIC_COLUMNS
+from rollups import RollupSet, bucket_start
+from aggregation import GroupedMetrics, aggregate, merge_partials
+from partitions import map_partitions, month_partitions, should_partition
+from sampling import APPROX_SAMPLE_ROWS, sample_aggregate
+from sketches import MonthlySketches
+from entities import account_records, campaign_records
+
+logger = logging.getLogger("AI_AGENT")
+
+SQL_FORMAT = 1
+
+_INSERT_BATCH = 50_000
+
+
+class AdsStorage:
+    """Interface shared by the storage backends.
+
+    Attributes:
+        accounts: `entities.Account` records
+        campaigns: `entities.Campaign` records
+        campaign_ids: campaign id per fact-store campaign code
+        version: data version, bumped whenever the stored facts change
+    """
+
+    accounts: list
+    campaigns: list
+    campaign_ids: list
+    version: int = 0
+
+    def upsert(self, date_ord: np.ndarray, campaign: np.ndarray, metrics: dict,
+               campaign_ids: Optional[list] = None, campaign_account: Optional[np.ndarray] = None,
+               accounts: Optional[list] = None, campaigns: Optional[list] = None) -> tuple:
+        """Insert or replace daily rows keyed on (date_ord, campaign code).
+
+        Keys must be unique within the batch. When the batch brings new
+        campaigns or entity records, `campaign_ids` and `campaign_account`
+        give the full code space (new codes only ever get appended) and
+        `accounts` / `campaigns` the full record lists. Readers are not
+        blocked: they keep the data they started with until the new version
+        is swapped in. Returns (inserted, updated) row counts.
+        """
+        raise NotImplementedError
+
+    def aggregate(self, start_ord: int, end_ord: int, campaign_codes: Optional[np.ndarray] = None,
+                  time_grain: Optional[str] = None, entity_grain: Optional[str] = None) -> GroupedMetrics:
+        """Metric totals for dates in [start_ord, end_ord] and the given campaigns.
+
+        Groups by the start of the `time_grain` bucket ("day", "week",
+        "month" or None) and then by the `entity_grain` code ("account",
+        "campaign" or None); account codes follow
+        `DimensionTables.campaign_account`. Each group's `first` is the
+        smallest (date_ord * len(campaign_ids) + campaign) in it.
+        """
+        raise NotImplementedError
+
+    def aggregate_approx(self, start_ord: int, end_ord: int, campaign_codes: Optional[np.ndarray] = None,
+                         time_grain: Optional[str] = None, entity_grain: Optional[str] = None,
+                         budget: int = APPROX_SAMPLE_ROWS) -> tuple:
+        """Like `aggregate`, but may estimate the totals from about `budget` sampled rows.
+
+        Returns (GroupedMetrics, SampleInfo), or (exact totals, None) when the
+        exact scan is no more expensive or the backend cannot sample.
+        """
+        return self.aggregate(start_ord, end_ord, campaign_codes, time_grain, entity_grain), None
+
+    @property
+    def sketches(self) -> Optional[MonthlySketches]:
+        """Monthly distinct-campaign and metric-distribution sketches, if the backend keeps them."""
+        return None
+
+
+class InMemoryStorage(AdsStorage):
+    """Columnar fact store plus rollup cubes held in (or mapped into) memory.
+
+    Upserts build a new fact store and patch the affected rollup cells
+    copy-on-write, then swap them in; queries already running keep using the
+    previous version.
+    """
+
+    def __init__(self, db, rollups: RollupSet):
+        self.accounts = db.accounts
+        self.campaigns = db.campaigns
+        # The rollups reference their fact store; swapping this one attribute
+        # publishes a new data version atomically
+        self.rollups = rollups
+        self._write_lock = threading.Lock()
+
+    @property
+    def fact_store(self) -> FactStore:
+        return self.rollups.store
+
+    @property
+    def campaign_ids(self) -> list:
+        return self.rollups.store.campaign_ids
+
+    @property
+    def version(self) -> int:
+        return self.rollups.store.version
+
+    def upsert(self, date_ord, campaign, metrics, campaign_ids=None, campaign_account=None,
+               accounts=None, campaigns=None):
+        with self._write_lock:
+            rollups = self.rollups
+            store, changes, inserted = rollups.store.upsert(date_ord, campaign, metrics, campaign_ids=campaign_ids)
+            if campaign_account is None:
+                campaign_account = rollups.campaign_account
+            new_rollups = rollups.apply(store, changes, np.asarray(campaign_account, dtype=np.int64))
+            if accounts is not None:
+                self.accounts = accounts
+            if campaigns is not None:
+                self.campaigns = campaigns
+            self.rollups = new_rollups
+        return inserted, len(changes[0]) - inserted
+
+    def replace(self, db, rollups: RollupSet):
+        """Swap in other data (e.g. a snapshot another process wrote) as the next version."""
+        with self._write_lock:
+            rollups.store.version = max(rollups.store.version, self.version) + 1
+            self.accounts = db.accounts
+            self.campaigns = db.campaigns
+            self.rollups = rollups
+
+    def aggregate(self, start_ord, end_ord, campaign_codes=None, time_grain=None, entity_grain=None):
+        rollups = self.rollups
+        planned = rollups.scan_cost(start_ord, end_ord, campaign_codes, time_grain=time_grain,
+                                    entity_grain=entity_grain or "account")
+        if not should_partition(planned, start_ord, end_ord):
+            return self._aggregate_range(rollups, start_ord, end_ord, campaign_codes, time_grain, entity_grain)
+        # Big scans: aggregate month partitions concurrently, then merge the partial sums.
+        # Day and month buckets never straddle a partition, so those parts just concatenate.
+        return merge_partials(map_partitions(
+            lambda lo, hi: self._aggregate_range(rollups, lo, hi, campaign_codes, time_grain, entity_grain),
+            month_partitions(start_ord, end_ord),
+        ), disjoint=time_grain in ("day", "month"))
+
+    def aggregate_approx(self, start_ord, end_ord, campaign_codes=None, time_grain=None, entity_grain=None,
+                         budget=APPROX_SAMPLE_ROWS):
+        rollups = self.rollups
+        planned = rollups.scan_cost(start_ord, end_ord, campaign_codes, time_grain=time_grain,
+                                    entity_grain=entity_grain or "account")
+        if planned <= budget:
+            # Cubes already answer this in about `budget` reads
+            return self.aggregate(start_ord, end_ord, campaign_codes, time_grain, entity_grain), None
+        return sample_aggregate(rollups, start_ord, end_ord, campaign_codes, time_grain, entity_grain, budget)
+
+    @property
+    def sketches(self) -> MonthlySketches:
+        return self.rollups.sketches
+
+    @staticmethod
+    def _aggregate_range(rollups: RollupSet, start_ord, end_ord, campaign_codes, time_grain, entity_grain):
+        # Whole weeks/months come from the rollup cubes, partial edges from daily facts
+        fragments = rollups.scan(start_ord, end_ord, campaign_codes, time_grain=time_grain,
+                                 entity_grain=entity_grain or "account")
+
+        keys = []
+        if time_grain:
+            keys.append(np.concatenate([bucket_start(f.date_ord, time_grain) for f in fragments]))
+        if entity_grain == "campaign":
+            keys.append(np.concatenate([f.campaign for f in fragments]))
+        elif entity_grain == "account":
+            keys.append(np.concatenate([
+                rollups.campaign_account[f.campaign] if f.campaign is not None else f.account
+                for f in fragments
+            ]))
+        return aggregate(
+            keys,
+            {m: np.concatenate([f.metrics[m] for f in fragments]) for m in METRIC_COLUMNS},
+            order_key=np.concatenate([f.order_key for f in fragments]),
+        )
+
+
+def _insert_rows(cur, scheme: str, table: str, columns: list):
+    """Bulk-insert parallel column arrays into `table`.
+
+    DuckDB's executemany runs one statement per row, so rows are loaded
+    through a temporary CSV file with COPY instead.
+    """
+    rows = zip(*(np.asarray(c).tolist() for c in columns))
+    if scheme != "duckdb":
+        cur.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(columns))})", rows)
+        return
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            csv.writer(f).writerows(rows)
+        cur.execute(f"COPY {table} FROM '{path}' (HEADER false)")
+    finally:
+        os.remove(path)
+
+
+def _connect(url: str):
+    """Open an embedded database from a "sqlite:<path>" or "duckdb:<path>" url."""
+    scheme, _, path = url.partition(":")
+    if scheme == "sqlite":
+        import sqlite3
+        return sqlite3.connect(path, check_same_thread=False)
+    if scheme == "duckdb":
+        try:
+            import duckdb
+        except ImportError:
+            raise RuntimeError("ADS_STORAGE=duckdb:... requires the duckdb package (pip install duckdb)")
+        return duckdb.connect(path)
+    raise ValueError(f"Unknown storage backend: {url}")
+
+
+class SQLStorage(AdsStorage):
+    """Daily metrics in an embedded SQL file, queried with pushed-down filters and GROUP BY.
+
+    Tables:
+        meta            key/value (format, version, metric types)
+        accounts        account records as JSON, in order
+        campaigns       campaign records as JSON, in order
+        campaign_codes  code -> campaign id and account code
+        daily_metrics   date_ord, month_ord, campaign code, base metrics
+    """
+
+    _TIME_BUCKETS = {
+        "day": "f.date_ord",
+        "week": "f.date_ord - (f.date_ord - 1) % 7",
+        "month": "f.month_ord",
+    }
+    _ENTITIES = {
+        "campaign": "f.campaign",
+        "account": "c.account_code",
+    }
+
+    def __init__(self, url: str):
+        self.url = url
+        self._conn = _connect(url)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        cur = self._cursor()
+        meta = dict(cur.execute("SELECT key, value FROM meta").fetchall())
+        if int(meta.get("format", 0)) != SQL_FORMAT:
+            raise ValueError(f"{url}: storage format {meta.get('format')} != {SQL_FORMAT}")
+        self.version = int(meta.get("version", 0))
+        self.metric_dtypes = json.loads(meta["metric_dtypes"])
+
+        def column(sql):
+            return [value for (value,) in cur.execute(sql).fetchall()]
+
+        def records(table):
+            return (json.loads(r) for r in column(f"SELECT record FROM {table} ORDER BY position"))
+
+        self.accounts = account_records(records("accounts"))
+        self.campaigns = campaign_records(records("campaigns"))
+        self.campaign_ids = column("SELECT campaign_id FROM campaign_codes ORDER BY code")
+        rows = cur.execute("SELECT COUNT(*) FROM daily_metrics").fetchone()[0]
+        logger.info(f"🗄️ Opened {url} ({rows} rows)")
+
+    def _cursor(self):
+        # sqlite3 and duckdb cursors must not be shared between threads
+        cur = getattr(self._local, "cursor", None)
+        if cur is None:
+            cur = self._local.cursor = self._conn.cursor()
+        return cur
+
+    @classmethod
+    def build(cls, url: str, db, fact_store: FactStore, campaign_account: np.ndarray) -> "SQLStorage":
+        """Write accounts, campaigns and the fact store into a fresh database file."""
+        scheme, _, path = url.partition(":")
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = _connect(f"{scheme}:{tmp_path}")
+        cur = conn.cursor()
+        if scheme == "sqlite":
+            # Readers keep querying while an upsert writes
+            cur.execute("PRAGMA journal_mode=WAL")
+
+        metric_types = {
+            m: "BIGINT" if np.issubdtype(fact_store.metrics[m].dtype, np.integer) else "DOUBLE"
+            for m in METRIC_COLUMNS
+        }
+        cur.execute("CREATE TABLE meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+        cur.execute("CREATE TABLE accounts (position INTEGER PRIMARY KEY, record VARCHAR)")
+        cur.execute("CREATE TABLE campaigns (position INTEGER PRIMARY KEY, record VARCHAR)")
+        cur.execute("CREATE TABLE campaign_codes (code INTEGER PRIMARY KEY, campaign_id VARCHAR, account_code INTEGER)")
+        cur.execute(
+            "CREATE TABLE daily_metrics (date_ord INTEGER, month_ord INTEGER, campaign INTEGER, "
+            + ", ".join(f"{m} {metric_types[m]}" for m in METRIC_COLUMNS) + ")"
+        )
+
+        cur.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("format", str(SQL_FORMAT)),
+            ("version", str(fact_store.version)),
+            ("metric_dtypes", json.dumps({m: fact_store.metrics[m].dtype.name for m in METRIC_COLUMNS})),
+        ])
+        cur.executemany("INSERT INTO accounts VALUES (?, ?)",
+                        [(i, json.dumps(a.to_record(), ensure_ascii=False)) for i, a in enumerate(db.accounts)])
+        cur.executemany("INSERT INTO campaigns VALUES (?, ?)",
+                        [(i, json.dumps(c.to_record(), ensure_ascii=False)) for i, c in enumerate(db.campaigns)])
+        cur.executemany("INSERT INTO campaign_codes VALUES (?, ?, ?)",
+                        list(zip(range(len(fact_store.campaign_ids)), fact_store.campaign_ids,
+                                 campaign_account.tolist())))
+
+        for start in range(0, len(fact_store), _INSERT_BATCH):
+            chunk = slice(start, start + _INSERT_BATCH)
+            date_ord = fact_store.date_ord[chunk]
+            columns = [date_ord, bucket_start(date_ord, "month"), fact_store.campaign[chunk]]
+            columns += [fact_store.metrics[m][chunk] for m in METRIC_COLUMNS]
+            _insert_rows(cur, scheme, "daily_metrics", columns)
+
+        cur.execute("CREATE INDEX daily_metrics_date ON daily_metrics (date_ord, campaign)")
+        cur.execute("CREATE INDEX daily_metrics_campaign ON daily_metrics (campaign, date_ord)")
+        conn.commit()
+        conn.close()
+
+        os.replace(tmp_path, path)
+        logger.info(f"💾 Wrote {len(fact_store)} rows to {url}")
+        return cls(url)
+
+    def upsert(self, date_ord, campaign, metrics, campaign_ids=None, campaign_account=None,
+               accounts=None, campaigns=None):
+        date_ord = np.asarray(date_ord, dtype=np.int64)
+        columns = [date_ord, bucket_start(date_ord, "month"), np.asarray(campaign, dtype=np.int64)]
+        for m in METRIC_COLUMNS:
+            values = np.asarray(metrics[m])
+            if np.issubdtype(np.dtype(self.metric_dtypes[m]), np.integer):
+                values = np.round(values)
+            columns.append(values.astype(self.metric_dtypes[m]))
+
+        with self._write_lock:
+            # A separate connection, so readers only ever see committed versions
+            conn = _connect(self.url)
+            try:
+                cur = conn.cursor()
+                if campaign_ids is not None or campaign_account is not None:
+                    # Entity tables are small; rewrite them rather than diffing
+                    ids = campaign_ids if campaign_ids is not None else self.campaign_ids
+                    cur.execute("DELETE FROM campaign_codes")
+                    cur.executemany("INSERT INTO campaign_codes VALUES (?, ?, ?)", list(zip(
+                        range(len(ids)), ids, np.asarray(campaign_account).tolist()
+                    )))
+                for table, records in (("accounts", accounts), ("campaigns", campaigns)):
+                    if records is not None:
+                        cur.execute(f"DELETE FROM {table}")
+                        cur.executemany(f"INSERT INTO {table} VALUES (?, ?)",
+                                        [(i, json.dumps(r.to_record(), ensure_ascii=False)) for i, r in enumerate(records)])
+
+                cur.execute("CREATE TEMP TABLE batch AS SELECT * FROM daily_metrics LIMIT 0")
+                _insert_rows(cur, self.url.partition(":")[0], "batch", columns)
+                updated = cur.execute(
+                    "SELECT COUNT(*) FROM daily_metrics f JOIN batch b "
+                    "ON f.date_ord = b.date_ord AND f.campaign = b.campaign"
+                ).fetchone()[0]
+                cur.execute(
+                    "DELETE FROM daily_metrics WHERE (date_ord, campaign) IN "
+                    "(SELECT date_ord, campaign FROM batch)"
+                )
+                cur.execute("INSERT INTO daily_metrics SELECT * FROM batch")
+                cur.execute("UPDATE meta SET value = ? WHERE key = 'version'", (str(self.version + 1),))
+                conn.commit()
+            finally:
+                conn.close()
+
+            if accounts is not None:
+                self.accounts = accounts
+            if campaigns is not None:
+                self.campaigns = campaigns
+            if campaign_ids is not None:
+                self.campaign_ids = list(campaign_ids)
+            self.version += 1
+        return len(date_ord) - updated, updated
+
+    def aggregate(self, start_ord, end_ord, campaign_codes=None, time_grain=None, entity_grain=None):
+        group_exprs = []
+        if time_grain:
+            group_exprs.append(self._TIME_BUCKETS[time_grain])
+        if entity_grain:
+            group_exprs.append(self._ENTITIES[entity_grain])
+
+        sql = (
+            "SELECT " + "".join(f"{e}, " for e in group_exprs)
+            + ", ".join(f"SUM(f.{m})" for m in METRIC_COLUMNS)
+            + f", MIN(f.date_ord * {len(self.campaign_ids)} + f.campaign)"
+            + " FROM daily_metrics f"
+        )
+        if entity_grain == "account":
+            sql += " JOIN campaign_codes c ON c.code = f.campaign"
+        sql += " WHERE f.date_ord BETWEEN ? AND ?"
+        if campaign_codes is not None and len(campaign_codes) < len(self.campaign_ids):
+            # Codes are integers from the dimension tables, safe to inline
+            codes = ",".join(str(int(c)) for c in campaign_codes)
+            sql += f" AND f.campaign IN ({codes})" if codes else " AND 1 = 0"
+        if group_exprs:
+            positions = ", ".join(str(i + 1) for i in range(len(group_exprs)))
+            sql += f" GROUP BY {positions} ORDER BY {positions}"
+
+        rows = self._cursor().execute(sql, (int(start_ord), int(end_ord))).fetchall()
+        if not group_exprs and rows and rows[0][-1] is None:
+            rows = []
+        columns = list(zip(*rows)) if rows else [()] * (len(group_exprs) + len(METRIC_COLUMNS) + 1)
+
+        n_keys = len(group_exprs)
+        keys = [np.asarray(columns[i], dtype=np.int64) for i in range(n_keys)]
+        totals = {
+            m: np.asarray(columns[n_keys + i], dtype=self.metric_dtypes[m])
+            for i, m in enumerate(METRIC_COLUMNS)
+        }
+        return GroupedMetrics(keys, totals, np.asarray(columns[-1], dtype=np.int64))
+
+
+def storage_url() -> str:
+    """Backend selected by ADS_STORAGE ("memory", "sqlite:<path>" or "duckdb:<path>")."""
+    return os.getenv("ADS_STORAGE", "memory")
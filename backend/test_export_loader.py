@@ -0,0 +1,72 @@
+"""
+Export loads of ad-level files: repeated campaign/day rows add up in any order.
+
+Run from backend/: python -m pytest -q test_export_loader.py
+(needs the mock data generator that data_tools builds its store from)
+"""
+
+import csv
+import os
+import random
+
+import numpy as np
+import pytest
+
+pytest.importorskip("mock_data_generator")
+os.environ["ADS_SNAPSHOT_DIR"] = ""  # never touch the real snapshot
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import data_tools  # noqa: E402
+from fact_store import METRIC_COLUMNS, ordinal_to_date  # noqa: E402
+
+
+def _ad_level_rows(prefix: str, n_rows: int, seed: int) -> list:
+    """Rows for 40 new campaigns over 30 days, several per campaign and day, shuffled."""
+    rng = random.Random(seed)
+    first_day = data_tools.date_to_ordinal("2026-01-01")
+    rows = [
+        {
+            "date": ordinal_to_date(first_day + rng.randrange(30)),
+            "campaignId": f"{prefix}_{rng.randrange(40)}",
+            "clicks": rng.randrange(100),
+            "impressions": rng.randrange(5000),
+            "cost": rng.randrange(1_000_000),
+            "conversions": rng.randrange(5),
+            "revenue": rng.randrange(3_000_000),
+        }
+        for _ in range(n_rows)
+    ]
+    rng.shuffle(rows)
+    return rows
+
+
+def _write_csv(path, rows: list):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["date", "campaignId", *METRIC_COLUMNS])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _stored_totals(prefix: str) -> dict:
+    store = data_tools.storage.rollups.store
+    codes = [i for i, cid in enumerate(store.campaign_ids) if cid.startswith(f"{prefix}_")]
+    rows = np.isin(store.campaign, codes)
+    return {m: int(store.metrics[m][rows].sum()) for m in METRIC_COLUMNS}
+
+
+@pytest.mark.parametrize("chunk_rows", [333, 5000])
+def test_shuffled_export_sums_repeated_pairs(tmp_path, chunk_rows):
+    if not isinstance(data_tools.storage, data_tools.InMemoryStorage):
+        pytest.skip("reads the in-memory fact store")
+    prefix = f"shuffled{chunk_rows}"
+    rows = _ad_level_rows(prefix, 5000, seed=chunk_rows)
+    path = tmp_path / "ads.csv"
+    _write_csv(path, rows)
+
+    report = data_tools.load_export(str(path), chunk_rows=chunk_rows)
+
+    pairs = {(r["date"], r["campaignId"]) for r in rows}
+    assert _stored_totals(prefix) == {m: sum(r[m] for r in rows) for m in METRIC_COLUMNS}
+    assert report.rows_written == report.inserted == len(pairs)
+    assert report.rows_combined == len(rows) - len(pairs)
+    assert report.rows_written + report.rows_combined == report.rows_read
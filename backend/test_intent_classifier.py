@@ -0,0 +1,51 @@
+"""
+Routing regressions of the local intent tiers (no Gemini calls).
+
+Run from backend/: python -m pytest -q test_intent_classifier.py
+"""
+
+import os
+
+import pytest
+
+os.environ.setdefault("GOOGLE_API_KEY", "test")  # the module builds a Gemini client on import
+
+from intent_classifier import (  # noqa: E402
+    INTENT_COMPARISON,
+    LOCAL_INTENT_THRESHOLD,
+    classify_local,
+)
+
+
+@pytest.mark.parametrize("query", [
+    "tuần này",
+    "tháng trước",
+    "báo cáo tuần này",
+    "campaign nào tốt nhất",
+])
+def test_plain_requests_are_not_local_comparisons(query):
+    result = classify_local(query)
+    assert result["intent"] != INTENT_COMPARISON
+    assert result["confidence"] < LOCAL_INTENT_THRESHOLD
+
+
+@pytest.mark.parametrize("query", [
+    "chi phí crypto",
+    "doanh thu forex tháng này",
+    "clicks gaming",
+])
+def test_niche_filters_go_to_gemini(query):
+    # Only Gemini extracts the keyword filter; a local answer would show unfiltered totals
+    assert classify_local(query)["confidence"] < LOCAL_INTENT_THRESHOLD
+
+
+@pytest.mark.parametrize("query, compare_time_range", [
+    ("So sánh tháng 9 và 10", None),
+    ("tuần này so với tuần trước", "last week"),
+    ("Tuần này vs tuần trước", "last week"),
+])
+def test_explicit_comparisons_stay_local(query, compare_time_range):
+    result = classify_local(query)
+    assert result["intent"] == INTENT_COMPARISON
+    assert result["confidence"] >= LOCAL_INTENT_THRESHOLD
+    assert result["entities"].get("compare_time_range") == compare_time_range
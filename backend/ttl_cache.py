@@ -0,0 +1,141 @@
+"""
+LRU + TTL Cache with Hit/Miss Counters
+
+A small thread-safe cache used for query results and intent
+classifications. Entries expire after a fixed time-to-live, the least
+recently used entry is evicted when the cache is full, and the whole cache
+is dropped when the version it was filled against (data version, prompt
+digest) changes. A cache of JSON-serializable keys and values can be saved
+to and reloaded from a file, so it survives restarts.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self, version: Optional[Hashable]):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+
+    def get(self, key: Hashable, version: Optional[Hashable] = None, default: Any = None) -> Any:
+        """Return the cached value for `key`, or `default` on a miss.
+
+        If `version` differs from the version the cache was filled against,
+        every entry is dropped first.
+        """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, version: Optional[Hashable] = None):
+        """Store `value`, evicting the least recently used entry if full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self, path: str):
+        """Write the live entries to a JSON file (atomically replaced).
+
+        Keys must be strings or tuples of JSON scalars, values JSON-serializable.
+        """
+        with self._lock:
+            now_monotonic, now = time.monotonic(), time.time()
+            entries = [
+                [list(key) if isinstance(key, tuple) else key, now + (expires_at - now_monotonic), value]
+                for key, (expires_at, value) in self._entries.items()
+                if expires_at > now_monotonic
+            ]
+            version = self.version
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "entries": entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str, version: Optional[Hashable] = None) -> int:
+        """Add the unexpired entries saved by `save` for `version`; returns how many.
+
+        A missing or unreadable file, or one saved for another version, loads nothing.
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if saved.get("version") != version:
+            return 0
+        now_monotonic, now = time.monotonic(), time.time()
+        loaded = 0
+        with self._lock:
+            self._check_version(version)
+            # Saved least recently used first, so inserting in order keeps the LRU order
+            for key, expires_at, value in saved.get("entries", []):
+                if expires_at > now and self.maxsize > 0:
+                    key = tuple(key) if isinstance(key, list) else key
+                    self._entries[key] = (now_monotonic + (expires_at - now), value)
+                    self._entries.move_to_end(key)
+                    loaded += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return loaded
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Counters for sizing the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -101,7 +101,7 @@ const ChatMessage = ({ message, onSearch, onReplayDemo, onStartResearch }) => {
     if (type === 'thinking' || type === 'loading') {
         return (
             <div className="w-full my-10 px-4 md:px-0">
-                <ThinkingIndicator />
+                <ThinkingIndicator label={message.status} />
             </div>
         );
     }
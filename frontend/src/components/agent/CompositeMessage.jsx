@@ -1,8 +1,55 @@
-import React from 'react';
+import React, { useState } from 'react';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 import ChartMessage from './ChartMessage';
 import ResultsTable from '../ResultsTable';
+import { fetchNextListPage } from '../../services/chatService';
+
+/**
+ * PaginatedTable - Table section that loads further pages on demand
+ * using the cursor sent with the first page.
+ */
+const PaginatedTable = ({ content, pagination }) => {
+    const [rows, setRows] = useState(content);
+    const [cursor, setCursor] = useState(pagination?.nextCursor || null);
+    const [loading, setLoading] = useState(false);
+    const [error, setError] = useState(null);
+
+    const loadMore = async () => {
+        setLoading(true);
+        setError(null);
+        try {
+            const page = await fetchNextListPage(cursor);
+            setRows(prev => [...prev, ...page.rows]);
+            setCursor(page.nextCursor);
+        } catch (e) {
+            console.error('[CompositeMessage] Next page error:', e);
+            setError('Không thể tải thêm dữ liệu. Vui lòng thử lại.');
+        } finally {
+            setLoading(false);
+        }
+    };
+
+    return (
+        <>
+            <ResultsTable data={rows} />
+            {cursor && (
+                <div className="flex flex-col items-center gap-2 mt-4">
+                    <button
+                        className="px-4 py-2 text-sm border border-[var(--border-color)] text-[var(--text-secondary)] rounded-full
+                                   hover:text-[var(--text-primary)] hover:border-[var(--text-primary)] transition-all duration-300
+                                   disabled:opacity-50"
+                        onClick={loadMore}
+                        disabled={loading}
+                    >
+                        {loading ? 'Đang tải...' : `Xem thêm (${rows.length}/${pagination.total})`}
+                    </button>
+                    {error && <span className="text-sm text-red-400">{error}</span>}
+                </div>
+            )}
+        </>
+    );
+};
 
 /**
  * CompositeMessage - Renders composite AI Agent responses
@@ -64,7 +111,9 @@ const CompositeMessage = ({ content, context }) => {
             case 'table':
                 return (
                     <div key={index} className="w-full my-6 fade-in-up">
-                        <ResultsTable data={section.content} />
+                        {section.pagination
+                            ? <PaginatedTable content={section.content} pagination={section.pagination} />
+                            : <ResultsTable data={section.content} />}
                     </div>
                 );
 
@@ -83,6 +132,11 @@ const CompositeMessage = ({ content, context }) => {
                                     <div className="text-2xl font-serif text-[var(--text-primary)]">
                                         {formatMetricValue(key, value)}
                                     </div>
+                                    {typeof section.content?.deltas?.[key] === 'number' && (
+                                        <div className={`text-xs mt-1 ${section.content.deltas[key] >= 0 ? 'text-green-400' : 'text-red-400'}`}>
+                                            {section.content.deltas[key] >= 0 ? '+' : ''}{section.content.deltas[key].toFixed(2)}% so với kỳ trước
+                                        </div>
+                                    )}
                                 </div>
                             ))}
                         </div>
@@ -3,9 +3,11 @@ import { motion } from 'framer-motion';
 
 /**
  * ThinkingIndicator — Animated "AI is thinking" bubble with pulsing dots.
- * Used in the onboarding mimic flow between user questions and AI answers.
+ * Used in the onboarding mimic flow between user questions and AI answers,
+ * and while the agent works on a reply.
+ * @param {string} [label] - What the agent is doing (the stream's routing status)
  */
-const ThinkingIndicator = () => {
+const ThinkingIndicator = ({ label }) => {
     return (
         <motion.div
             className="flex w-full justify-start my-4 px-4 md:px-0"
@@ -35,7 +37,7 @@ const ThinkingIndicator = () => {
                         ))}
                     </div>
                     <span className="text-sm font-light italic tracking-wider text-[var(--text-secondary)] opacity-70">
-                        Adecos đang suy nghĩ…
+                        {label || 'Adecos đang suy nghĩ…'}
                     </span>
                 </div>
             </div>
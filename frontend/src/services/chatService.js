@@ -1,10 +1,60 @@
 import { API_BASE_URL } from '../config';
 
 /**
- * Sends a chat request to the AI agent API and handles the streaming response.
+ * Applies one event of the agent stream to the assistant message being built.
+ *
+ * Events (one JSON object per line):
+ * - status:  { event, intent, message } once the intent is routed
+ * - section: { event, index, section } a chart/table/insight section whose data is ready
+ * - token:   { event, section, text } a narrative chunk for sections[section]
+ *            (section is null when the answer is plain text)
+ * - done:    { event, message } the complete response
+ * @param {Object} message - The message so far
+ * @param {Object} event - The parsed event
+ * @returns {Object} The updated message (a new object)
+ */
+const applyAgentEvent = (message, event) => {
+    switch (event.event) {
+        case 'status':
+            return { ...message, status: event.message };
+
+        case 'section':
+        case 'token': {
+            if (event.event === 'token' && event.section === null) {
+                const text = message.type === 'text' ? message.content : '';
+                return { ...message, type: 'text', content: text + event.text };
+            }
+            const index = event.event === 'section' ? event.index : event.section;
+            const sections = message.type === 'composite' ? [...message.content.sections] : [];
+            // Narratives come before the data sections but arrive after them
+            while (sections.length <= index) {
+                sections.push({ type: 'narrative', content: '' });
+            }
+            sections[index] = event.event === 'section'
+                ? event.section
+                : { ...sections[index], content: sections[index].content + event.text };
+            return { ...message, type: 'composite', content: { ...message.content, sections } };
+        }
+
+        case 'done':
+            return {
+                role: 'assistant',
+                type: event.message.type,
+                content: event.message.content,
+                context: event.message.context || null
+            };
+
+        default:
+            return message;
+    }
+};
+
+/**
+ * Sends a chat request to the AI agent API and renders the NDJSON event
+ * stream as it arrives (see applyAgentEvent).
  * @param {Array} history - The conversation history
  * @param {Function} onLoading - Callback for initial loading state
- * @param {Function} onUpdate - Callback for each chunk/update
+ * @param {Function} onUpdate - Callback with the message after each event
  * @param {Function} onError - Callback for errors
  * @param {Function} onComplete - Callback when stream completes
  */
@@ -25,35 +75,40 @@ export const streamChatResponse = async (history, onLoading, onUpdate, onError,
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
         let buffer = '';
+        let message = { role: 'assistant', type: 'thinking', content: '' };
+        let done = false;
+
+        const handleLine = (line) => {
+            if (!line.trim()) return;
+            let event;
+            try {
+                event = JSON.parse(line);
+            } catch (e) {
+                console.error('[ChatService] Parse error:', e);
+                return;
+            }
+            // A bare response object (no event key) is a complete message
+            if (!event.event && event.type && event.content !== undefined) {
+                event = { event: 'done', message: event };
+            }
+            message = applyAgentEvent(message, event);
+            done = done || event.event === 'done';
+            onUpdate(message);
+        };
 
         while (true) {
-            const { value, done } = await reader.read();
-            if (done) break;
+            const { value, done: streamDone } = await reader.read();
+            if (streamDone) break;
 
-            const chunk = decoder.decode(value, { stream: true });
-            buffer += chunk;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.forEach(handleLine);
         }
+        handleLine(buffer + decoder.decode());
 
-        // Parse complete JSON after stream ends
-        // Note: The original implementation accumulated the buffer and parsed at the end.
-        // If the backend sends chunks of valid JSON objects, we might need a different approach,
-        // but based on the original code, it expects one final JSON object.
-        try {
-            const parsed = JSON.parse(buffer);
-
-            if (parsed.type && parsed.content !== undefined) {
-                const aiMessage = {
-                    role: 'assistant',
-                    type: parsed.type,
-                    content: parsed.content,
-                    context: parsed.context || null
-                };
-                onUpdate(aiMessage);
-            } else {
-                throw new Error('Invalid response format');
-            }
-        } catch (e) {
-            console.error('[ChatService] Parse error:', e);
+        // Keep whatever arrived; only an empty answer is an error
+        if (!done && message.type === 'thinking') {
             onError('Đã nhận phản hồi nhưng không thể hiển thị. Vui lòng thử lại.');
         }
 
@@ -64,3 +119,26 @@ export const streamChatResponse = async (history, onLoading, onUpdate, onError,
         if (onComplete) onComplete();
     }
 };
+
+/**
+ * Fetches the next page of a paginated table section.
+ * @param {string} cursor - The `pagination.nextCursor` sent with the previous page
+ * @returns {Promise<{rows: Array, nextCursor: (string|null)}>}
+ */
+export const fetchNextListPage = async (cursor) => {
+    const response = await fetch(`${API_BASE_URL}/api/list/next`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ cursor }),
+    });
+
+    if (!response.ok) {
+        throw new Error(`Network response was not ok: ${response.status}`);
+    }
+
+    const page = await response.json();
+    return {
+        rows: page.campaigns || page.accounts || [],
+        nextCursor: page.nextCursor || null,
+    };
+};